@@ -1,7 +1,8 @@
+import base64
 import uuid
 from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
-from app.settings import SEARCH_SERVICE_ENDPOINT_SECRET_NAME, SEARCH_API_KEY_SECRET_NAME, SEARCH_INDEX_NAME, KEY_VAULT_CORE_URI
+from app.settings import SEARCH_SERVICE_ENDPOINT_SECRET_NAME, SEARCH_API_KEY_SECRET_NAME, SEARCH_INDEX_NAME, KEY_VAULT_CORE_URI, EXAMPLES_UPLOAD_BATCH_SIZE, EXAMPLES_PAGE_SIZE
 from app.utils.nb_logger import NBLogger
 from app.services.secret_service import SecretService
 from azure.search.documents.indexes import SearchIndexClient
@@ -15,6 +16,22 @@ class AzureSearchServiceError(Exception):
         self.code = code
 
 
+def _odata_str(value: str) -> str:
+    # Escape a string literal for an OData filter expression
+    return str(value).replace("'", "''")
+
+
+def _encode_continuation_token(doc_id: str) -> str:
+    return base64.urlsafe_b64encode(doc_id.encode("utf-8")).decode("ascii")
+
+
+def _decode_continuation_token(token: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+    except Exception:
+        raise AzureSearchServiceError("Invalid continuation token", code=1009)
+
+
 class AzureSearchService:
     searchClients = {}
 
@@ -194,14 +211,31 @@ class AzureSearchService:
             raise AzureSearchServiceError("Error updating example", code=1004)
 
     @staticmethod
-    def list_examples_in_search(databaseName) -> list:
+    def list_examples_in_search(databaseName, page_size: int = EXAMPLES_PAGE_SIZE, continuation_token: str = None) -> dict:
+        """
+        Return one page of examples (without the embedding fields), ordered by doc_id.
+        The returned continuation_token is None on the last page, otherwise it has to be
+        passed back to get the next page.
+        """
         if not databaseName:
             raise AzureSearchServiceError("databaseName can't be empty", code=1007)
 
+        page_size = max(1, min(int(page_size), 1000))
+        last_doc_id = _decode_continuation_token(continuation_token) if continuation_token else None
+
         try:
             search_client = AzureSearchService.getClient(databaseName)
-            filter_query = f"database eq '{databaseName}'"
-            results = search_client.search(search_text="*",filter=filter_query, select=["question", "sql","doc_id","database"], top=100)
+            filter_query = f"database eq '{_odata_str(databaseName)}'"
+            if last_doc_id is not None:
+                filter_query += f" and doc_id gt '{_odata_str(last_doc_id)}'"
+            # One extra document is requested to know if there is a next page
+            results = search_client.search(
+                search_text="*",
+                filter=filter_query,
+                select=["doc_id", "database", "question", "sql"],
+                order_by=["doc_id asc"],
+                top=page_size + 1
+            )
             examples = []
             for result in results:
                 examples.append({
@@ -210,7 +244,52 @@ class AzureSearchService:
                     "sql": result["sql"],
                     "database": result["database"]
                 })
-            return examples
         except Exception as e:
             logger.error(f"Error listing examples from Azure Cognitive Search: {e}")
             raise AzureSearchServiceError("Error listing examples", code=1005)
+
+        next_token = None
+        if len(examples) > page_size:
+            examples = examples[:page_size]
+            next_token = _encode_continuation_token(examples[-1]["doc_id"])
+        return {"examples": examples, "continuation_token": next_token}
+
+    @staticmethod
+    def upload_examples_batch(databaseName, documents: list) -> list:
+        """
+        Upload (or merge, when the doc_id already exists) the given example documents,
+        in chunks of at most EXAMPLES_UPLOAD_BATCH_SIZE documents per call.
+        A failing chunk does not stop the others: the doc_id of every document
+        that was not indexed is returned so the caller can retry them.
+        """
+        if not databaseName:
+            raise AzureSearchServiceError("databaseName can't be empty", code=1007)
+
+        search_client = AzureSearchService.getClient(databaseName)
+        failed = []
+        for start in range(0, len(documents), EXAMPLES_UPLOAD_BATCH_SIZE):
+            chunk = documents[start:start + EXAMPLES_UPLOAD_BATCH_SIZE]
+            try:
+                results = search_client.merge_or_upload_documents(documents=chunk)
+                for result in results:
+                    if not result.succeeded:
+                        logger.warning(f"Example {result.key} not indexed ({result.status_code}): {result.error_message}")
+                        failed.append(result.key)
+            except Exception as e:
+                logger.error(f"Error uploading examples batch to Azure Cognitive Search: {e}")
+                failed.extend(document["doc_id"] for document in chunk)
+        return failed
+
+    @staticmethod
+    def iter_examples(databaseName, page_size: int = 1000):
+        """
+        Lazily iterate over all the examples of a database, one page at a time,
+        so the examples are never all loaded in memory.
+        """
+        continuation_token = None
+        while True:
+            page = AzureSearchService.list_examples_in_search(databaseName, page_size, continuation_token)
+            yield from page["examples"]
+            continuation_token = page["continuation_token"]
+            if not continuation_token:
+                return
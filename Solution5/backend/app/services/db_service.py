@@ -10,13 +10,16 @@ from app.settings import (
     USERNAME_SECRET_NAME, 
     PASSWORD_SECRET_NAME, 
     DATABASE_NAME, 
-    ODBC_DRIVER
+    ODBC_DRIVER,
+    SQL_DRY_RUN_MODE
 )
 from app.utils.nb_logger import NBLogger  
 from app.utils.connection_string_parser import ConnectionStringParser
 from sqlalchemy import create_engine
 from app.services.schema_engine import SchemaEngine
 from app.services.m_schema import MSchema
+from app.services.tracing import tracer
+import time
 import traceback
 import xml.etree.ElementTree as ET
 
@@ -28,6 +31,13 @@ from typing import (
 logger = NBLogger().Log()
 
 
+def _db_attributes(operation: str, database: str, sql_query: str = None) -> dict:
+    # Attributes of the database spans (OpenTelemetry database semantic conventions)
+    attributes = {"db.system": "mssql", "db.operation": operation, "db.name": database}
+    if sql_query is not None:
+        attributes["db.statement"] = sql_query[:2000]
+    return attributes
+
 
 class DBHelper:
     # Class variable to cache the connection string across calls.
@@ -41,13 +51,15 @@ class DBHelper:
         Executes a SQL query against Azure SQL Database and returns the results.
         """
         try:
-            connection_string = DBHelper.getConnectionString(database)
-            conn = pyodbc.connect(connection_string)
-            cursor = conn.cursor()
-            cursor.execute(sql_query, params)
-            columns = [column[0] for column in cursor.description]
-            rows = cursor.fetchall()
-            conn.close()
+            with tracer.span("db executeSQLQuery", "client", _db_attributes("query", database, sql_query)) as span:
+                connection_string = DBHelper.getConnectionString(database)
+                conn = pyodbc.connect(connection_string)
+                cursor = conn.cursor()
+                cursor.execute(sql_query, params)
+                columns = [column[0] for column in cursor.description]
+                rows = cursor.fetchall()
+                conn.close()
+                span.set_attribute("db.rows", len(rows))
             # TODO: check if it is the right approach. Things changed otherwise  TypeError: unhashable type: 'list' when checking token size.
             #results = [dict(zip([str(col) for col in columns], row)) for row in rows]
             results = [
@@ -70,12 +82,13 @@ class DBHelper:
         Executes a SQL query against Azure SQL Database and returns the results.
         """
         try:
-            connection_string = DBHelper.getConnectionString(database)
-            conn = pyodbc.connect(connection_string)
-            cursor = conn.cursor()
-            cursor.execute(sql_query, params)
-            retval = cursor.fetchone()
-            conn.close()
+            with tracer.span("db executeAndFetchOne", "client", _db_attributes("query", database, sql_query)):
+                connection_string = DBHelper.getConnectionString(database)
+                conn = pyodbc.connect(connection_string)
+                cursor = conn.cursor()
+                cursor.execute(sql_query, params)
+                retval = cursor.fetchone()
+                conn.close()
             return retval
 
         except Exception as e:
@@ -83,6 +96,60 @@ class DBHelper:
             raise
 
 
+    @staticmethod
+    def validateSQLQuery(database, sql_query, mode: str = SQL_DRY_RUN_MODE) -> dict:
+        """
+        Compiles a SQL query without executing it (dry run) and returns the columns of its first result set
+        and the compile error, if any. Modes: describe (sp_describe_first_result_set, names and types resolved),
+        noexec (SET NOEXEC ON, compiled only) and parseonly (SET PARSEONLY ON, syntax only).
+        The connection comes from the ODBC connection pool, so the check takes a few milliseconds.
+        Connection errors are raised.
+        """
+        start = time.perf_counter()
+        with tracer.span("db validateSQLQuery", "client", _db_attributes("validate", database, sql_query)) as span:
+            span.set_attribute("db.validation_mode", mode)
+            conn = pyodbc.connect(DBHelper.getConnectionString(database))
+            try:
+                cursor = conn.cursor()
+                columns, error = DBHelper._dry_run(cursor, sql_query, mode), None
+            except (pyodbc.ProgrammingError, pyodbc.DataError) as e:
+                columns, error = [], str(e)
+            finally:
+                conn.close()
+            span.set_attribute("db.valid", error is None)
+        if error:
+            logger.info(f"SQL query does not compile: {error}")
+        return {
+            "valid": error is None,
+            "columns": columns,
+            "error": error,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    @staticmethod
+    def _dry_run(cursor, sql_query, mode: str) -> list:
+        if mode == "describe":
+            try:
+                cursor.execute("EXEC sp_describe_first_result_set @tsql = ?", sql_query)
+            except pyodbc.ProgrammingError as e:
+                if "temp table" not in str(e):
+                    raise
+                # No metadata for the statements using temp tables: compile them only
+                return DBHelper._dry_run(cursor, sql_query, "noexec")
+            return [
+                {"name": row.name, "type": row.system_type_name, "nullable": bool(row.is_nullable)}
+                for row in cursor.fetchall() if not row.is_hidden
+            ]
+
+        option = "PARSEONLY" if mode == "parseonly" else "NOEXEC"
+        cursor.execute(f"SET {option} ON")
+        try:
+            cursor.execute(sql_query)
+        finally:
+            # The connection goes back to the pool
+            cursor.execute(f"SET {option} OFF")
+        return []
+
     @staticmethod
     def getConnectionString(database: str) -> str:
         """
@@ -147,15 +214,16 @@ class DBHelper:
         """
         try:
             if  database not in DBHelper._mschemas:
-                connection_string = DBHelper.getConnectionString(database)                                                
-                params = ConnectionStringParser.quote(connection_string)
-                logger.info(f"Database: {database}")
-                db_engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-                
-                logger.info(f"Engine created")
-                schema_engine = SchemaEngine(engine=db_engine, db_name=database)
-                 
-                DBHelper._mschemas[database] = schema_engine.mschema
+                with tracer.span("db get_mschema", "client", _db_attributes("schema", database)):
+                    connection_string = DBHelper.getConnectionString(database)                                                
+                    params = ConnectionStringParser.quote(connection_string)
+                    logger.info(f"Database: {database}")
+                    db_engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
+                    
+                    logger.info(f"Engine created")
+                    schema_engine = SchemaEngine(engine=db_engine, db_name=database)
+                     
+                    DBHelper._mschemas[database] = schema_engine.mschema
             
             mschema = DBHelper._mschemas[database]
             return mschema
@@ -247,8 +315,6 @@ class DBHelper:
     def test(database, sql_query, schema):
          # Get the XML execution plan from MSSQL
 
-        conn_str = DBHelper.getConnectionString(database)
-        conn = pyodbc.connect(conn_str)
         xml_plan = DBHelper.get_execution_plan_xml(database, sql_query)
 
         if xml_plan is None:
@@ -283,32 +349,56 @@ class DBHelper:
         Connects to SQL Server, sets SHOWPLAN_XML ON, executes the SQL query
         (without running it) and returns the execution plan as XML.
         """
-        conn_str = DBHelper.getConnectionString(database)
-        connection = pyodbc.connect(conn_str)
-        cursor = connection.cursor()
-
-        # Enable SHOWPLAN_XML (this tells SQL Server to return the plan without executing the query)
-        cursor.execute("SET SHOWPLAN_XML ON")
-        # Move to next result set if needed
-        cursor.nextset()
-
-        # Execute the query – note: it will not run the query, just return the plan
-        cursor.execute(sql_query)
-        row = cursor.fetchone()
-        if row:
-            logger.info(f"Execution plan XML: {row[0]}")
-            plan_xml = row[0]
-        else:
-            logger.info("Execution plan XML: None")
-            plan_xml = None
+        with tracer.span("db get_execution_plan_xml", "client", _db_attributes("plan", database, sql_query)):
+            conn_str = DBHelper.getConnectionString(database)
+            connection = pyodbc.connect(conn_str)
+            try:
+                cursor = connection.cursor()
 
-        # Turn off SHOWPLAN_XML
-        cursor.execute("SET SHOWPLAN_XML OFF")
-        cursor.nextset()
-        connection.close()
+                # Enable SHOWPLAN_XML (this tells SQL Server to return the plan without executing the query)
+                cursor.execute("SET SHOWPLAN_XML ON")
+                # Move to next result set if needed
+                cursor.nextset()
+
+                try:
+                    # Execute the query – note: it will not run the query, just return the plan
+                    cursor.execute(sql_query)
+                    row = cursor.fetchone()
+                finally:
+                    # Turn off SHOWPLAN_XML
+                    cursor.execute("SET SHOWPLAN_XML OFF")
+                    cursor.nextset()
+            finally:
+                connection.close()
+
+            if row:
+                logger.info(f"Execution plan XML: {row[0]}")
+                plan_xml = row[0]
+            else:
+                logger.info("Execution plan XML: None")
+                plan_xml = None
 
         return plan_xml
 
+    @staticmethod
+    def get_estimated_cost(database, sql_query) -> Optional[float]:
+        """
+        Estimated cost of the SQL query from its execution plan (not executed), None when the plan has no cost.
+        """
+        plan_xml = DBHelper.get_execution_plan_xml(database, sql_query)
+        return DBHelper.parse_plan_cost(plan_xml) if plan_xml else None
+
+    @staticmethod
+    def parse_plan_cost(xml_content: str) -> Optional[float]:
+        """
+        Estimated cost of the statements of an XML execution plan (StatementSubTreeCost, optimizer units).
+        """
+        root = ET.fromstring(xml_content)
+        ns = {"sql": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
+        costs = [float(statement.attrib["StatementSubTreeCost"]) for statement in root.findall(".//sql:StmtSimple", ns)
+                 if "StatementSubTreeCost" in statement.attrib]
+        return sum(costs) if costs else None
+
 
     def parse_showplan_xml(xml_content: str) -> list:
         """
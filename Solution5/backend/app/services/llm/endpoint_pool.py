@@ -0,0 +1,198 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI
+
+from app.settings import (
+    OPENAI_KEY_SECRET_NAME, OPENAI_ENDPOINT_SECRET_NAME, OPENAI_VERSION_SECRET_NAME, KEY_VAULT_CORE_URI,
+    OPENAI_TIMEOUT_SECONDS, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_ENDPOINTS, OPENAI_ENDPOINT_EJECT_SECONDS, OPENAI_ENDPOINT_MAX_EJECT_SECONDS, OPENAI_LATENCY_EWMA_ALPHA
+)
+from app.services.secret_service import SecretService
+from app.utils.nb_logger import NBLogger
+
+logger = NBLogger().Log()
+
+# Endpoints that served the calls made in the current context (see EndpointPool.track)
+_served_by: ContextVar = ContextVar("served_by", default=None)
+
+
+class Endpoint:
+    """
+    One Azure OpenAI resource, with its clients and health: latency EWMA and circuit state
+    (closed: in rotation, open: ejected until ejected_until, half-open: a single probe call allowed).
+    """
+
+    def __init__(self, name: str, endpoint: str, key: str, version: str, weight: float = 1.0):
+        self.name = name
+        self.endpoint = endpoint
+        self.key = key
+        self.version = version
+        self.weight = weight
+        self.client = AzureOpenAI(
+            api_key=key,
+            azure_endpoint=endpoint,
+            api_version=version,
+            timeout=OPENAI_TIMEOUT_SECONDS,
+            max_retries=0,  # retries are done by OpenAIService._create, on the next selected endpoint
+        )
+        self._async_client = None
+        self.latency = None  # EWMA of the response time, in seconds
+        self.state = "closed"
+        self.ejected_until = 0.0
+        self.eject_seconds = OPENAI_ENDPOINT_EJECT_SECONDS
+        self.calls = 0
+        self.failures = 0
+        self.ejections = 0
+
+    def get_async_client(self) -> AsyncAzureOpenAI:
+        # Created on first use, a single HTTP connection pool per endpoint
+        if self._async_client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=OPENAI_TIMEOUT_SECONDS,
+            )
+            self._async_client = AsyncAzureOpenAI(
+                api_key=self.key,
+                azure_endpoint=self.endpoint,
+                api_version=self.version,
+                timeout=OPENAI_TIMEOUT_SECONDS,
+                max_retries=0,
+                http_client=http_client,
+            )
+        return self._async_client
+
+
+def _load_endpoints() -> list:
+    version = SecretService.get_secret_value(KEY_VAULT_CORE_URI, OPENAI_VERSION_SECRET_NAME)
+    if not OPENAI_ENDPOINTS:
+        return [Endpoint(
+            "default",
+            SecretService.get_secret_value(KEY_VAULT_CORE_URI, OPENAI_ENDPOINT_SECRET_NAME),
+            SecretService.get_secret_value(KEY_VAULT_CORE_URI, OPENAI_KEY_SECRET_NAME),
+            version,
+        )]
+
+    endpoints = []
+    for config in json.loads(OPENAI_ENDPOINTS):
+        endpoints.append(Endpoint(
+            config["name"],
+            SecretService.get_secret_value(KEY_VAULT_CORE_URI, config["endpoint_secret_name"]),
+            SecretService.get_secret_value(KEY_VAULT_CORE_URI, config["key_secret_name"]),
+            version,
+            float(config.get("weight", 1)),
+        ))
+    return endpoints
+
+
+class EndpointPool:
+    """
+    Pick the Azure OpenAI resource serving each call: weighted random choice favouring the fastest endpoints
+    (weight / latency EWMA). Endpoints answering 429, 5xx or not reachable are ejected for a cool-down period,
+    doubled at each consecutive failure, then a single probe call decides whether they come back in rotation.
+    """
+
+    def __init__(self, endpoints: list):
+        self.endpoints = endpoints
+        self._lock = threading.Lock()
+
+    def select(self) -> Endpoint:
+        with self._lock:
+            now = time.monotonic()
+            available = []
+            for endpoint in self.endpoints:
+                if endpoint.state == "open" and now >= endpoint.ejected_until:
+                    # Cool-down expired: let one call probe the endpoint
+                    endpoint.state = "half-open"
+                    logger.info(f"OpenAI endpoint {endpoint.name} half-open, probing")
+                    return endpoint
+                if endpoint.state == "closed":
+                    available.append(endpoint)
+
+            if not available:
+                # Everything ejected (or being probed): use the endpoint coming back first rather than failing
+                return min(self.endpoints, key=lambda endpoint: endpoint.ejected_until)
+
+            # Unknown latency: assume the best one, so new endpoints get traffic
+            known = [endpoint.latency for endpoint in available if endpoint.latency]
+            default_latency = min(known) if known else 1.0
+            scores = [endpoint.weight / (endpoint.latency or default_latency) for endpoint in available]
+            return random.choices(available, weights=scores)[0]
+
+    def report_success(self, endpoint: Endpoint, latency: float):
+        with self._lock:
+            endpoint.calls += 1
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency = OPENAI_LATENCY_EWMA_ALPHA * latency + (1 - OPENAI_LATENCY_EWMA_ALPHA) * endpoint.latency
+            if endpoint.state != "closed":
+                logger.info(f"OpenAI endpoint {endpoint.name} recovered")
+            endpoint.state = "closed"
+            endpoint.eject_seconds = OPENAI_ENDPOINT_EJECT_SECONDS
+        served_by = _served_by.get()
+        if served_by is not None:
+            served_by.append(endpoint.name)
+
+    def report_failure(self, endpoint: Endpoint, error: Exception, retry_after: float = None):
+        with self._lock:
+            endpoint.calls += 1
+            endpoint.failures += 1
+            if endpoint.state == "half-open":
+                # The probe failed: eject for longer
+                endpoint.eject_seconds = min(endpoint.eject_seconds * 2, OPENAI_ENDPOINT_MAX_EJECT_SECONDS)
+            endpoint.state = "open"
+            endpoint.ejections += 1
+            endpoint.ejected_until = time.monotonic() + max(endpoint.eject_seconds, retry_after or 0)
+        logger.warning(f"OpenAI endpoint {endpoint.name} ejected for {endpoint.eject_seconds}s: {type(error).__name__}")
+
+    def release(self, endpoint: Endpoint):
+        # The call failed for a reason unrelated to the endpoint health (e.g. a bad request)
+        with self._lock:
+            endpoint.calls += 1
+            if endpoint.state == "half-open":
+                endpoint.state = "closed"
+
+    def has_available(self) -> bool:
+        # True when some endpoint is in rotation, so a failed call can be retried right away on another one
+        with self._lock:
+            now = time.monotonic()
+            return any(endpoint.state == "closed" or (endpoint.state == "open" and now >= endpoint.ejected_until)
+                       for endpoint in self.endpoints)
+
+    @contextmanager
+    def track(self):
+        """
+        Collect the names of the endpoints that served the calls made in this context.
+        """
+        served_by = []
+        token = _served_by.set(served_by)
+        try:
+            yield served_by
+        finally:
+            _served_by.reset(token)
+
+    def status(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "name": endpoint.name,
+                "state": endpoint.state,
+                "weight": endpoint.weight,
+                "latency": round(endpoint.latency, 3) if endpoint.latency else None,
+                "calls": endpoint.calls,
+                "failures": endpoint.failures,
+                "ejections": endpoint.ejections,
+                "ejected_for": round(max(endpoint.ejected_until - now, 0), 1) if endpoint.state == "open" else 0,
+            } for endpoint in self.endpoints]
+
+
+endpoint_pool = EndpointPool(_load_endpoints())
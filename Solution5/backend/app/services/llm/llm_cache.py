@@ -0,0 +1,159 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.settings import (
+    LLM_CACHE_ENABLED, LLM_CACHE_BACKEND, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_REDIS_PREFIX,
+    REDIS_COONECTION_STRING_SECRET_NAME, KEY_VAULT_CORE_URI
+)
+from app.services.secret_service import SecretService
+from app.utils.nb_logger import NBLogger
+
+try:
+    import redis  # optional
+except Exception:  # pragma: no cover
+    redis = None
+
+logger = NBLogger().Log()
+
+
+def cache_key(model: str, messages: list, temperature: float, max_tokens: int) -> str:
+    """
+    Stable key for a chat completion request.
+    """
+    blob = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class InMemoryLRUCache:
+    """
+    Thread safe in-memory cache with TTL and LRU eviction once max_entries is reached.
+    """
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._store: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._store.get(key)
+            if row is None:
+                return None
+            ts, value = row
+            if time.time() - ts > self.ttl:
+                self._store.pop(key, None)
+                return None
+            self._store.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._store[key] = (time.time(), value)
+            self._store.move_to_end(key)
+            while len(self._store) > self.max_entries:
+                self._store.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+
+
+class RedisCache:
+    """
+    Persistent cache shared between workers. Size is bounded by the TTL and the Redis maxmemory policy.
+    """
+    def __init__(self, url: str, ttl: int, prefix: str):
+        if redis is None:
+            raise RuntimeError("Install `redis` to use RedisCache.")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._c = redis.from_url(url, decode_responses=True)
+
+    def _k(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def get(self, key: str) -> Optional[str]:
+        return self._c.get(self._k(key))
+
+    def set(self, key: str, value: str):
+        self._c.set(self._k(key), value, ex=self.ttl)
+
+    def clear(self):
+        for key in self._c.scan_iter(match=self._k("*"), count=500):
+            self._c.delete(key)
+
+
+class LLMResponseCache:
+    """
+    Cache of LLM responses: an in-memory LRU in front of an optional persistent backend.
+    Hits and misses are counted per tag (the name of the tool calling the LLM).
+    """
+    def __init__(self, backend=None, ttl: int = LLM_CACHE_TTL_SECONDS, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.memory = InMemoryLRUCache(ttl, max_entries)
+        self.backend = backend
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _count(self, tag: str, field: str):
+        with self._lock:
+            metrics = self._metrics.setdefault(tag or "untagged", {"hits": 0, "misses": 0})
+            metrics[field] += 1
+
+    def get(self, key: str, tag: str = "") -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.backend is not None:
+            try:
+                value = self.backend.get(key)
+            except Exception as e:
+                logger.warning(f"LLM cache backend read failed: {e}")
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+        self._count(tag, "hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value)
+            except Exception as e:
+                logger.warning(f"LLM cache backend write failed: {e}")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            retval = {}
+            for tag, metrics in self._metrics.items():
+                total = metrics["hits"] + metrics["misses"]
+                retval[tag] = {**metrics, "hit_rate": round(metrics["hits"] / total, 3) if total else 0.0}
+            return retval
+
+    def clear(self):
+        self.memory.clear()
+        if self.backend is not None:
+            self.backend.clear()
+        with self._lock:
+            self._metrics.clear()
+
+
+def _create_cache() -> Optional[LLMResponseCache]:
+    if not LLM_CACHE_ENABLED:
+        return None
+    backend = None
+    if LLM_CACHE_BACKEND == "redis":
+        try:
+            url = SecretService.get_secret_value(KEY_VAULT_CORE_URI, REDIS_COONECTION_STRING_SECRET_NAME)
+            backend = RedisCache(url, ttl=LLM_CACHE_TTL_SECONDS, prefix=LLM_CACHE_REDIS_PREFIX)
+        except Exception as e:
+            logger.error(f"LLM cache: Redis backend not available, using memory only: {e}")
+    return LLMResponseCache(backend)
+
+
+llm_cache = _create_cache()
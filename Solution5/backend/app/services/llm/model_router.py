@@ -0,0 +1,95 @@
+import json
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.settings import COMPLETION_MODEL, FAST_COMPLETION_MODEL, USE_FAST_MODEL_ROUTING, MODEL_ROUTES
+from app.utils.nb_logger import NBLogger
+
+logger = NBLogger().Log()
+
+# Classification and extraction are served by the fast model, SQL generation keeps COMPLETION_MODEL
+_FAST_ROUTES = ["context_selector", "rewrite_question", "KeywordExtractor", "Answer Generator Agent"]
+
+# Routes of the request being processed (set by the agents and tools from the conversation state)
+_request_routes: ContextVar = ContextVar("model_routes", default=None)
+
+
+def _load_routes() -> dict:
+    routes = {}
+    if USE_FAST_MODEL_ROUTING:
+        routes.update({route: FAST_COMPLETION_MODEL for route in _FAST_ROUTES})
+    if MODEL_ROUTES:
+        try:
+            routes.update(json.loads(MODEL_ROUTES))
+        except ValueError as e:
+            logger.error(f"Invalid MODEL_ROUTES, expected a JSON object of route -> deployment: {e}")
+    return routes
+
+
+class ModelRouter:
+    """
+    Map tool names (or prompt template names) to the Azure OpenAI deployment serving them,
+    and keep latency and token usage per route.
+    """
+
+    def __init__(self, routes: dict = None, default: str = COMPLETION_MODEL):
+        self.routes = _load_routes() if routes is None else routes
+        self.default = default
+        # A request can only choose among the deployments already configured
+        self.deployments = {default, FAST_COMPLETION_MODEL, *self.routes.values()}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, *names: str) -> str:
+        """
+        Deployment of the first name with a route: request overrides first, then the configured routes.
+        """
+        overrides = _request_routes.get() or {}
+        for routes in (overrides, self.routes):
+            for name in names:
+                if name and name in routes:
+                    return routes[name]
+        return self.default
+
+    @contextmanager
+    def request_routes(self, routes: dict):
+        """
+        Use the given route -> deployment overrides in the calls made in this context.
+        """
+        allowed = {}
+        for name, deployment in (routes or {}).items():
+            if deployment in self.deployments:
+                allowed[name] = deployment
+            else:
+                logger.warning(f"Ignoring route {name}: deployment {deployment} is not configured.")
+        token = _request_routes.set(allowed)
+        try:
+            yield
+        finally:
+            _request_routes.reset(token)
+
+    def record(self, route: str, deployment: str, latency: float, usage=None):
+        with self._lock:
+            metrics = self._metrics.setdefault(f"{route or 'untagged'} -> {deployment}", {
+                "calls": 0, "total_latency": 0.0, "prompt_tokens": 0, "completion_tokens": 0
+            })
+            metrics["calls"] += 1
+            metrics["total_latency"] += latency
+            if usage is not None:
+                metrics["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                metrics["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                route: {
+                    **metrics,
+                    "total_latency": round(metrics["total_latency"], 3),
+                    "avg_latency": round(metrics["total_latency"] / metrics["calls"], 3),
+                }
+                for route, metrics in self._metrics.items()
+            }
+
+
+model_router = ModelRouter()
@@ -1,36 +1,258 @@
-
-from openai import AzureOpenAI
-from app.settings import OPENAI_KEY_SECRET_NAME,EMBEDDING_MODEL,COMPLETION_MODEL,OPENAI_ENDPOINT_SECRET_NAME, OPENAI_VERSION_SECRET_NAME, KEY_VAULT_CORE_URI
+import asyncio
+import time
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+from app.settings import EMBEDDING_MODEL, COMPLETION_MODEL, OPENAI_MAX_CONCURRENCY_PER_DEPLOYMENT
 from app.utils.nb_logger import NBLogger
-from app.services.secret_service import SecretService
+from app.services.llm.llm_cache import llm_cache, cache_key
+from app.services.llm.rate_limiter import rate_limiter, estimate_request_tokens, retry_after_seconds
+from app.services.llm.model_router import model_router
+from app.services.llm.endpoint_pool import endpoint_pool
+from app.services.tracing import tracer, INPUT_TOKENS, OUTPUT_TOKENS
+
+# Errors worth retrying: throttling, timeouts, network errors and 5xx
+_RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+def _llm_attributes(operation: str, model: str, messages, **attributes) -> dict:
+    # Attributes of the LLM call spans (OpenTelemetry GenAI semantic conventions, plus the prompt size)
+    if isinstance(messages, str):
+        prompt_chars = len(messages)
+    else:
+        prompt_chars = sum(len(str(message.get("content") or "")) if isinstance(message, dict) else len(str(message))
+                           for message in messages or [])
+    return {"gen_ai.operation.name": operation, "gen_ai.request.model": model, "llm.prompt_chars": prompt_chars, **attributes}
+
+
+def _usage_attributes(usage) -> dict:
+    if usage is None:
+        return {}
+    return {INPUT_TOKENS: getattr(usage, "prompt_tokens", None), OUTPUT_TOKENS: getattr(usage, "completion_tokens", None)}
+
 
 class OpenAIService:
     
     logger = NBLogger().Log()
-    openai_key = SecretService.get_secret_value(KEY_VAULT_CORE_URI, OPENAI_KEY_SECRET_NAME)
-    openai_endpoint = SecretService.get_secret_value(KEY_VAULT_CORE_URI, OPENAI_ENDPOINT_SECRET_NAME)
-    openai_version = SecretService.get_secret_value(KEY_VAULT_CORE_URI, OPENAI_VERSION_SECRET_NAME)
-    client = AzureOpenAI(
-        api_key=openai_key,
-        azure_endpoint=openai_endpoint,
-        api_version=openai_version,
-    )
+
+    # One semaphore per deployment, to limit the number of concurrent async calls sent to it
+    _semaphores = {}
+
+    @classmethod
+    def _get_semaphore(cls, model: str) -> asyncio.Semaphore:
+        if model not in cls._semaphores:
+            cls._semaphores[model] = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY_PER_DEPLOYMENT)
+        return cls._semaphores[model]
+
+    @classmethod
+    def _retry_delay(cls, endpoint, deployment: str, tokens: int, attempt: int, waited: float, error: Exception):
+        # Eject the endpoint, refund the tokens of the failed attempt and compute the wait before the next one (None: give up)
+        limiter_key = f"{endpoint.name}/{deployment}"
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        endpoint_pool.report_failure(endpoint, error, retry_after_seconds(headers))
+        rate_limiter.refund(limiter_key, tokens)
+        return rate_limiter.retry_delay(limiter_key, attempt, waited, error, failover=endpoint_pool.has_available())
+
+    @classmethod
+    def _create(cls, resource, deployment: str, tokens: int, **kwargs):
+        """
+        Call resource(client).create on the endpoint selected by the pool, through the rate limiter of the deployment,
+        retrying throttled and failed calls (on another endpoint when one is available).
+        """
+        attempt = 0
+        waited = 0.0
+        while True:
+            endpoint = endpoint_pool.select()
+            limiter_key = f"{endpoint.name}/{deployment}"
+            wait = rate_limiter.before_request(limiter_key, tokens)
+            if wait > 0:
+                time.sleep(wait)
+            start_time = time.time()
+            try:
+                raw = resource(endpoint.client).with_raw_response.create(model=deployment, **kwargs)
+            except _RETRYABLE_ERRORS as e:
+                delay = cls._retry_delay(endpoint, deployment, tokens, attempt, waited, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                waited += delay
+                attempt += 1
+                continue
+            except Exception:
+                endpoint_pool.release(endpoint)
+                raise
+            endpoint_pool.report_success(endpoint, time.time() - start_time)
+            rate_limiter.after_response(limiter_key, raw.headers)
+            tracer.set_attributes({"openai.endpoint": endpoint.name, "openai.attempts": attempt + 1, "openai.waited_seconds": round(waited, 3)})
+            cls.logger.debug(f"OpenAI {deployment} served by {endpoint.name}")
+            return raw.parse()
+
+    @classmethod
+    async def _acreate(cls, resource, deployment: str, tokens: int, **kwargs):
+        """Async version of _create, the concurrent calls to the deployment are limited by its semaphore."""
+        attempt = 0
+        waited = 0.0
+        while True:
+            endpoint = endpoint_pool.select()
+            limiter_key = f"{endpoint.name}/{deployment}"
+            wait = rate_limiter.before_request(limiter_key, tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            start_time = time.time()
+            try:
+                async with cls._get_semaphore(deployment):
+                    raw = await resource(endpoint.get_async_client()).with_raw_response.create(model=deployment, **kwargs)
+            except _RETRYABLE_ERRORS as e:
+                delay = cls._retry_delay(endpoint, deployment, tokens, attempt, waited, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                waited += delay
+                attempt += 1
+                continue
+            except Exception:
+                endpoint_pool.release(endpoint)
+                raise
+            endpoint_pool.report_success(endpoint, time.time() - start_time)
+            rate_limiter.after_response(limiter_key, raw.headers)
+            tracer.set_attributes({"openai.endpoint": endpoint.name, "openai.attempts": attempt + 1, "openai.waited_seconds": round(waited, 3)})
+            cls.logger.debug(f"OpenAI {deployment} served by {endpoint.name}")
+            return raw.parse()
 
     @classmethod
     def get_embedding(cls,text: str, model = EMBEDDING_MODEL) -> list:
         """Get the embedding vector for the given text using OpenAI."""
-        response = cls.client.embeddings.create(input=text, model=model)
+        with tracer.span("llm embeddings", "client", _llm_attributes("embeddings", model, text)) as span:
+            response = cls._create(lambda client: client.embeddings, model, estimate_request_tokens(text), input=text)
+            span.set_attributes(_usage_attributes(response.usage))
         embedding = response.data[0].embedding
         return embedding
 
     @classmethod
-    def chat(cls, messages: str, model = COMPLETION_MODEL, max_tokens=150, temperature= 0) -> str:
+    def get_embeddings(cls, texts: list, model = EMBEDDING_MODEL) -> list:
+        """Get the embedding vectors for a list of texts with a single OpenAI call, in the same order as the input."""
+        if not texts:
+            return []
+        with tracer.span("llm embeddings", "client", _llm_attributes("embeddings", model, texts, **{"llm.batch_size": len(texts)})) as span:
+            response = cls._create(lambda client: client.embeddings, model, sum(estimate_request_tokens(text) for text in texts), input=texts)
+            span.set_attributes(_usage_attributes(response.usage))
+        data = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in data]
+
+    @classmethod
+    def _use_cache(cls, temperature, cache) -> bool:
+        # Only deterministic calls are cached by default, otherwise the caller has to opt in
+        if llm_cache is None:
+            return False
+        return cache if cache is not None else temperature == 0
+
+    @classmethod
+    def chat(cls, messages: str, model = COMPLETION_MODEL, max_tokens=150, temperature= 0, cache: bool = None, cache_tag: str = "") -> str:
         """Generate a response using GPT-4 from the given prompt."""
-        response = cls.client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,  # Deterministic output
-        )
-        retval = response.choices[0].message.content.strip()
-        return retval
\ No newline at end of file
+        with tracer.span(f"llm chat {cache_tag or model}", "client",
+                         _llm_attributes("chat", model, messages, **{"gen_ai.request.max_tokens": max_tokens})) as span:
+            use_cache = cls._use_cache(temperature, cache)
+            if use_cache:
+                key = cache_key(model, messages, temperature, max_tokens)
+                cached = llm_cache.get(key, cache_tag)
+                span.set_attribute("llm.cache_hit", cached is not None)
+                if cached is not None:
+                    return cached
+
+            start_time = time.time()
+            response = cls._create(
+                lambda client: client.chat.completions, model, estimate_request_tokens(messages, max_tokens),
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,  # Deterministic output
+            )
+            model_router.record(cache_tag, model, time.time() - start_time, response.usage)
+            span.set_attributes(_usage_attributes(response.usage))
+            retval = response.choices[0].message.content.strip()
+            if use_cache:
+                llm_cache.set(key, retval)
+            return retval
+
+    @classmethod
+    def chat_stream(cls, messages: str, model = COMPLETION_MODEL, max_tokens=150, temperature= 0, route: str = ""):
+        """Generate a response from the given prompt, yielding the pieces of text as the model produces them."""
+        # Not made current: the generator is suspended between the pieces
+        span = tracer.start_span(f"llm chat {route or model}", "client",
+                                 _llm_attributes("chat", model, messages, **{"gen_ai.request.max_tokens": max_tokens, "llm.stream": True}))
+        start_time = time.time()
+        pieces = 0
+        try:
+            stream = cls._create(
+                lambda client: client.chat.completions, model, estimate_request_tokens(messages, max_tokens),
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    if pieces == 0:
+                        span.set_attribute("llm.time_to_first_token_ms", round((time.time() - start_time) * 1000, 1))
+                    pieces += 1
+                    yield chunk.choices[0].delta.content
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            span.set_attribute("llm.stream_pieces", pieces)
+            tracer.end_span(span)
+        model_router.record(route, model, time.time() - start_time)
+
+    @classmethod
+    async def aembed(cls, text: str, model = EMBEDDING_MODEL) -> list:
+        """Async version of get_embedding, it doesn't block the event loop while waiting for OpenAI."""
+        with tracer.span("llm embeddings", "client", _llm_attributes("embeddings", model, text)) as span:
+            response = await cls._acreate(lambda client: client.embeddings, model, estimate_request_tokens(text), input=text)
+            span.set_attributes(_usage_attributes(response.usage))
+        return response.data[0].embedding
+
+    @classmethod
+    async def achat(cls, messages: str, model = COMPLETION_MODEL, max_tokens=150, temperature= 0, cache: bool = None, cache_tag: str = "") -> str:
+        """Async version of chat, it doesn't block the event loop while waiting for OpenAI."""
+        with tracer.span(f"llm chat {cache_tag or model}", "client",
+                         _llm_attributes("chat", model, messages, **{"gen_ai.request.max_tokens": max_tokens})) as span:
+            use_cache = cls._use_cache(temperature, cache)
+            if use_cache:
+                key = cache_key(model, messages, temperature, max_tokens)
+                cached = llm_cache.get(key, cache_tag)
+                span.set_attribute("llm.cache_hit", cached is not None)
+                if cached is not None:
+                    return cached
+
+            start_time = time.time()
+            response = await cls._acreate(
+                lambda client: client.chat.completions, model, estimate_request_tokens(messages, max_tokens),
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+            model_router.record(cache_tag, model, time.time() - start_time, response.usage)
+            span.set_attributes(_usage_attributes(response.usage))
+            retval = response.choices[0].message.content.strip()
+            if use_cache:
+                llm_cache.set(key, retval)
+            return retval
+
+    @classmethod
+    def cache_metrics(cls) -> dict:
+        """Hits and misses of the LLM response cache, per tool."""
+        return llm_cache.metrics() if llm_cache is not None else {}
+
+    @classmethod
+    def rate_limit_metrics(cls) -> dict:
+        """Requests, throttled calls, retries and time spent waiting, per deployment."""
+        return rate_limiter.metrics()
+
+    @classmethod
+    def route_metrics(cls) -> dict:
+        """Calls, latency and tokens per route (tool or prompt) and deployment."""
+        return model_router.metrics()
+
+    @classmethod
+    def endpoint_status(cls) -> list:
+        """Health, latency and calls of the Azure OpenAI endpoints."""
+        return endpoint_pool.status()
+
@@ -1,19 +1,84 @@
 import os
 import logging
 import re
+import threading
+import time
+
+from app.settings import PROMPT_RELOAD_INTERVAL
+
+# Placeholders like {variable}
+_VARIABLE_PATTERN = re.compile(r'\{(\w+)\}')
 
 # You might define your own prompt classes or integrate with existing company libraries
 class CustomPrompt:
     def __init__(self, template: str, variables: list):
         self.template = template
         self.variables = variables
+        # Pre-split the template: even items are literal text, odd items are variable names
+        self._parts = _VARIABLE_PATTERN.split(template)
 
     def format(self, **kwargs):
-        prompt_text = self.template
-        for var in self.variables:
-            value = kwargs.get(var, f'{{{var}}}')
-            prompt_text = prompt_text.replace(f'{{{var}}}', str(value))
-        return prompt_text
+        # Single pass substitution: values are never scanned for other placeholders
+        parts = self._parts.copy()
+        for i in range(1, len(parts), 2):
+            var = parts[i]
+            parts[i] = str(kwargs[var]) if var in kwargs else f'{{{var}}}'
+        return "".join(parts)
+
+class PromptRegistry:
+    """
+    Process wide registry of the compiled templates, shared by every PromptManager.
+    Templates are read from disk once and reloaded only when their file modification time changes.
+    """
+    _prompts = {}  # template file -> (mtime, last check time, CustomPrompt)
+    _preloaded = set()
+    _lock = threading.Lock()
+
+    @classmethod
+    def _compile(cls, template_file: str) -> CustomPrompt:
+        with open(template_file, "r", encoding="utf-8") as file:
+            template = file.read()
+        return CustomPrompt(template, _VARIABLE_PATTERN.findall(template))
+
+    @classmethod
+    def preload(cls, templates_path: str):
+        # Compile all the templates under templates_path (sub folders included) once
+        if templates_path in cls._preloaded:
+            return
+        with cls._lock:
+            if templates_path in cls._preloaded:
+                return
+            count = 0
+            for root, _, files in os.walk(templates_path):
+                for file_name in files:
+                    if file_name.endswith(".tpl"):
+                        template_file = os.path.join(root, file_name)
+                        try:
+                            cls._prompts[template_file] = (os.path.getmtime(template_file), time.monotonic(), cls._compile(template_file))
+                            count += 1
+                        except Exception as e:
+                            logging.error(f"Error preloading template {template_file}: {e}")
+            cls._preloaded.add(templates_path)
+            logging.info(f"Preloaded {count} templates from {templates_path}")
+
+    @classmethod
+    def get(cls, template_file: str) -> CustomPrompt:
+        now = time.monotonic()
+        entry = cls._prompts.get(template_file)
+        if entry is not None and now - entry[1] < PROMPT_RELOAD_INTERVAL:
+            return entry[2]
+
+        # Not loaded yet or time to check the file for changes
+        mtime = os.path.getmtime(template_file)
+        with cls._lock:
+            entry = cls._prompts.get(template_file)
+            if entry is not None and entry[0] == mtime:
+                prompt = entry[2]
+            else:
+                prompt = cls._compile(template_file)
+                logging.info(f"Loaded template: {template_file}")
+            cls._prompts[template_file] = (mtime, now, prompt)
+            return prompt
 
 class PromptManager1:
     def __init__(self, templates_path: str = "prompts"):
@@ -54,16 +119,17 @@ class PromptManager1:
 class PromptManager:
     def __init__(self, templates_path: str = "prompts"):
         self.templates_path = templates_path
+        PromptRegistry.preload(templates_path)
 
-    def load_template(self, template_name: str, folder_path: str = None) -> str:
+    def _template_file(self, template_name: str, folder_path: str = None) -> str:
         templates_path = os.path.join(self.templates_path,folder_path) if folder_path else self.templates_path
         file_name = f"{template_name}.tpl"  # using a distinct naming pattern
-        template_file = os.path.join(templates_path, file_name)
+        return os.path.join(templates_path, file_name)
+
+    def load_template(self, template_name: str, folder_path: str = None) -> str:
+        template_file = self._template_file(template_name, folder_path)
         try:
-            with open(template_file, "r", encoding="utf-8") as file:
-                template = file.read()
-            logging.info(f"Loaded template: {template_name}")
-            return template
+            return PromptRegistry.get(template_file).template
         except FileNotFoundError:
             logging.error(f"Template not found: {template_file}")
             raise
@@ -73,20 +139,15 @@ class PromptManager:
     
     def extract_variables(self, template: str) -> list:
         # using a simple regex to find placeholders like {variable}
-        pattern = r'\{(\w+)\}'
-        return re.findall(pattern, template)
+        return _VARIABLE_PATTERN.findall(template)
 
     def create_prompt(self, template_name: str, folder_path: str = None) -> CustomPrompt:
         try:
-            template = self.load_template(template_name, folder_path)
-            variables = self.extract_variables(template)
-            return CustomPrompt(template, variables)
+            # Compiled prompts are shared and immutable: format() returns a new string
+            return PromptRegistry.get(self._template_file(template_name, folder_path))
         except FileNotFoundError:
             logging.error(f"Failed to create prompt: Template '{template_name}' not found.")
             raise
         except Exception as e:
             logging.error(f"Failed to create prompt for template '{template_name}': {e}")
             raise
-
-
-
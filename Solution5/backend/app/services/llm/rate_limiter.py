@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+
+from app.settings import (
+    OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE, OPENAI_MAX_RETRIES, OPENAI_RETRY_BUDGET_SECONDS,
+    OPENAI_BACKOFF_BASE_SECONDS, OPENAI_BACKOFF_MAX_SECONDS
+)
+from app.utils.nb_logger import NBLogger
+
+logger = NBLogger().Log()
+
+
+def estimate_request_tokens(messages, max_tokens: int = 0) -> int:
+    """
+    Rough number of tokens a request consumes from the quota (about 4 characters per token),
+    Azure OpenAI also reserves max_tokens for the completion.
+    """
+    if isinstance(messages, str):
+        chars = len(messages)
+    else:
+        chars = sum(len(str(message.get("content") or "")) for message in messages if isinstance(message, dict))
+    return chars // 4 + (max_tokens or 0)
+
+
+def _header_int(headers, name: str):
+    try:
+        value = headers.get(name) if headers is not None else None
+        return int(float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_seconds(headers):
+    """
+    Seconds to wait before retrying, as requested by the server (retry-after-ms or retry-after headers).
+    """
+    if headers is None:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return float(value) / 1000
+        value = headers.get("retry-after")
+        if value is not None:
+            return float(value)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class TokenBucket:
+    """
+    Client side limiter of one deployment: a bucket of requests and a bucket of tokens, both refilled
+    continuously over a minute. Their levels are corrected with the x-ratelimit-remaining-* headers
+    returned by Azure OpenAI, and emptied until the Retry-After time when a call is throttled.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_capacity = float(requests_per_minute)
+        self.tokens_capacity = float(tokens_per_minute)
+        self.requests = self.requests_capacity
+        self.tokens = self.tokens_capacity
+        self.blocked_until = 0.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.requests = min(self.requests_capacity, self.requests + elapsed * self.requests_capacity / 60)
+        self.tokens = min(self.tokens_capacity, self.tokens + elapsed * self.tokens_capacity / 60)
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Take a request and the tokens from the buckets, returns the seconds to wait before sending it.
+        The buckets can go in debt: the following callers will wait for the refill.
+        """
+        tokens = min(tokens, self.tokens_capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.requests -= 1
+            self.tokens -= tokens
+            wait = max(
+                self.blocked_until - now,
+                -self.requests * 60 / self.requests_capacity if self.requests < 0 else 0.0,
+                -self.tokens * 60 / self.tokens_capacity if self.tokens < 0 else 0.0,
+            )
+            return max(wait, 0.0)
+
+    def refund(self, tokens: int):
+        """Give back the tokens reserved by a request that failed without consuming them."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens_capacity, self.tokens + min(tokens, self.tokens_capacity))
+
+    def update_from_headers(self, headers):
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        with self._lock:
+            self._refill(time.monotonic())
+            # The server knows the quota used by the other instances too: never be more optimistic than it
+            if remaining_requests is not None:
+                self.requests = min(self.requests, float(remaining_requests))
+            if remaining_tokens is not None:
+                self.tokens = min(self.tokens, float(remaining_tokens))
+
+    def throttle(self, retry_after: float):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.requests = min(self.requests, 0.0)
+
+
+class RateLimiter:
+    """
+    Token buckets and retry policy of the Azure OpenAI deployments, with throttling metrics per deployment.
+    """
+
+    def __init__(self, requests_per_minute: int = OPENAI_REQUESTS_PER_MINUTE, tokens_per_minute: int = OPENAI_TOKENS_PER_MINUTE,
+                 max_retries: int = OPENAI_MAX_RETRIES, retry_budget: float = OPENAI_RETRY_BUDGET_SECONDS):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self._buckets = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, deployment: str) -> TokenBucket:
+        with self._lock:
+            if deployment not in self._buckets:
+                self._buckets[deployment] = TokenBucket(self.requests_per_minute, self.tokens_per_minute)
+            return self._buckets[deployment]
+
+    def count(self, deployment: str, field: str, value: float = 1):
+        with self._lock:
+            metrics = self._metrics.setdefault(deployment, {
+                "requests": 0, "throttled": 0, "retries": 0, "failures": 0, "limiter_waits": 0, "wait_seconds": 0.0
+            })
+            metrics[field] += value
+
+    def before_request(self, deployment: str, tokens: int) -> float:
+        """
+        Seconds to wait before sending a request of the given tokens to the deployment.
+        """
+        wait = self.bucket(deployment).reserve(tokens)
+        self.count(deployment, "requests")
+        if wait > 0:
+            self.count(deployment, "limiter_waits")
+            self.count(deployment, "wait_seconds", wait)
+        return wait
+
+    def refund(self, deployment: str, tokens: int):
+        """
+        Tokens reserved by before_request for an attempt that failed: the retry reserves them again.
+        """
+        self.bucket(deployment).refund(tokens)
+
+    def after_response(self, deployment: str, headers):
+        self.bucket(deployment).update_from_headers(headers)
+
+    def retry_delay(self, deployment: str, attempt: int, waited: float, error: Exception, failover: bool = False):
+        """
+        Seconds to wait before the next attempt, or None when the retries or the retry budget of the request are exhausted.
+        Retry-After is honoured, otherwise exponential backoff with full jitter.
+        failover: the next attempt goes to another endpoint, no need to wait.
+        """
+        status = getattr(error, "status_code", None)
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        retry_after = retry_after_seconds(headers)
+        if status == 429:
+            self.count(deployment, "throttled")
+            self.bucket(deployment).throttle(retry_after if retry_after is not None else OPENAI_BACKOFF_BASE_SECONDS)
+
+        if failover:
+            delay = 0.0
+        elif retry_after is not None:
+            delay = retry_after
+        else:
+            delay = random.uniform(0, min(OPENAI_BACKOFF_MAX_SECONDS, OPENAI_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+        if attempt >= self.max_retries or waited + delay > self.retry_budget:
+            self.count(deployment, "failures")
+            logger.warning(f"OpenAI call to {deployment} failed after {attempt + 1} attempts: {error}")
+            return None
+        self.count(deployment, "retries")
+        self.count(deployment, "wait_seconds", delay)
+        logger.warning(f"OpenAI call to {deployment} failed ({status or type(error).__name__}), retrying in {delay:.2f}s")
+        return delay
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {deployment: {**metrics, "wait_seconds": round(metrics["wait_seconds"], 3)}
+                    for deployment, metrics in self._metrics.items()}
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,96 @@
+import re
+from functools import lru_cache
+
+from app.settings import COMPLETION_MODEL, PROMPT_TOKEN_BUDGET
+from app.services.llm.prompt_menager import CustomPrompt
+from app.utils.nb_logger import NBLogger
+from app.utils.tokenizer import count_tokens
+
+logger = NBLogger().Log()
+
+# ", Examples: [...]" added by the M-Schema to the column lines
+_COLUMN_EXAMPLES_PATTERN = re.compile(r", Examples: \[[^\]\n]*\]")
+
+
+@lru_cache(maxsize=4096)
+def _count_component_tokens(text: str, model: str) -> int:
+    # The same tables and examples are measured on every request: remember their size.
+    # The separator added when joining the components counts as one token.
+    return count_tokens(text, model) + 1
+
+
+def strip_column_examples(table_schema: str) -> str:
+    return _COLUMN_EXAMPLES_PATTERN.sub("", table_schema)
+
+
+def example_lines(examples: list) -> list:
+    """The few-shot examples as they appear in the prompts, one "question: sql" line per example."""
+    return [f"{example['question']}: {example['sql']}" for example in (examples or [])
+            if isinstance(example, dict) and 'question' in example and 'sql' in example]
+
+
+class TokenBudget:
+    """
+    Fit the variable parts of a prompt (few-shot examples and schema) into a token budget.
+    When the prompt is too large the components are trimmed by priority:
+    1. the few-shot examples, the last (less relevant) first
+    2. the column examples of the tables, starting from the less similar table
+    3. the less similar tables (the most relevant one is always kept)
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET, model: str = COMPLETION_MODEL):
+        self.budget = budget
+        self.model = model
+
+    def fit(self, name: str, prompt: CustomPrompt, examples: list, schema_tables: dict,
+            examples_variable: str = "examples", schema_variable: str = "database_schema", **values) -> str:
+        """
+        Format the prompt with the examples and the schema tables (ordered by decreasing similarity)
+        trimmed to the budget, and log its token count.
+        """
+        examples = example_lines(examples)
+        tables = list((schema_tables or {}).values())
+
+        # Tokens of everything but the components, measured once
+        fixed = count_tokens(prompt.format(**values, **{examples_variable: "", schema_variable: ""}), self.model)
+        examples_tokens = [_count_component_tokens(example, self.model) for example in examples]
+        tables_tokens = [_count_component_tokens(table, self.model) for table in tables]
+
+        def total() -> int:
+            return fixed + sum(examples_tokens) + sum(tables_tokens)
+
+        trimmed = {"examples": 0, "column examples": 0, "tables": 0}
+        while total() > self.budget and examples:
+            examples.pop()
+            examples_tokens.pop()
+            trimmed["examples"] += 1
+
+        for i in reversed(range(len(tables))):
+            if total() <= self.budget:
+                break
+            table = strip_column_examples(tables[i])
+            if table != tables[i]:
+                tables[i] = table
+                tables_tokens[i] = _count_component_tokens(table, self.model)
+                trimmed["column examples"] += 1
+
+        while total() > self.budget and len(tables) > 1:
+            tables.pop()
+            tables_tokens.pop()
+            trimmed["tables"] += 1
+
+        retval = prompt.format(**values, **{examples_variable: "\n".join(examples), schema_variable: "\n".join(tables)})
+        prompt_tokens = count_tokens(retval, self.model)
+        logger.info(f"Prompt {name}: {prompt_tokens} tokens (budget {self.budget}, fixed {fixed}, "
+                    f"examples {sum(examples_tokens)}, schema {sum(tables_tokens)}, trimmed {trimmed})")
+        if prompt_tokens > self.budget:
+            logger.warning(f"Prompt {name} is still over budget after trimming: {prompt_tokens} > {self.budget} tokens")
+        return retval
+
+    def measure(self, name: str, prompt: str) -> int:
+        """
+        Count and log the tokens of an already assembled prompt.
+        """
+        prompt_tokens = count_tokens(prompt, self.model)
+        logger.info(f"Prompt {name}: {prompt_tokens} tokens (budget {self.budget})")
+        return prompt_tokens
@@ -4,12 +4,14 @@ from app.services.db_service import DBHelper
 from app.utils.nb_logger import NBLogger
 import app.services.embedding_service as embedding_service
 import json
+import hashlib
 from typing import Dict
 
 logger = NBLogger().Log()
 
 
 SCHEMA = {}
+_SCHEMA_VERSIONS = {}
 
 def initialize_schema_embeddings(database:str) -> dict:
     """
@@ -72,6 +74,22 @@ def initialize_schema_embeddings(database:str) -> dict:
         SCHEMA = retval
     return SCHEMA
     
+
+def get_schema_version(database: str) -> str:
+    """
+    Fingerprint of the database schema: it changes when a table or column changes,
+    so whatever was derived from the previous schema can be invalidated.
+    """
+    table_embedding = initialize_schema_embeddings(database)
+    cached = _SCHEMA_VERSIONS.get(database)
+    if cached and cached[0] is table_embedding:
+        return cached[1]
+
+    columns = {table_name: data["columns"] for table_name, data in table_embedding.items()}
+    version = hashlib.sha256(json.dumps(columns, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+    _SCHEMA_VERSIONS[database] = (table_embedding, version)
+    return version
+
   
 def cosine_similarity(vec1: list, vec2: list) -> float:
     """Compute cosine similarity between two vectors."""
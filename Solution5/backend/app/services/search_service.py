@@ -1,6 +1,10 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from app.services.azure_search_service import AzureSearchService
 from app.services.db_service import DBHelper
 from app.services.llm.openai_service import OpenAIService
+from app.settings import EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY, EXAMPLES_UPLOAD_MAX_RETRIES, EXAMPLES_PAGE_SIZE
 from app.utils.nb_logger import NBLogger
 
 logger = NBLogger().Log()
@@ -28,16 +32,113 @@ class SearchService:
         return retval
 
     @staticmethod
-    def get_examples(database: str):
+    def example_doc_id(databaseName: str, question: str, sql: str) -> str:
         """
-        Retrieves all examples with their questions and corresponding SQL queries.
+        Deterministic doc_id of an example uploaded without one: uploading it again updates the same document.
+        A hex digest only uses characters allowed in a search document key.
+        """
+        return hashlib.sha256("\n".join((databaseName, question, sql)).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def add_examples_bulk(database: str, examples: list) -> dict:
+        """
+        Adds many examples at once. Question and SQL embeddings are computed in batched,
+        concurrent calls and the documents are uploaded in batches with merge_or_upload,
+        retrying the ones that failed.
+
+        :param database: The database identifier.
+        :param examples: A list of dictionaries with question, sql and optionally doc_id (see example_doc_id when missing).
+        :return: A dictionary with the number of uploaded/failed examples and the failed doc_id list.
+        """
+        logger.info(f"Adding {len(examples)} examples to database {database}")
+        databaseName = DBHelper.getDBName(database)
+
+        documents = [{
+            "doc_id": example.get("doc_id") or SearchService.example_doc_id(databaseName, example["question"], example["sql"]),
+            "question": example["question"],
+            "sql": example["sql"],
+            "database": databaseName
+        } for example in examples]
+
+        # Questions and SQL are embedded together: first half questions, second half SQL
+        texts = [document["question"] for document in documents] + [document["sql"] for document in documents]
+        embeddings = SearchService._get_embeddings(texts)
+
+        pending = []
+        failed = []
+        for i, document in enumerate(documents):
+            question_embedding = embeddings[i]
+            sql_embedding = embeddings[i + len(documents)]
+            if question_embedding is None or sql_embedding is None:
+                failed.append(document["doc_id"])
+                continue
+            document["question_vector"] = question_embedding
+            document["sql_vector"] = sql_embedding
+            pending.append(document)
+
+        for attempt in range(EXAMPLES_UPLOAD_MAX_RETRIES + 1):
+            if attempt > 0:
+                logger.warning(f"Retrying upload of {len(pending)} examples (attempt {attempt})")
+                time.sleep(2 ** attempt)
+            failed_ids = set(AzureSearchService.upload_examples_batch(databaseName, pending))
+            pending = [document for document in pending if document["doc_id"] in failed_ids]
+            if not pending:
+                break
+        failed.extend(document["doc_id"] for document in pending)
+
+        return {
+            "uploaded": len(documents) - len(failed),
+            "failed": len(failed),
+            "failed_doc_ids": failed
+        }
+
+    @staticmethod
+    def _get_embeddings(texts: list) -> list:
+        """
+        Embeds the texts in batches of EMBEDDING_BATCH_SIZE with EMBEDDING_CONCURRENCY calls in parallel.
+        The result is aligned with the input; texts whose batch kept failing get None.
+        """
+        batches = [texts[start:start + EMBEDDING_BATCH_SIZE] for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+
+        def embed(batch: list) -> list:
+            for attempt in range(EXAMPLES_UPLOAD_MAX_RETRIES + 1):
+                try:
+                    return OpenAIService.get_embeddings(batch)
+                except Exception as e:
+                    logger.warning(f"Embedding batch failed (attempt {attempt + 1}): {e}")
+                    if attempt < EXAMPLES_UPLOAD_MAX_RETRIES:
+                        time.sleep(2 ** attempt)
+            return [None] * len(batch)
+
+        with ThreadPoolExecutor(max_workers=EMBEDDING_CONCURRENCY) as executor:
+            results = executor.map(embed, batches)
+            return [embedding for batch in results for embedding in batch]
+
+    @staticmethod
+    def iter_examples(database: str, page_size: int = 1000):
+        """
+        Lazily iterates over all the examples of a database, without loading them all in memory.
+
+        :param database: The database identifier.
+        :return: A generator of dictionaries containing doc_id, question, SQL query and database.
+        """
+        logger.info(f"Iterating examples from database {database}")
+        databaseName = DBHelper.getDBName(database)
+        return AzureSearchService.iter_examples(databaseName, page_size)
+
+    @staticmethod
+    def get_examples(database: str, page_size: int = EXAMPLES_PAGE_SIZE, continuation_token: str = None) -> dict:
+        """
+        Retrieves one page of examples with their questions and corresponding SQL queries.
 
         :param database: The database identifier.
-        :return: A list of dictionaries containing questions and SQL queries.
+        :param page_size: The maximum number of examples to return.
+        :param continuation_token: The token returned by the previous page, None for the first page.
+        :return: A dictionary with the examples and the continuation token of the next page (None on the last page).
         """
         logger.info(f"Retrieving examples from database {database}")
         databaseName = DBHelper.getDBName(database)
-        return AzureSearchService.list_examples_in_search(databaseName)
+        return AzureSearchService.list_examples_in_search(databaseName, page_size, continuation_token)
 
     @staticmethod
     def update_example(database: str, doc_id: str, new_question: str, new_sql: str) -> bool:
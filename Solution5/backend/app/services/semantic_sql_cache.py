@@ -0,0 +1,112 @@
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from app.settings import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES_PER_DB
+from app.utils.nb_logger import NBLogger
+
+logger = NBLogger().Log()
+
+
+class SemanticSQLCache:
+    """
+    Per-database cache of the SQL generated for successfully answered questions.
+    A new question reuses the SQL of a cached one when their embeddings are similar enough
+    and the cached entry was produced on the same schema version.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries_per_db: int = SEMANTIC_CACHE_MAX_ENTRIES_PER_DB):
+        self.threshold = threshold
+        self.max_entries_per_db = max_entries_per_db
+        self._entries = {}    # database -> list of entries
+        self._matrices = {}   # database -> matrix of the normalized question embeddings (rebuilt on change)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: list) -> Optional[np.ndarray]:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else None
+
+    def _invalidate_old_schema(self, database: str, schema_version: str):
+        entries = self._entries.get(database, [])
+        kept = [entry for entry in entries if entry["schema_version"] == schema_version]
+        if len(kept) != len(entries):
+            logger.info(f"Semantic cache: {len(entries) - len(kept)} entries invalidated for database {database} (schema changed)")
+            self._entries[database] = kept
+            self._matrices.pop(database, None)
+
+    def lookup(self, database: str, schema_version: str, question_embedding: list) -> Optional[dict]:
+        """
+        Return a copy of the most similar cached entry (with its similarity), or None.
+        """
+        query = self._normalize(question_embedding)
+        if query is None:
+            return None
+
+        with self._lock:
+            self._invalidate_old_schema(database, schema_version)
+            entries = self._entries.get(database)
+            if not entries:
+                return None
+            if database not in self._matrices:
+                self._matrices[database] = np.vstack([entry["vector"] for entry in entries])
+            similarities = self._matrices[database] @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                return None
+
+            entry = entries[best]
+            entry["hits"] += 1
+            entry["last_used"] = time.time()
+            return {
+                "question": entry["question"],
+                "sql": entry["sql"],
+                "hits": entry["hits"],
+                "similarity": round(similarity, 4)
+            }
+
+    def add(self, database: str, schema_version: str, question: str, question_embedding: list, sql: str):
+        vector = self._normalize(question_embedding)
+        if vector is None or not sql:
+            return
+
+        with self._lock:
+            self._invalidate_old_schema(database, schema_version)
+            entries = self._entries.setdefault(database, [])
+            # Same question already cached: just refresh the SQL
+            entries[:] = [entry for entry in entries if entry["question"] != question]
+            entries.append({
+                "question": question,
+                "sql": sql,
+                "vector": vector,
+                "schema_version": schema_version,
+                "hits": 0,
+                "last_used": time.time()
+            })
+            if len(entries) > self.max_entries_per_db:
+                # Evict the least recently used entries
+                entries.sort(key=lambda entry: entry["last_used"])
+                del entries[:len(entries) - self.max_entries_per_db]
+            self._matrices.pop(database, None)
+
+    def remove(self, database: str, sql: str):
+        with self._lock:
+            entries = self._entries.get(database, [])
+            self._entries[database] = [entry for entry in entries if entry["sql"] != sql]
+            self._matrices.pop(database, None)
+
+    def invalidate(self, database: str = None):
+        with self._lock:
+            if database is None:
+                self._entries.clear()
+                self._matrices.clear()
+            else:
+                self._entries.pop(database, None)
+                self._matrices.pop(database, None)
+
+
+semantic_sql_cache = SemanticSQLCache()
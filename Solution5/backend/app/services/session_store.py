@@ -0,0 +1,224 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.settings import (
+    SESSION_STORE_BACKEND, SESSION_TTL_SECONDS, SESSION_MAX_SESSIONS, SESSION_MAX_TURNS, SESSION_MAX_BYTES,
+    SESSION_MAX_VALUE_CHARS, SESSION_REDIS_PREFIX, REDIS_COONECTION_STRING_SECRET_NAME, KEY_VAULT_CORE_URI
+)
+from app.services.secret_service import SecretService
+from app.utils.nb_logger import NBLogger
+
+try:
+    import redis  # optional
+except Exception:  # pragma: no cover
+    redis = None
+
+logger = NBLogger().Log()
+
+# Rebuilt on every request from process wide caches, never stored with the session
+_TRANSIENT_KEYS = {"table_embedding": dict, "question_embedding": list}
+# Only needed by the request that produced them (reset by cleanOnNewQuestion)
+_REQUEST_KEYS = {"query_result": list, "execution_history": list, "request_id": str}
+# Fields of the execution history entries kept in the chat history summaries
+_SUMMARY_FIELDS = ("agent_name", "tool_name", "status", "error", "execution_time", "executed_at", "served_by")
+
+
+class InMemorySessionBackend:
+    """
+    Sessions of this worker: TTL since the last access, LRU eviction once max_sessions is reached.
+    """
+    def __init__(self, ttl: int, max_sessions: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._store: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._store.get(session_id)
+            if row is None:
+                return None
+            ts, state = row
+            if time.time() - ts > self.ttl:
+                self._store.pop(session_id, None)
+                return None
+            self._store[session_id] = (time.time(), state)
+            self._store.move_to_end(session_id)
+            return state
+
+    def set(self, session_id: str, state: dict):
+        with self._lock:
+            self._store[session_id] = (time.time(), state)
+            self._store.move_to_end(session_id)
+            while len(self._store) > self.max_sessions:
+                self._store.popitem(last=False)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._store.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._store)
+
+
+class FakeRedis:
+    """
+    In-process stand-in for a Redis client (get / set with ex / delete), for local runs and tests.
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._data.get(key)
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and time.time() > expires_at:
+                self._data.pop(key, None)
+                return None
+            return value
+
+    def set(self, key: str, value, ex: int = None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+
+class RedisSessionBackend:
+    """
+    Sessions shared by all the workers, serialized as JSON. Expire after ttl without access.
+    """
+    def __init__(self, client, ttl: int, prefix: str):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._c = client
+
+    @classmethod
+    def from_url(cls, url: str, ttl: int, prefix: str) -> "RedisSessionBackend":
+        if redis is None:
+            raise RuntimeError("Install `redis` to use RedisSessionBackend.")
+        return cls(redis.from_url(url, decode_responses=True), ttl, prefix)
+
+    def _k(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def get(self, session_id: str) -> Optional[dict]:
+        value = self._c.get(self._k(session_id))
+        if value is None:
+            return None
+        # Sliding expiration: a session read is a session in use
+        self._c.set(self._k(session_id), value, ex=self.ttl)
+        return _deserialize(value)
+
+    def set(self, session_id: str, state: dict):
+        self._c.set(self._k(session_id), _serialize(state), ex=self.ttl)
+
+    def delete(self, session_id: str):
+        self._c.delete(self._k(session_id))
+
+
+def _serialize(state: dict) -> str:
+    state = dict(state)
+    # langchain messages are stored as their content
+    state["history"] = [getattr(message, "content", message) for message in state.get("history", [])]
+    return json.dumps(state, default=str, ensure_ascii=False)
+
+
+def _deserialize(value: str) -> dict:
+    from langchain.schema import HumanMessage
+    state = json.loads(value)
+    state["history"] = [HumanMessage(content=content) for content in state.get("history", [])]
+    return state
+
+
+def _truncate(value, max_chars: int):
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + "..."
+    return value
+
+
+def _summarize_turn(execution_history: list) -> list:
+    # Keep which agents and tools ran, how long and how they ended: prompts, results and reasoning are dropped
+    return [
+        {key: _truncate(entry[key], SESSION_MAX_VALUE_CHARS) for key in _SUMMARY_FIELDS if key in entry}
+        for entry in execution_history if isinstance(entry, dict)
+    ]
+
+
+def _size(state: dict) -> int:
+    return len(_serialize(state))
+
+
+class SessionStore:
+    """
+    Conversation states of the nl_to_sql sessions. States are compacted before being stored:
+    transient and per-request data are dropped, the chat history keeps summaries of the last SESSION_MAX_TURNS turns,
+    and the oldest turns are dropped until the session fits in SESSION_MAX_BYTES.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, session_id: str) -> Optional[dict]:
+        try:
+            return self.backend.get(session_id)
+        except Exception as e:
+            logger.error(f"Session store read failed for {session_id}: {e}")
+            return None
+
+    def save(self, session_id: str, state: dict) -> dict:
+        state = self.compact(state)
+        try:
+            self.backend.set(session_id, state)
+        except Exception as e:
+            logger.error(f"Session store write failed for {session_id}: {e}")
+        return state
+
+    def delete(self, session_id: str):
+        self.backend.delete(session_id)
+
+    def compact(self, state: dict) -> dict:
+        """
+        Compacted copy of the state (the lists of the state are not modified, they can still be in use by the response).
+        """
+        state = dict(state)
+        for key, factory in {**_TRANSIENT_KEYS, **_REQUEST_KEYS}.items():
+            if key in state:
+                state[key] = factory()
+        state["examples"] = [
+            {key: value for key, value in example.items() if not key.endswith("_embedding")}
+            for example in state.get("examples", []) if isinstance(example, dict)
+        ]
+        state["history"] = list(state.get("history", []))[-SESSION_MAX_TURNS:]
+        state["chat_history"] = [_summarize_turn(turn) for turn in list(state.get("chat_history", []))[-SESSION_MAX_TURNS:]]
+
+        while _size(state) > SESSION_MAX_BYTES and (state["chat_history"] or len(state["history"]) > 1):
+            if state["chat_history"]:
+                state["chat_history"] = state["chat_history"][1:]
+            else:
+                state["history"] = state["history"][1:]
+        return state
+
+
+def _create_store() -> SessionStore:
+    if SESSION_STORE_BACKEND == "redis":
+        try:
+            url = SecretService.get_secret_value(KEY_VAULT_CORE_URI, REDIS_COONECTION_STRING_SECRET_NAME)
+            return SessionStore(RedisSessionBackend.from_url(url, SESSION_TTL_SECONDS, SESSION_REDIS_PREFIX))
+        except Exception as e:
+            logger.error(f"Session store: Redis backend not available, using memory: {e}")
+    if SESSION_STORE_BACKEND == "fake-redis":
+        return SessionStore(RedisSessionBackend(FakeRedis(), SESSION_TTL_SECONDS, SESSION_REDIS_PREFIX))
+    return SessionStore(InMemorySessionBackend(SESSION_TTL_SECONDS, SESSION_MAX_SESSIONS))
+
+
+session_store = _create_store()
@@ -6,6 +6,11 @@ from sqlalchemy import MetaData, create_engine, insert, inspect, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import OperationalError, ProgrammingError
 
+from app.services.sql_rewriter import SQLRewriter, SQLRewriteError
+
+# sqlglot dialects of the SQLAlchemy dialects
+_SQLGLOT_DIALECTS = {"mssql": "tsql", "postgresql": "postgres"}
+
 
 class SQLDatabase:
     """SQL Database.
@@ -221,9 +226,10 @@ class SQLDatabase:
         with self._engine.begin() as connection:
             try:
                 if self._schema:
-                    command = command.replace("FROM ", f"FROM {self._schema}.")
-                    command = command.replace("JOIN ", f"JOIN {self._schema}.")
+                    command = SQLRewriter.qualify_tables(command, self._schema, _SQLGLOT_DIALECTS.get(self.dialect, self.dialect))
                 cursor = connection.execute(text(command))
+            except SQLRewriteError as exc:
+                raise NotImplementedError(f"Statement {command!r} is invalid SQL.\nError: {exc}") from exc
             except (ProgrammingError, OperationalError) as exc:
                 raise NotImplementedError(
                     f"Statement {command!r} is invalid SQL.\nError: {exc.orig}"
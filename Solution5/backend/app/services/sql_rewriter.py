@@ -0,0 +1,175 @@
+from app.settings import ROWS_LIMIT, SQL_DIALECT
+from app.utils.nb_logger import NBLogger
+
+try:
+    import sqlglot  # optional
+    from sqlglot import exp
+    from sqlglot.errors import ParseError
+except Exception:  # pragma: no cover
+    sqlglot = None
+
+logger = NBLogger().Log()
+
+# Statements and clauses writing to the database or running code: never in a generated query
+_FORBIDDEN = (
+    "Insert", "Update", "Delete", "Merge", "Create", "Drop", "Alter", "TruncateTable",
+    "Command", "Execute", "Into", "Grant", "Transaction", "Commit", "Rollback", "Use", "Set",
+)
+
+
+class SQLRewriteError(Exception):
+    """
+    Generated SQL query refused: several statements, not a query (DML, DDL, EXEC...) or not parsed.
+    """
+    pass
+
+
+class SQLRewriter:
+    """
+    Rewrite of the generated SQL on its syntax tree: the outermost query is capped to the rows limit
+    (TOP, or OFFSET/FETCH when the query has an OFFSET or is a sorted UNION, CTEs included) and the unqualified
+    tables can be qualified with a schema. A query already within the limit is returned unchanged.
+    """
+
+    @staticmethod
+    def is_available() -> bool:
+        return sqlglot is not None
+
+    @staticmethod
+    def rewrite(sql_query: str, rows_limit: int = None, schema: str = None, dialect: str = SQL_DIALECT) -> str:
+        """
+        The generated SQL query, capped to the rows limit (ROWS_LIMIT by default). Raises SQLRewriteError
+        when the query is refused.
+        """
+        if sqlglot is None:
+            logger.warning("sqlglot is not installed: generated SQL not rewritten")
+            return sql_query
+        rows_limit = int(ROWS_LIMIT) if rows_limit is None else rows_limit
+
+        statement = SQLRewriter._parse(sql_query, dialect)
+        if not isinstance(statement, exp.Query):
+            raise SQLRewriteError(f"Only SELECT queries are allowed, got {statement.key.upper()}.")
+        for name in _FORBIDDEN:
+            node_type = getattr(exp, name, None)
+            if node_type is not None and statement.find(node_type) is not None:
+                raise SQLRewriteError(f"Only read-only SELECT queries are allowed, found {name.upper()}.")
+
+        changed = SQLRewriter._qualify(statement, schema) if schema else False
+        capped = SQLRewriter._cap(statement, rows_limit)
+        if capped is None and not changed:
+            return sql_query
+        rewritten = (capped or statement).sql(dialect=dialect)
+        logger.info(f"Rewritten SQL query: {rewritten}")
+        return rewritten
+
+    @staticmethod
+    def qualify_tables(sql_query: str, schema: str, dialect: str = SQL_DIALECT) -> str:
+        """
+        The SQL statement with its unqualified tables in the schema (CTEs, temp tables and functions excluded).
+        """
+        if sqlglot is None:
+            logger.warning("sqlglot is not installed: tables not qualified")
+            return sql_query
+        statement = SQLRewriter._parse(sql_query, dialect)
+        return statement.sql(dialect=dialect) if SQLRewriter._qualify(statement, schema) else sql_query
+
+    @staticmethod
+    def is_ordered(sql_query: str, dialect: str = SQL_DIALECT) -> bool:
+        """
+        True when the outermost query sorts its rows (ORDER BY), or when it cannot be parsed.
+        """
+        if sqlglot is None:
+            return True
+        try:
+            statement = SQLRewriter._parse(sql_query, dialect)
+        except SQLRewriteError:
+            return True
+        return statement.args.get("order") is not None
+
+    @staticmethod
+    def _parse(sql_query: str, dialect: str):
+        try:
+            statements = [statement for statement in sqlglot.parse(sql_query, read=dialect) if statement is not None]
+        except ParseError as e:
+            error = e.errors[0] if e.errors else {}
+            detail = f"{error['description']} (line {error.get('line')}, column {error.get('col')})" if error else str(e)
+            raise SQLRewriteError(f"SQL query could not be parsed: {detail}") from e
+        if len(statements) != 1:
+            raise SQLRewriteError(f"Exactly one SQL statement is allowed, got {len(statements)}.")
+        return statements[0]
+
+    @staticmethod
+    def _qualify(statement, schema: str) -> bool:
+        ctes = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+        changed = False
+        for table in statement.find_all(exp.Table):
+            if table.db or not isinstance(table.this, exp.Identifier):
+                continue
+            if table.name.lower() in ctes or table.this.args.get("temporary"):
+                continue
+            table.set("db", exp.to_identifier(schema))
+            changed = True
+        return changed
+
+    @staticmethod
+    def _cap(query, rows_limit: int):
+        # The capped query, None when the query is already within the limit
+        limit = query.args.get("limit")
+        if limit is None:
+            if isinstance(query, exp.SetOperation):
+                if query.args.get("order") is not None:
+                    # Sorted UNION: paged in place, OFFSET/FETCH is allowed after its ORDER BY
+                    if query.args.get("offset") is None:
+                        query.set("offset", exp.Offset(expression=exp.Literal.number(0)))
+                    query.set("limit", exp.Fetch(direction="NEXT", count=exp.Literal.number(rows_limit)))
+                    return query
+                SQLRewriter._name_columns(query)
+            # TOP, OFFSET/FETCH or a wrapping SELECT TOP * FROM (...) for the UNIONs
+            return query.limit(rows_limit)
+
+        key = "count" if isinstance(limit, exp.Fetch) else "expression"
+        count = limit.args.get(key)
+        options = limit.args.get("limit_options")
+        within = isinstance(count, exp.Literal) and not count.is_string and count.this.isdigit() and int(count.this) <= rows_limit
+        # TOP n PERCENT and WITH TIES may return more rows than n
+        unbounded = options is not None and (options.args.get("percent") or options.args.get("with_ties"))
+        if within and not unbounded:
+            return None
+        if not within:
+            limit.set(key, exp.Literal.number(rows_limit))
+        if unbounded:
+            limit.set("limit_options", None)
+        return query
+
+    @staticmethod
+    def _name_columns(query):
+        # The derived table wrapping a UNION needs named and unique columns (Msg 8155 / 8156):
+        # they are the columns of its first SELECT
+        select = query
+        while isinstance(select, (exp.SetOperation, exp.Subquery)):
+            select = select.this
+        if not isinstance(select, exp.Select):
+            return
+        projections = select.expressions
+        # Only the columns and the aliases name their output (T-SQL leaves expressions and literals unnamed)
+        output_names = [projection.alias_or_name if isinstance(projection, (exp.Alias, exp.Column)) else "" for projection in projections]
+        taken = {name.lower() for name in output_names if name}
+        names = set()
+        for index, projection in enumerate(projections):
+            if isinstance(projection, exp.Star) or (isinstance(projection, exp.Column) and projection.is_star):
+                continue
+            name = output_names[index]
+            if name and name.lower() not in names:
+                names.add(name.lower())
+                continue
+            base = name or f"column{index + 1}"
+            unique = base
+            suffix = 1
+            while unique.lower() in names or unique.lower() in taken:
+                suffix += 1
+                unique = f"{base}_{suffix}"
+            names.add(unique.lower())
+            if isinstance(projection, exp.Alias):
+                projection.set("alias", exp.to_identifier(unique))
+            else:
+                projection.replace(exp.alias_(projection.copy(), unique))
@@ -0,0 +1,209 @@
+import difflib
+import threading
+
+from app.settings import SQL_DIALECT
+from app.services.m_schema import MSchema
+from app.services.tracing import tracer
+from app.utils.nb_logger import NBLogger
+
+try:
+    import sqlglot  # optional
+    from sqlglot import exp
+    from sqlglot.errors import ParseError
+    from sqlglot.optimizer.scope import Scope, traverse_scope
+except Exception:  # pragma: no cover
+    sqlglot = None
+
+logger = NBLogger().Log()
+
+# Default schema of the unqualified tables (SQL Server)
+_DEFAULT_SCHEMA = "dbo"
+
+
+class _SchemaIndex:
+    """
+    Tables and columns of an M-Schema, case insensitive as SQL Server identifiers.
+    """
+
+    def __init__(self, mschema: MSchema):
+        self.columns = {}  # table (as in the M-Schema, lower case) -> {column lower case: column}
+        self.names = {}  # table lower case -> table as in the M-Schema
+        self.by_name = {}  # table without its schema, lower case -> tables
+        for table, info in mschema.tables.items():
+            key = table.lower()
+            self.names[key] = table
+            self.columns[key] = {field.lower(): field for field in info.get("fields", {})}
+            self.by_name.setdefault(key.split(".")[-1], []).append(key)
+
+    def resolve(self, schema: str, name: str):
+        # Key of the table referenced as [schema.]name, None when it does not exist
+        name = name.lower()
+        if schema:
+            key = f"{schema.lower()}.{name}"
+            if key in self.columns:
+                return key
+            # M-Schema without the schema in the table names
+            return name if name in self.columns and schema.lower() == _DEFAULT_SCHEMA else None
+        if name in self.columns:
+            return name
+        candidates = self.by_name.get(name, [])
+        default = f"{_DEFAULT_SCHEMA}.{name}"
+        if default in candidates:
+            return default
+        return candidates[0] if len(candidates) == 1 else None
+
+
+def _suggestion(name: str, candidates) -> str:
+    matches = difflib.get_close_matches(name, list(candidates), n=1, cutoff=0.6)
+    return f" Did you mean '{matches[0]}'?" if matches else ""
+
+
+class SQLValidator:
+    """
+    Static checks of the generated SQL against the cached M-Schema of the database, without any round trip:
+    every table and column referenced must exist. Statements the local parser cannot read are not reported
+    (the database decides), so a valid query is never rejected because of the parser.
+    """
+
+    _indexes = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def is_available() -> bool:
+        return sqlglot is not None
+
+    @staticmethod
+    def _index(mschema: MSchema) -> _SchemaIndex:
+        with SQLValidator._lock:
+            cached = SQLValidator._indexes.get(id(mschema))
+            if cached is None or cached[0] is not mschema:
+                cached = (mschema, _SchemaIndex(mschema))
+                SQLValidator._indexes[id(mschema)] = cached
+            return cached[1]
+
+    @staticmethod
+    def validate(database: str, sql_query: str) -> list:
+        """
+        Errors of the SQL query for the database (empty when it looks valid or cannot be checked).
+        """
+        from app.services.db_service import DBHelper
+        mschema = DBHelper.get_mschema(database)
+        if not isinstance(mschema, MSchema) or not mschema.tables:
+            return []
+        with tracer.span("sql validate", attributes={"db.name": database}) as span:
+            errors = SQLValidator.validate_with_schema(mschema, sql_query)
+            span.set_attribute("sql.errors", len(errors))
+        return errors
+
+    @staticmethod
+    def validate_with_schema(mschema: MSchema, sql_query: str) -> list:
+        if sqlglot is None or not sql_query or not sql_query.strip():
+            return []
+        try:
+            statements = [statement for statement in sqlglot.parse(sql_query, read=SQL_DIALECT) if statement is not None]
+        except ParseError as e:
+            logger.info(f"SQL validation skipped, statement not parsed: {e}")
+            return []
+
+        index = SQLValidator._index(mschema)
+        errors = []
+        for statement in statements:
+            errors.extend(SQLValidator._check_tables(index, statement))
+            try:
+                scopes = traverse_scope(statement)
+            except Exception as e:
+                logger.info(f"SQL validation of the columns skipped: {e}")
+                continue
+            for scope in scopes:
+                errors.extend(SQLValidator._check_columns(index, scope))
+        # Same error reported once, in order
+        return list(dict.fromkeys(errors))
+
+    @staticmethod
+    def _check_tables(index: _SchemaIndex, statement) -> list:
+        ctes = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+        errors = []
+        for table in statement.find_all(exp.Table):
+            if not isinstance(table.this, exp.Identifier):
+                # Table valued functions, variables...
+                continue
+            if not table.db and table.name.lower() in ctes or table.this.args.get("temporary"):
+                continue
+            if table.catalog:
+                # Other database: not in this M-Schema
+                continue
+            if index.resolve(table.db, table.name) is None:
+                reference = f"{table.db}.{table.name}" if table.db else table.name
+                errors.append(f"Unknown table '{reference}'.{_suggestion(reference, index.names.values())}")
+        return errors
+
+    @staticmethod
+    def _source_columns(index: _SchemaIndex, source):
+        # Columns of a FROM source: None when unknown (unknown table, SELECT *)
+        if isinstance(source, exp.Table):
+            key = index.resolve(source.db, source.name)
+            return index.columns.get(key) if key else None
+        if isinstance(source, Scope):
+            selects = source.expression.named_selects
+            if "*" in selects:
+                return None
+            return {name.lower(): name for name in selects}
+        return None
+
+    @staticmethod
+    def _check_columns(index: _SchemaIndex, scope) -> list:
+        errors = []
+        if not isinstance(scope.expression, exp.Select):
+            return errors
+        # Aliases of the select list, usable in ORDER BY
+        aliases = {select.alias.lower() for select in scope.expression.selects if isinstance(select, exp.Alias)}
+        for column in scope.columns:
+            name = column.name
+            if not name or isinstance(column.this, exp.Star):
+                continue
+            if column.find_ancestor(exp.Select) is not scope.expression:
+                # Column of a subquery, checked in its own scope
+                continue
+            if column.table:
+                source, found = SQLValidator._find_source(scope, column.table)
+                if not found:
+                    errors.append(f"Unknown table or alias '{column.table}' in '{column.sql(dialect=SQL_DIALECT)}'.")
+                    continue
+                columns = SQLValidator._source_columns(index, source)
+                if columns is not None and name.lower() not in columns:
+                    errors.append(f"Unknown column '{name}' in '{column.table}'.{_suggestion(name, columns.values())}")
+                continue
+
+            if name.lower() in aliases:
+                continue
+            # Unqualified: it must exist in one of the sources of the scope or of the enclosing ones (correlated)
+            candidates = []
+            known = True
+            current = scope
+            while current is not None:
+                for source in current.sources.values():
+                    columns = SQLValidator._source_columns(index, source)
+                    if columns is None:
+                        known = False
+                    elif name.lower() in columns:
+                        candidates = None
+                        break
+                    else:
+                        candidates.extend(columns.values())
+                if candidates is None:
+                    break
+                current = current.parent
+            if candidates is not None and known and scope.sources:
+                errors.append(f"Unknown column '{name}'.{_suggestion(name, candidates)}")
+        return errors
+
+    @staticmethod
+    def _find_source(scope, alias: str):
+        alias = alias.lower()
+        current = scope
+        while current is not None:
+            for name, source in current.sources.items():
+                if name.lower() == alias:
+                    return source, True
+            current = current.parent
+        return None, False
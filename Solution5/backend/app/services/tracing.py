@@ -0,0 +1,351 @@
+import json
+import math
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+
+from app.settings import (
+    TRACING_EXPORTER, TRACING_FILE_PATH, TRACING_OTLP_ENDPOINT, TRACING_SERVICE_NAME,
+    TRACING_EXPORT_BATCH_SIZE, TRACING_EXPORT_INTERVAL_SECONDS, METRICS_MAX_SAMPLES
+)
+from app.utils.nb_logger import NBLogger
+
+logger = NBLogger().Log()
+
+# Span of the agent, tool or call running in the current context (parent of the spans started in it)
+_current_span: ContextVar = ContextVar("current_span", default=None)
+
+# OTLP span kinds and status codes
+_KINDS = {"internal": 1, "server": 2, "client": 3}
+_STATUS_CODES = {"UNSET": 0, "OK": 1, "ERROR": 2}
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+_LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# Token usage attributes of the LLM spans (OpenTelemetry GenAI semantic conventions)
+INPUT_TOKENS = "gen_ai.usage.input_tokens"
+OUTPUT_TOKENS = "gen_ai.usage.output_tokens"
+
+
+class Span:
+    """
+    One timed operation of a request (agent, tool, LLM call, database query), exported in the OpenTelemetry format.
+    """
+
+    def __init__(self, name: str, kind: str = "internal", parent: "Span" = None, attributes: dict = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "UNSET"
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_status(self, status: str, message: str = ""):
+        self.status = status
+        self.status_message = message
+
+    def record_error(self, error: Exception):
+        self.set_status("ERROR", f"{type(error).__name__}: {error}")
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.status == "UNSET":
+                self.status = "OK"
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "kind": self.kind,
+            "start_time": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "status_message": self.status_message,
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": _KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": _STATUS_CODES[self.status], "message": self.status_message},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    if isinstance(value, (list, tuple)):
+        return {"key": key, "value": {"arrayValue": {"values": [{"stringValue": str(item)} for item in value]}}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class ConsoleSpanExporter:
+    """Log the spans, one JSON object per span."""
+
+    def export(self, spans: list):
+        for span in spans:
+            logger.info(f"span {json.dumps(span.to_dict(), default=str)}")
+
+
+class FileSpanExporter:
+    """Append the spans to a JSON lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: list):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+class OTLPSpanExporter:
+    """Send the spans to an OpenTelemetry collector, OTLP/HTTP with the JSON encoding."""
+
+    def __init__(self, endpoint: str, service_name: str):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client = httpx.Client(timeout=10)
+
+    def export(self, spans: list):
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "texttosql"}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+        self._client.post(self.endpoint, json=payload).raise_for_status()
+
+
+class BatchSpanProcessor:
+    """
+    Queue the ended spans and export them in batches from a background thread, so the requests never wait
+    for the exporter. Spans are dropped (and counted) when the queue is full.
+    """
+
+    def __init__(self, exporter, batch_size: int = TRACING_EXPORT_BATCH_SIZE, interval: float = TRACING_EXPORT_INTERVAL_SECONDS):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=batch_size * 20)
+        self._thread = threading.Thread(target=self._worker, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def on_end(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.exporter.export(batch)
+                except Exception as e:
+                    logger.warning(f"Export of {len(batch)} spans failed: {e}")
+
+
+def percentile(sorted_samples: list, percent: float) -> float:
+    """Nearest rank percentile of the sorted samples (0 when there are none)."""
+    if not sorted_samples:
+        return 0.0
+    index = max(0, math.ceil(percent / 100 * len(sorted_samples)) - 1)
+    return round(sorted_samples[index], 3)
+
+
+class StageMetrics:
+    """
+    Latency histogram of a stage (span name) and token usage of its calls. Percentiles are computed
+    on the last METRICS_MAX_SAMPLES samples, counts and histogram on every call.
+    """
+
+    def __init__(self, max_samples: int):
+        self.count = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(_LATENCY_BUCKETS_MS) + 1)
+        self.latencies = deque(maxlen=max_samples)
+        self.token_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.tokens = deque(maxlen=max_samples)
+
+    def add(self, span: Span):
+        duration = span.duration_ms
+        self.count += 1
+        self.total_ms += duration
+        self.latencies.append(duration)
+        self.buckets[next((i for i, bound in enumerate(_LATENCY_BUCKETS_MS) if duration <= bound), len(_LATENCY_BUCKETS_MS))] += 1
+        if span.status == "ERROR":
+            self.errors += 1
+        if span.attributes.get("llm.cache_hit"):
+            self.cache_hits += 1
+        if INPUT_TOKENS in span.attributes or OUTPUT_TOKENS in span.attributes:
+            input_tokens = span.attributes.get(INPUT_TOKENS, 0) or 0
+            output_tokens = span.attributes.get(OUTPUT_TOKENS, 0) or 0
+            self.token_calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.tokens.append(input_tokens + output_tokens)
+
+    def to_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+        retval = {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.count, 3),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": round(latencies[-1], 3),
+            "histogram_ms": {
+                **{str(bound): count for bound, count in zip(_LATENCY_BUCKETS_MS, self.buckets)},
+                "+Inf": self.buckets[-1],
+            },
+        }
+        if self.cache_hits:
+            retval["cache_hits"] = self.cache_hits
+        if self.token_calls:
+            tokens = sorted(self.tokens)
+            retval["tokens"] = {
+                "calls": self.token_calls,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "avg_per_call": round((self.input_tokens + self.output_tokens) / self.token_calls, 1),
+                "p50_per_call": percentile(tokens, 50),
+                "p95_per_call": percentile(tokens, 95),
+                "p99_per_call": percentile(tokens, 99),
+            }
+        return retval
+
+
+class Tracer:
+    """
+    Spans of the agents, tools, LLM calls and database queries, parented through the request context
+    (also across the tool executor threads, which run in a copy of it). Ended spans feed the per stage
+    metrics and are sent to the exporter (TRACING_EXPORTER: none, console, file or otlp).
+    """
+
+    def __init__(self, exporter=None, max_samples: int = METRICS_MAX_SAMPLES):
+        self.processor = BatchSpanProcessor(exporter) if exporter is not None else None
+        self.max_samples = max_samples
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def current_span(self) -> Span:
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", attributes: dict = None):
+        """
+        Run the block in a new child span of the current one.
+        """
+        span = Span(name, kind, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def start_span(self, name: str, kind: str = "internal", attributes: dict = None) -> Span:
+        """
+        Child span of the current one, not made current: for generators, which must call end_span.
+        """
+        return Span(name, kind, _current_span.get(), attributes)
+
+    def end_span(self, span: Span):
+        span.end()
+        with self._lock:
+            if span.name not in self._metrics:
+                self._metrics[span.name] = StageMetrics(self.max_samples)
+            self._metrics[span.name].add(span)
+        if self.processor is not None:
+            self.processor.on_end(span)
+
+    def set_attributes(self, attributes: dict):
+        # Add attributes to the current span (if any)
+        span = _current_span.get()
+        if span is not None:
+            span.set_attributes(attributes)
+
+    def record_error(self, error: Exception):
+        # Mark the current span as failed, for errors handled without propagating the exception
+        span = _current_span.get()
+        if span is not None:
+            span.record_error(error)
+
+    def reset(self):
+        # Drop the metrics collected so far (e.g. after a warm-up)
+        with self._lock:
+            self._metrics = {}
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stages = {name: metrics.to_dict() for name, metrics in sorted(self._metrics.items())}
+        return {"stages": stages, "dropped_spans": self.processor.dropped if self.processor is not None else 0}
+
+
+def _create_exporter():
+    if TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    if TRACING_EXPORTER == "file":
+        return FileSpanExporter(TRACING_FILE_PATH)
+    if TRACING_EXPORTER == "otlp":
+        return OTLPSpanExporter(TRACING_OTLP_ENDPOINT, TRACING_SERVICE_NAME)
+    return None
+
+
+tracer = Tracer(_create_exporter())
@@ -28,6 +28,41 @@ OPENAI_ENDPOINT_SECRET_NAME = os.getenv("AZURE_OPENAI_ENDPOINT_SECRET_NAME")
 OPENAI_VERSION_SECRET_NAME = os.getenv("AZURE_OPENAI_VERSION_SECRET_NAME")
 EMBEDDING_MODEL = os.getenv("EMDEDDING_MODEL","text-embedding-ada-002")
 COMPLETION_MODEL = os.getenv("COMPLETION_MODEL","gpt-35-turbo") 
+# Model routing: classification and extraction tools use the fast deployment, SQL generation COMPLETION_MODEL
+FAST_COMPLETION_MODEL = os.getenv("FAST_COMPLETION_MODEL", COMPLETION_MODEL)
+USE_FAST_MODEL_ROUTING = os.getenv("USE_FAST_MODEL_ROUTING", "false").lower() in {"1", "true", "yes"}
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "")  # JSON object: tool or prompt template name -> deployment, overrides the defaults
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))  # Timeout of a single Azure OpenAI request
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))  # Size of the shared HTTP connection pool
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_MAX_CONCURRENCY_PER_DEPLOYMENT = int(os.getenv("OPENAI_MAX_CONCURRENCY_PER_DEPLOYMENT", "16"))  # Concurrent async calls allowed per deployment
+# Azure OpenAI resources to balance the calls on (JSON list of {"name", "endpoint_secret_name", "key_secret_name", "weight"}),
+# when empty the single resource of AZURE_OPENAI_ENDPOINT_SECRET_NAME / AZURE_OPENAI_KEY_SECRET_NAME is used
+OPENAI_ENDPOINTS = os.getenv("OPENAI_ENDPOINTS", "")
+OPENAI_ENDPOINT_EJECT_SECONDS = float(os.getenv("OPENAI_ENDPOINT_EJECT_SECONDS", "10"))  # Cool-down of an endpoint answering 429/5xx
+OPENAI_ENDPOINT_MAX_EJECT_SECONDS = float(os.getenv("OPENAI_ENDPOINT_MAX_EJECT_SECONDS", "120"))
+OPENAI_LATENCY_EWMA_ALPHA = float(os.getenv("OPENAI_LATENCY_EWMA_ALPHA", "0.3"))
+# Client side rate limiting and retries of the Azure OpenAI calls (quota of each deployment)
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "300"))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "50000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_RETRY_BUDGET_SECONDS = float(os.getenv("OPENAI_RETRY_BUDGET_SECONDS", "30"))  # Max time a request can spend waiting between its retries
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", "0.5"))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", "10"))
+# Token counting: texts longer than TOKENIZER_EXACT_MAX_CHARS are estimated from TOKENIZER_SAMPLES chunks of TOKENIZER_SAMPLE_CHARS
+TOKENIZER_EXACT_MAX_CHARS = int(os.getenv("TOKENIZER_EXACT_MAX_CHARS", "200000"))
+TOKENIZER_SAMPLES = int(os.getenv("TOKENIZER_SAMPLES", "8"))
+TOKENIZER_SAMPLE_CHARS = int(os.getenv("TOKENIZER_SAMPLE_CHARS", "4000"))
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "12000"))  # Max tokens of the SQL generation and answer prompts, examples and schema are trimmed to fit
+ANSWER_MAX_RESULT_TOKENS = int(os.getenv("ANSWER_MAX_RESULT_TOKENS", str(PROMPT_TOKEN_BUDGET)))  # Larger query results are refused before the answer prompt is built
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "5"))  # Min seconds between two checks of a prompt template modification time
+
+# LLM response cache (deterministic calls only: temperature 0 or tools that opt in)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")  # Options: memory, redis
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))  # Max entries kept in memory (LRU eviction)
+LLM_CACHE_REDIS_PREFIX = os.getenv("LLM_CACHE_REDIS_PREFIX", "llmcache:")
 
 
 BLOB_STORAGE_CONNECTION_STRING_SECRET_NAME = os.getenv("BLOB_STORAGE_CONNECTION_STRING_SECRET_NAME")
@@ -36,8 +71,48 @@ SEARCH_INDEX_NAME = os.environ.get("AZURE_SEARCH_INDEX_NAME", "nl-to-sql")
 SEARCH_SERVICE_ENDPOINT_SECRET_NAME = os.environ.get("AZURE_SEARCH_SERVICE_ENDPOINT_SECRET_NAME")
 SEARCH_API_KEY_SECRET_NAME = os.environ.get("AZURE_SEARCH_API_KEY_SECRET_NAME")
 
+# Bulk ingestion of few-shot examples
+EXAMPLES_UPLOAD_BATCH_SIZE = min(int(os.getenv("EXAMPLES_UPLOAD_BATCH_SIZE", "1000")), 1000)  # Azure Search accepts at most 1000 documents per call
+EXAMPLES_UPLOAD_MAX_RETRIES = int(os.getenv("EXAMPLES_UPLOAD_MAX_RETRIES", "3"))  # Retries for documents/embeddings that failed
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))  # Number of texts sent in a single embeddings call
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))  # Number of embeddings calls running in parallel
+EXAMPLES_PAGE_SIZE = min(int(os.getenv("EXAMPLES_PAGE_SIZE", "100")), 1000)  # Default number of examples per page when listing
+
 
 ROWS_LIMIT = os.getenv("ROWS_LIMIT","100")
+SQL_DIALECT = os.getenv("SQL_DIALECT", "tsql")  # Dialect of the generated SQL for the parser (sqlglot)
+SQL_STATIC_VALIDATION_ENABLED = os.getenv("SQL_STATIC_VALIDATION_ENABLED", "true").lower() == "true"  # Check the generated SQL against the M-Schema before executing it
+SQL_DRY_RUN_ENABLED = os.getenv("SQL_DRY_RUN_ENABLED", "true").lower() == "true"  # Compile the SQL candidates on the server without executing them
+SQL_DRY_RUN_MODE = os.getenv("SQL_DRY_RUN_MODE", "describe")  # Options: describe (sp_describe_first_result_set), noexec, parseonly
+# Rewrites of the generated SQL proposed by the LLM from its execution plan, kept when cheaper and equivalent
+PLAN_OPTIMIZATION_ENABLED = os.getenv("PLAN_OPTIMIZATION_ENABLED", "false").lower() == "true"
+PLAN_OPTIMIZATION_MIN_COST = float(os.getenv("PLAN_OPTIMIZATION_MIN_COST", "1.0"))  # Estimated cost under which the query is not worth optimizing
+PLAN_OPTIMIZATION_MIN_GAIN = float(os.getenv("PLAN_OPTIMIZATION_MIN_GAIN", "0.2"))  # Relative cost reduction for a rewrite to be kept
+PLAN_OPTIMIZATION_REWRITES = int(os.getenv("PLAN_OPTIMIZATION_REWRITES", "3"))  # Rewrites asked to the LLM
+PLAN_OPTIMIZATION_SAMPLE_ROWS = int(os.getenv("PLAN_OPTIMIZATION_SAMPLE_ROWS", "100"))  # Rows compared to check that a rewrite is equivalent
+
+# Conversation sessions of nl_to_sql
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory")  # Options: memory, redis, fake-redis (in process, for local runs)
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "14400"))  # Sessions expire after this time without questions
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))  # Max sessions kept in memory (LRU eviction)
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))  # Questions and execution summaries kept per session
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", "262144"))  # Size cap of a session, the oldest turns are dropped to fit
+SESSION_MAX_VALUE_CHARS = int(os.getenv("SESSION_MAX_VALUE_CHARS", "500"))  # Longer values of the execution summaries are truncated
+SESSION_REDIS_PREFIX = os.getenv("SESSION_REDIS_PREFIX", "session:")
+AGENT_TOOL_MAX_WORKERS = int(os.getenv("AGENT_TOOL_MAX_WORKERS", "16"))  # Threads shared by the agents to run independent tools in parallel
+SUB_QUESTION_MAX_CONCURRENCY = int(os.getenv("SUB_QUESTION_MAX_CONCURRENCY", "4"))  # Independent sub-questions of Devide And Conquer generated in parallel
+# Retrieval started on the question as asked while the Chat Agent rewrites it, reused when the rewritten question is similar enough
+SPECULATIVE_PREFETCH_ENABLED = os.getenv("SPECULATIVE_PREFETCH_ENABLED", "true").lower() == "true"
+SPECULATIVE_PREFETCH_MIN_SIMILARITY = float(os.getenv("SPECULATIVE_PREFETCH_MIN_SIMILARITY", "0.95"))  # Cosine similarity of the two questions
+# Follow-up questions reuse the tables and few-shot examples of the previous turn, extended with the newly relevant tables
+FOLLOW_UP_ENABLED = os.getenv("FOLLOW_UP_ENABLED", "true").lower() == "true"
+FOLLOW_UP_MIN_SIMILARITY = float(os.getenv("FOLLOW_UP_MIN_SIMILARITY", "0.85"))  # Cosine similarity with the previous question
+FOLLOW_UP_TABLE_MIN_SIMILARITY = float(os.getenv("FOLLOW_UP_TABLE_MIN_SIMILARITY", "0.8"))  # ... or with one of its tables
+
+# Semantic question-to-SQL cache: reuse the SQL of an already answered, almost identical question
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))  # Min cosine similarity between the questions
+SEMANTIC_CACHE_MAX_ENTRIES_PER_DB = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES_PER_DB", "500"))
 
 # CORS
 CORS_ALLOWED_ORIGINS = os.getenv("CORS_ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:5173,http://example.com")
@@ -45,6 +120,15 @@ CORS_ALLOWED_ORIGINS = os.getenv("CORS_ALLOWED_ORIGINS", "http://localhost:3000,
 # APPLICATION INSIGHTS
 APPLICATIONINSIGHTS_CONNECTION_STRING = os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING")
 
+# Tracing of the agents, tools, LLM calls and database queries
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")  # Options: none, console, file, otlp
+TRACING_FILE_PATH = os.getenv("TRACING_FILE_PATH", "traces.jsonl")
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")  # OTLP/HTTP collector
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "texttosql")
+TRACING_EXPORT_BATCH_SIZE = int(os.getenv("TRACING_EXPORT_BATCH_SIZE", "100"))
+TRACING_EXPORT_INTERVAL_SECONDS = float(os.getenv("TRACING_EXPORT_INTERVAL_SECONDS", "5"))
+METRICS_MAX_SAMPLES = int(os.getenv("METRICS_MAX_SAMPLES", "2000"))  # Latencies kept per stage for the percentiles
+
 
 #-------------------------------------------------------------------------
 #  NEEDED FOR AGENTIC MESH
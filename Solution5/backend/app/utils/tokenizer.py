@@ -0,0 +1,87 @@
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import tiktoken
+
+from app.settings import TOKENIZER_EXACT_MAX_CHARS, TOKENIZER_SAMPLES, TOKENIZER_SAMPLE_CHARS
+
+DEFAULT_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = None):
+    """
+    tiktoken encoding of the model, loaded once per process (unknown models and Azure deployment names
+    fall back to cl100k_base).
+    """
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except Exception:
+            pass
+    return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def _approximate_tokens(text: str, encoding) -> int:
+    # Encode a few chunks spread over the text and extrapolate their tokens per character to the whole text
+    step = len(text) // TOKENIZER_SAMPLES
+    sample_chars = 0
+    sample_tokens = 0
+    for i in range(TOKENIZER_SAMPLES):
+        sample = text[i * step: i * step + TOKENIZER_SAMPLE_CHARS]
+        sample_chars += len(sample)
+        sample_tokens += len(encoding.encode(sample, disallowed_special=()))
+    return round(len(text) * sample_tokens / sample_chars)
+
+
+def count_tokens(text: str, model: str = None, exact: bool = False) -> int:
+    """
+    Number of tokens of a text. Texts longer than TOKENIZER_EXACT_MAX_CHARS are estimated from samples,
+    unless exact is set.
+    """
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if not exact and len(text) > TOKENIZER_EXACT_MAX_CHARS:
+        return _approximate_tokens(text, encoding)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens_batch(texts: List[str], model: str = None, exact: bool = False) -> List[int]:
+    """
+    Number of tokens of each text, the texts to count exactly are encoded in parallel by tiktoken.
+    """
+    encoding = get_encoding(model)
+    retval = [0] * len(texts)
+    to_encode = []
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        if not exact and len(text) > TOKENIZER_EXACT_MAX_CHARS:
+            retval[i] = _approximate_tokens(text, encoding)
+        else:
+            to_encode.append(i)
+    if to_encode:
+        encoded = encoding.encode_batch([texts[i] for i in to_encode], disallowed_special=())
+        for i, tokens in zip(to_encode, encoded):
+            retval[i] = len(tokens)
+    return retval
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], model: str = None) -> int:
+    """
+    Tokens of a chat completion request: role, content and name of every message (and the string values
+    of the content parts / tool calls), plus a small overhead per message.
+    """
+    texts = []
+    for m in messages:
+        for k in ("role", "content", "name"):
+            v = m.get(k)
+            if isinstance(v, str):
+                texts.append(v)
+            elif isinstance(v, list):
+                # tool calls etc.
+                for part in v:
+                    if isinstance(part, dict):
+                        texts.extend(vv for vv in part.values() if isinstance(vv, str))
+    return sum(count_tokens_batch(texts, model)) + 5 * len(messages)
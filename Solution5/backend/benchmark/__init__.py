@@ -0,0 +1,13 @@
+"""
+Offline benchmark of nl_to_sql: the whole agent graph runs against a generated SQLite database, with
+deterministic fake LLM, embeddings and example search (configurable latencies) instead of the Azure services.
+
+Run from the backend folder, e.g.:
+
+    python -m benchmark --sessions 1,8,32 --questions 5 --latency typical --output results.json
+    python -m benchmark --baseline results.json --tolerance 0.1
+
+Reports per stage latency histograms and percentiles, throughput under each number of concurrent sessions,
+memory growth and prompt tokens per LLM route. The token counts need the tiktoken encodings: without network
+access, point TIKTOKEN_CACHE_DIR to a folder where they are cached.
+"""
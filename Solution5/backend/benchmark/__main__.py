@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+
+from benchmark.offline import setup_environment
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Offline benchmark of nl_to_sql")
+    parser.add_argument("--sessions", default="1,4,16", help="Concurrent sessions, comma separated: one run per value")
+    parser.add_argument("--questions", type=int, default=5, help="Questions asked by each session")
+    parser.add_argument("--tables", type=int, default=8, help="Tables of the generated database")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows of each generated table")
+    parser.add_argument("--latency", default="typical", help="Latency profile: zero, typical, slow or a JSON file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=3, help="Questions asked before measuring")
+    parser.add_argument("--trace-memory", action="store_true", help="Python heap growth with tracemalloc (slows the run)")
+    parser.add_argument("--no-semantic-cache", action="store_true")
+    parser.add_argument("--no-llm-cache", action="store_true")
+    parser.add_argument("--log-level", default="ERROR")
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON report")
+    parser.add_argument("--baseline", help="JSON report to compare with: exit code 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change allowed against the baseline")
+    return parser.parse_args(argv)
+
+
+def _latency_profile(value: str) -> dict:
+    from benchmark.fakes import LATENCY_PROFILES
+    if value in LATENCY_PROFILES:
+        return LATENCY_PROFILES[value]
+    with open(value, encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def _run(args, database) -> list:
+    from benchmark.run import run_level, warm_up
+    await warm_up(database, args.warmup, args.seed + 1)
+    runs = []
+    for sessions in [int(value) for value in args.sessions.split(",")]:
+        run = await run_level(database, sessions, args.questions, args.seed, args.trace_memory)
+        summary = run["summary"]
+        print(f"{sessions:>4} sessions: {summary['questions']} questions, {summary['failed']} failed, "
+              f"{summary['throughput_qps']} q/s, p50 {summary['latency_p50_ms']} ms, p95 {summary['latency_p95_ms']} ms, "
+              f"{run['tokens']['prompt_tokens_per_question']} prompt tokens/question")
+        runs.append(run)
+    return runs
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    database_name = "bench"
+    # Before any application module is imported
+    setup_environment(database_name, semantic_cache=not args.no_semantic_cache, llm_cache=not args.no_llm_cache)
+
+    from benchmark.database import BenchmarkDatabase
+    from benchmark.fakes import LatencyModel, FakeLLM, FakeEmbedder, FakeOpenAIBackend, InMemoryExampleSearch
+    from benchmark.offline import install
+    from benchmark.run import compare
+
+    latency_profile = _latency_profile(args.latency)
+    latency = LatencyModel(latency_profile, args.seed)
+    database = BenchmarkDatabase(database_name, args.tables, args.rows, args.seed)
+    embedder = FakeEmbedder(database.tables)
+    backend = FakeOpenAIBackend(FakeLLM(database.sql_for_question), embedder, latency)
+    install(database, backend, InMemoryExampleSearch(database.examples(), embedder, latency), latency, args.log_level)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "sessions": args.sessions, "questions": args.questions, "tables": args.tables, "rows": args.rows,
+            "latency": args.latency, "latency_profile": latency_profile, "seed": args.seed, "warmup": args.warmup,
+            "semantic_cache": not args.no_semantic_cache, "llm_cache": not args.no_llm_cache,
+        },
+        "runs": asyncio.run(_run(args, database)),
+    }
+
+    retval = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['sessions']} sessions {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']} ({regression['change']:+.1%})")
+        retval = 1 if regressions else 0
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Report written to {args.output}")
+    return retval
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import random
+import sqlite3
+import threading
+import uuid
+
+from app.services.m_schema import MSchema
+
+# Entities of the generated tables, "table_<n>" once they are all used
+_ENTITIES = [
+    "customers", "products", "orders", "invoices", "shipments", "suppliers", "employees", "stores",
+    "payments", "returns", "warehouses", "campaigns", "contracts", "tickets", "projects", "vendors",
+]
+_CATEGORIES = ["retail", "wholesale", "online", "partner", "internal"]
+_REGIONS = ["north", "south", "east", "west", "central"]
+
+_COLUMNS = [
+    ("id", "INTEGER", True),
+    ("name", "TEXT", False),
+    ("category", "TEXT", False),
+    ("region", "TEXT", False),
+    ("amount", "REAL", False),
+    ("quantity", "INTEGER", False),
+    ("created_at", "TEXT", False),
+    ("parent_id", "INTEGER", False),
+]
+
+# Question templates of the workload and their SQL (SQLite dialect). Single table questions: the fake embeddings
+# only bring a question close to the tables it names, one table at a time (see FakeEmbedder)
+_QUESTIONS = [
+    ("How many {table} are there?",
+     "SELECT COUNT(*) AS total FROM {table}"),
+    ("What is the total amount of {table} by region?",
+     "SELECT region, SUM(amount) AS total_amount FROM {table} GROUP BY region ORDER BY total_amount DESC"),
+    ("Which are the top 5 {table} by amount?",
+     "SELECT name, amount FROM {table} ORDER BY amount DESC LIMIT 5"),
+    ("What is the average quantity of {table} per category?",
+     "SELECT category, AVG(quantity) AS average_quantity FROM {table} GROUP BY category"),
+    ("How many {table} were created in each month of 2024?",
+     "SELECT substr(created_at, 1, 7) AS month, COUNT(*) AS total FROM {table} "
+     "WHERE created_at LIKE '2024%' GROUP BY month ORDER BY month"),
+]
+# Few-shot examples: other wordings of the same questions
+_EXAMPLES = [
+    ("Count the {table}", "SELECT COUNT(*) AS total FROM {table}"),
+    ("Total amount of the {table} per region", "SELECT region, SUM(amount) AS total_amount FROM {table} GROUP BY region"),
+    ("List the 10 {table} with the largest amount", "SELECT name, amount FROM {table} ORDER BY amount DESC LIMIT 10"),
+    ("Average quantity of the {table} by category", "SELECT category, AVG(quantity) AS average_quantity FROM {table} GROUP BY category"),
+]
+
+
+def _table_names(count: int) -> list:
+    return [_ENTITIES[i] if i < len(_ENTITIES) else f"table_{i}" for i in range(count)]
+
+
+class BenchmarkDatabase:
+    """
+    Generated SQLite database (in memory, shared by the threads), its M-Schema, the workload questions
+    with their SQL and the few-shot examples. Deterministic for a given seed.
+    """
+
+    def __init__(self, name: str = "bench", tables: int = 8, rows: int = 1000, seed: int = 0):
+        self.name = name
+        self.tables = _table_names(tables)
+        self.rows = rows
+        self.seed = seed
+        self._uri = f"file:{name}-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        # The in-memory database lives as long as one connection is open
+        self._keeper = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        self._local = threading.local()
+        self._populate()
+        self.questions = self._questions()
+
+    def _populate(self):
+        rng = random.Random(self.seed)
+        for index, table in enumerate(self.tables):
+            columns = ", ".join(f"{name} {sql_type}{' PRIMARY KEY' if primary_key else ''}" for name, sql_type, primary_key in _COLUMNS)
+            self._keeper.execute(f"CREATE TABLE {table} ({columns})")
+            rows = [
+                (
+                    i + 1,
+                    f"{table[:-1] if table.endswith('s') else table} {i + 1}",
+                    rng.choice(_CATEGORIES),
+                    rng.choice(_REGIONS),
+                    round(rng.uniform(1, 10000), 2),
+                    rng.randint(1, 500),
+                    f"{rng.choice([2023, 2024, 2025])}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                    rng.randint(1, self.rows) if index > 0 else None,
+                )
+                for i in range(self.rows)
+            ]
+            self._keeper.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(_COLUMNS))})", rows)
+        self._keeper.commit()
+
+    def _questions(self) -> dict:
+        questions = {}
+        for table in self.tables:
+            for question, sql in _QUESTIONS:
+                questions[question.format(table=table)] = sql.format(table=table)
+        return questions
+
+    def examples(self) -> list:
+        return [
+            {"question": question.format(table=table), "sql": sql.format(table=table)}
+            for table in self.tables for question, sql in _EXAMPLES
+        ]
+
+    def sql_for_question(self, question: str) -> str:
+        # Unknown questions (e.g. rewritten by a real prompt) still get a valid query
+        return self.questions.get(question.strip(), f"SELECT COUNT(*) AS total FROM {self.tables[0]}")
+
+    def workload(self, sessions: int, questions_per_session: int, seed: int) -> list:
+        """
+        Questions asked by each session, in order.
+        """
+        rng = random.Random(seed)
+        pool = sorted(self.questions)
+        return [[rng.choice(pool) for _ in range(questions_per_session)] for _ in range(sessions)]
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, as pyodbc would pool them
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def execute(self, sql_query: str, params=()) -> list:
+        cursor = self._connection().execute(sql_query, tuple(params))
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def describe(self, sql_query: str) -> list:
+        """
+        Columns of the query, compiled by SQLite without reading any row. Raises sqlite3.Error when it does not compile.
+        """
+        cursor = self._connection().execute(f"SELECT * FROM ({sql_query}) LIMIT 0")
+        return [{"name": column[0], "type": None, "nullable": True} for column in cursor.description]
+
+    def fetch_one(self, sql_query: str, params=()):
+        return self._connection().execute(sql_query, tuple(params)).fetchone()
+
+    def mschema(self) -> MSchema:
+        """
+        M-Schema of the generated tables, as SchemaEngine builds it from a SQL Server database.
+        """
+        mschema = MSchema(db_id=self.name)
+        for index, table in enumerate(self.tables):
+            mschema.add_table(table)
+            for name, sql_type, primary_key in _COLUMNS:
+                examples = [row[0] for row in self._keeper.execute(f"SELECT DISTINCT {name} FROM {table} WHERE {name} IS NOT NULL LIMIT 3")]
+                mschema.add_field(table, name, sql_type, primary_key=primary_key, nullable=not primary_key, examples=examples)
+            if index > 0:
+                mschema.add_foreign_key(table, "parent_id", None, self.tables[index - 1], "id")
+        return mschema
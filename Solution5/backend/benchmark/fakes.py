@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+from types import SimpleNamespace
+
+from app.services.tracing import tracer
+from app.utils.tokenizer import count_tokens, count_message_tokens
+
+EMBEDDING_DIMENSIONS = 256
+
+# Latency distributions of the fake services: log-normal around median_ms, plus per_token_ms for every generated token
+LATENCY_PROFILES = {
+    "zero": {
+        "chat": {"median_ms": 0, "sigma": 0, "per_token_ms": 0},
+        "embeddings": {"median_ms": 0, "sigma": 0},
+        "search": {"median_ms": 0, "sigma": 0},
+        "db": {"median_ms": 0, "sigma": 0},
+        "db_validate": {"median_ms": 0, "sigma": 0},
+    },
+    "typical": {
+        "chat": {"median_ms": 450, "sigma": 0.35, "per_token_ms": 12},
+        "embeddings": {"median_ms": 60, "sigma": 0.25},
+        "search": {"median_ms": 80, "sigma": 0.3},
+        "db": {"median_ms": 40, "sigma": 0.5},
+        "db_validate": {"median_ms": 5, "sigma": 0.3},
+    },
+    "slow": {
+        "chat": {"median_ms": 1200, "sigma": 0.5, "per_token_ms": 25},
+        "embeddings": {"median_ms": 150, "sigma": 0.4},
+        "search": {"median_ms": 200, "sigma": 0.4},
+        "db": {"median_ms": 150, "sigma": 0.7},
+        "db_validate": {"median_ms": 15, "sigma": 0.5},
+    },
+}
+
+
+class LatencyModel:
+    """
+    Deterministic latencies: the same call (kind and payload) always waits the same time for a given seed.
+    """
+
+    def __init__(self, profile: dict, seed: int = 0):
+        self.profile = profile
+        self.seed = seed
+
+    def seconds(self, kind: str, payload: str, tokens: int = 0) -> float:
+        config = self.profile.get(kind) or {}
+        median_ms = config.get("median_ms", 0)
+        if median_ms <= 0 and not config.get("per_token_ms"):
+            return 0.0
+        rng = random.Random(f"{self.seed}:{kind}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}")
+        latency_ms = median_ms * math.exp(rng.gauss(0, config.get("sigma", 0))) if median_ms > 0 else 0.0
+        return (latency_ms + config.get("per_token_ms", 0) * tokens) / 1000
+
+    def sleep(self, kind: str, payload: str, tokens: int = 0):
+        delay = self.seconds(kind, payload, tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def asleep(self, kind: str, payload: str, tokens: int = 0):
+        delay = self.seconds(kind, payload, tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class FakeEmbedder:
+    """
+    Deterministic bag of words embeddings: texts sharing words are close, as with a real embedding model.
+    The key terms (e.g. the table names) weigh more, so the questions land close to the tables they mention.
+    """
+
+    def __init__(self, key_terms=(), key_weight: float = 20.0):
+        self.key_terms = {term.lower() for term in key_terms}
+        self.key_weight = key_weight
+
+    def embed(self, text: str) -> list:
+        vector = [0.0] * EMBEDDING_DIMENSIONS
+        for word in re.findall(r"\w+", (text or "").lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            weight = self.key_weight if word in self.key_terms else 1.0
+            vector[int.from_bytes(digest[:4], "big") % EMBEDDING_DIMENSIONS] += weight
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+
+def _content(messages: list, role: str) -> str:
+    return next((str(message.get("content") or "") for message in messages if message.get("role") == role), "")
+
+
+class FakeLLM:
+    """
+    Deterministic answers of the chat completions, chosen from the route of the call (the name of the
+    current LLM span: the tool, agent or prompt issuing the call) so each tool gets the format it parses.
+    """
+
+    def __init__(self, sql_for_question, answer_words: int = 60):
+        self.sql_for_question = sql_for_question
+        self.answer_words = answer_words
+
+    def answer(self, messages: list) -> str:
+        span = tracer.current_span()
+        route = span.name if span is not None else ""
+        system = _content(messages, "system")
+        user = _content(messages, "user")
+
+        if "context_selector" in route:
+            return "<context>BUSINESS</context>"
+        if "rewrite_question" in route:
+            return f"<question>{user}</question>"
+        if "KeywordExtractor" in route:
+            question = re.search(r'"(.*)"', system, re.DOTALL)
+            words = re.findall(r"[A-Za-z_]{4,}", question.group(1) if question else system)
+            return ", ".join(dict.fromkeys(words))
+        if system.startswith("You are a SQL Refiner Agent."):
+            question = re.search(r"User question:\n(.*?)\n", user)
+            return f"<FINAL_QUERY>{self.sql_for_question(question.group(1) if question else '')}</FINAL_QUERY>"
+        if "candidate_generator" in route:
+            return (f"<REASONING>Select the columns of the question from the relevant tables.</REASONING>\n"
+                    f"<FINAL_ANSWER>{self.sql_for_question(user)}</FINAL_ANSWER>")
+        if "Answer Generator" in route:
+            words = ["The", "results", "show", "the", "requested", "values", "grouped", "as", "asked."]
+            return " ".join(words[i % len(words)] for i in range(self.answer_words))
+        return "OK"
+
+
+class FakeOpenAIBackend:
+    """
+    Chat completions and embeddings served from FakeLLM and FakeEmbedder, with the configured latencies
+    and the token usage computed by the tokenizer of the application.
+    """
+
+    def __init__(self, llm: FakeLLM, embedder: FakeEmbedder, latency: LatencyModel):
+        self.llm = llm
+        self.embedder = embedder
+        self.latency = latency
+
+    def _completion(self, model: str, messages: list, stream: bool):
+        content = self.llm.answer(messages)
+        usage = SimpleNamespace(
+            prompt_tokens=count_message_tokens(messages, model),
+            completion_tokens=count_tokens(content, model),
+        )
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        if stream:
+            pieces = re.findall(r"\S+\s*", content)
+            return usage, (SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))]) for piece in pieces)
+        message = SimpleNamespace(role="assistant", content=content)
+        return usage, SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
+
+    def _embeddings(self, model: str, input):
+        texts = [input] if isinstance(input, str) else list(input)
+        data = [SimpleNamespace(index=i, embedding=self.embedder.embed(text)) for i, text in enumerate(texts)]
+        tokens = sum(count_tokens(text, model) for text in texts)
+        return SimpleNamespace(data=data, usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+
+    def chat_completion(self, model: str, messages: list, stream: bool = False, **kwargs):
+        usage, parsed = self._completion(model, messages, stream)
+        self.latency.sleep("chat", str(messages), usage.completion_tokens)
+        return _RawResponse(parsed)
+
+    async def achat_completion(self, model: str, messages: list, stream: bool = False, **kwargs):
+        usage, parsed = self._completion(model, messages, stream)
+        await self.latency.asleep("chat", str(messages), usage.completion_tokens)
+        return _RawResponse(parsed)
+
+    def embedding(self, model: str, input, **kwargs):
+        self.latency.sleep("embeddings", str(input))
+        return _RawResponse(self._embeddings(model, input))
+
+    async def aembedding(self, model: str, input, **kwargs):
+        await self.latency.asleep("embeddings", str(input))
+        return _RawResponse(self._embeddings(model, input))
+
+
+class _RawResponse:
+    # Same interface as the responses of with_raw_response.create
+    headers = {}
+
+    def __init__(self, parsed):
+        self._parsed = parsed
+
+    def parse(self):
+        return self._parsed
+
+
+def _resource(create):
+    return SimpleNamespace(with_raw_response=SimpleNamespace(create=create))
+
+
+class FakeOpenAIClient:
+    """Stand-in of AzureOpenAI: chat.completions and embeddings."""
+
+    def __init__(self, backend: FakeOpenAIBackend):
+        self.chat = SimpleNamespace(completions=_resource(backend.chat_completion))
+        self.embeddings = _resource(backend.embedding)
+
+
+class FakeAsyncOpenAIClient:
+    """Stand-in of AsyncAzureOpenAI: chat.completions and embeddings."""
+
+    def __init__(self, backend: FakeOpenAIBackend):
+        self.chat = SimpleNamespace(completions=_resource(backend.achat_completion))
+        self.embeddings = _resource(backend.aembedding)
+
+
+class InMemoryExampleSearch:
+    """
+    Few-shot examples searched by cosine similarity of the question embeddings, same results as AzureSearchService.
+    """
+
+    def __init__(self, examples: list, embedder: FakeEmbedder, latency: LatencyModel):
+        self.latency = latency
+        self.examples = []
+        for i, example in enumerate(examples):
+            self.examples.append({
+                "doc_id": str(i),
+                "question": example["question"],
+                "sql": example["sql"],
+                "question_embedding": embedder.embed(example["question"]),
+                "sql_embedding": embedder.embed(example["sql"]),
+            })
+
+    def find_relevant_examples(self, database: str, question_embedding: list, top_k: int = 5) -> list:
+        self.latency.sleep("search", str(question_embedding[:8]))
+        scored = sorted(
+            self.examples,
+            key=lambda example: -sum(a * b for a, b in zip(example["question_embedding"], question_embedding)),
+        )
+        return [dict(example) for example in scored[:top_k]]
@@ -0,0 +1,105 @@
+import logging
+import os
+import sqlite3
+import time
+
+# Fake values of the secrets read at import time (Azure OpenAI endpoint, blob storage)
+_SECRETS = {
+    "bench-openai-endpoint": "https://bench.openai.azure.com/",
+    "bench-openai-key": "bench",
+    "bench-openai-version": "2024-02-01",
+    "bench-blob-connection-string": "DefaultEndpointsProtocol=https;AccountName=bench;AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net",
+}
+
+
+def setup_environment(database: str, semantic_cache: bool = True, llm_cache: bool = True):
+    """
+    Settings and patches needed before the application modules are imported: they read the settings
+    and the Key Vault secrets, and create the Azure clients, at import time.
+    """
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT_SECRET_NAME": "bench-openai-endpoint",
+        "AZURE_OPENAI_KEY_SECRET_NAME": "bench-openai-key",
+        "AZURE_OPENAI_VERSION_SECRET_NAME": "bench-openai-version",
+        "BLOB_STORAGE_CONNECTION_STRING_SECRET_NAME": "bench-blob-connection-string",
+        "OPENAI_ENDPOINTS": "",
+        "DATABASE_NAME": database,
+        "SESSION_STORE_BACKEND": "memory",
+        "LLM_CACHE_BACKEND": "memory",
+        "SEMANTIC_CACHE_ENABLED": str(semantic_cache).lower(),
+        "LLM_CACHE_ENABLED": str(llm_cache).lower(),
+        # The generated SQL runs on SQLite
+        "SQL_DIALECT": "sqlite",
+    })
+    # Overridable: the client side rate limiting and the exporter are part of what can be measured
+    os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "1000000000")
+    os.environ.setdefault("TRACING_EXPORTER", "none")
+
+    # No Application Insights
+    import app.utils.nb_logger as nb_logger
+    nb_logger.AzureLogHandler = lambda connection_string=None: logging.NullHandler()
+
+    # No Key Vault
+    from app.services.secret_service import SecretService
+    SecretService.get_secret_value = staticmethod(lambda vault_url, secret_name: _SECRETS.get(secret_name, ""))
+
+
+def install(database, backend, search, latency, log_level: str = "ERROR"):
+    """
+    Plug the fakes in the application: SQLite instead of SQL Server, the fake OpenAI clients on every endpoint,
+    the in-memory example search instead of Azure Search, no blob storage for the schema embeddings.
+    """
+    from app.services.db_service import DBHelper, _db_attributes
+    from app.services.azure_search_service import AzureSearchService
+    from app.services.llm.endpoint_pool import endpoint_pool
+    from app.services.tracing import tracer
+    import app.services.embedding_service as embedding_service
+    from benchmark.fakes import FakeOpenAIClient, FakeAsyncOpenAIClient
+
+    # The agents log their prompts and results: far too verbose under load
+    logging.getLogger("app.utils.nb_logger").setLevel(log_level)
+
+    def execute_sql_query(database_name, sql_query, *params):
+        with tracer.span("db executeSQLQuery", "client", _db_attributes("query", database_name, sql_query)) as span:
+            latency.sleep("db", sql_query)
+            results = database.execute(sql_query, params)
+            span.set_attribute("db.rows", len(results))
+        return results
+
+    def execute_and_fetch_one(database_name, sql_query, *params):
+        with tracer.span("db executeAndFetchOne", "client", _db_attributes("query", database_name, sql_query)):
+            latency.sleep("db", sql_query)
+            return database.fetch_one(sql_query, params)
+
+    def validate_sql_query(database_name, sql_query, mode=None):
+        with tracer.span("db validateSQLQuery", "client", _db_attributes("validate", database_name, sql_query)) as span:
+            start = time.perf_counter()
+            latency.sleep("db_validate", sql_query)
+            try:
+                columns, error = database.describe(sql_query), None
+            except sqlite3.Error as e:
+                columns, error = [], str(e)
+            span.set_attribute("db.valid", error is None)
+        return {"valid": error is None, "columns": columns, "error": error, "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    DBHelper.executeSQLQuery = staticmethod(execute_sql_query)
+    DBHelper.validateSQLQuery = staticmethod(validate_sql_query)
+    DBHelper.executeAndFetchOne = staticmethod(execute_and_fetch_one)
+    DBHelper.getConnectionString = staticmethod(lambda database_name: f"Database={database.name};")
+    DBHelper.getDBName = staticmethod(lambda database_name: database.name)
+    DBHelper._mschemas[database.name] = database.mschema()
+
+    AzureSearchService.find_relevant_examples = staticmethod(
+        lambda database_name, question_embedding, top_k=5: search.find_relevant_examples(database_name, question_embedding, top_k)
+    )
+
+    # Schema embeddings computed on first use, kept in memory only
+    embedding_service.load_from_blob = lambda database_name: None
+    embedding_service.save_to_blob = lambda database_name, data: None
+    embedding_service.get_embedding_from_blob = lambda database_name, name: None
+    embedding_service.save_embedding_to_blob = lambda database_name, name, text, embedding: None
+
+    for endpoint in endpoint_pool.endpoints:
+        endpoint.client = FakeOpenAIClient(backend)
+        endpoint._async_client = FakeAsyncOpenAIClient(backend)
@@ -0,0 +1,141 @@
+import asyncio
+import gc
+import resource
+import time
+import tracemalloc
+
+from app.services.tracing import tracer, percentile
+from app.services.session_store import session_store
+from function_texttosql.ai_bot import nl_to_sql
+
+# Compared with the baseline: (section, key, True when higher is better). Memory is reported only, too noisy to compare
+_COMPARED = [
+    ("summary", "latency_p95_ms", False),
+    ("summary", "latency_p50_ms", False),
+    ("summary", "throughput_qps", True),
+    ("tokens", "prompt_tokens_per_question", False),
+]
+
+
+def _rss_mb() -> float:
+    # Current resident set size (Linux), peak one elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _session(name: str, questions: list, database: str, latencies: list, failures: list):
+    # The questions of a session are asked one after the other, as a user would
+    for question in questions:
+        start_time = time.perf_counter()
+        try:
+            await nl_to_sql(question, name, "bench-user", database)
+        except Exception as e:
+            failures.append(f"{type(e).__name__}: {e}")
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+
+def _tokens(stages: dict, questions: int) -> dict:
+    # Prompt (input) and completion tokens of the LLM calls, per route (span "llm chat <route>")
+    routes = {}
+    for name, stage in stages.items():
+        if name.startswith("llm ") and "tokens" in stage:
+            routes[name[4:]] = stage["tokens"]
+    prompt_tokens = sum(route["input_tokens"] for name, route in routes.items() if name.startswith("chat "))
+    completion_tokens = sum(route["output_tokens"] for name, route in routes.items() if name.startswith("chat "))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "prompt_tokens_per_question": round(prompt_tokens / questions, 1) if questions else 0,
+        "routes": routes,
+    }
+
+
+async def run_level(database, sessions: int, questions_per_session: int, seed: int, trace_memory: bool = False) -> dict:
+    """
+    Run the workload with the given number of concurrent sessions and report latencies, throughput,
+    per stage metrics, token usage and memory growth.
+    """
+    workload = database.workload(sessions, questions_per_session, seed)
+    latencies, failures = [], []
+
+    tracer.reset()
+    gc.collect()
+    rss_start = _rss_mb()
+    if trace_memory:
+        tracemalloc.start()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(
+        _session(f"c{sessions}-s{i}", questions, database.name, latencies, failures)
+        for i, questions in enumerate(workload)
+    ))
+    wall_seconds = time.perf_counter() - start_time
+
+    memory = {}
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory.update({"traced_growth_mb": round(current / 2**20, 3), "traced_peak_mb": round(peak / 2**20, 3)})
+    gc.collect()
+    rss_end = _rss_mb()
+    memory.update({
+        "rss_start_mb": round(rss_start, 1),
+        "rss_end_mb": round(rss_end, 1),
+        "rss_growth_mb": round(rss_end - rss_start, 1),
+        "sessions_stored": len(session_store.backend) if hasattr(session_store.backend, "__len__") else None,
+    })
+
+    metrics = tracer.metrics()
+    questions = len(latencies)
+    sorted_latencies = sorted(latencies)
+    return {
+        "sessions": sessions,
+        "summary": {
+            "questions": questions,
+            "failed": len(failures),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_qps": round(questions / wall_seconds, 3) if wall_seconds else 0,
+            "latency_avg_ms": round(sum(latencies) / questions, 3) if questions else 0,
+            "latency_p50_ms": percentile(sorted_latencies, 50),
+            "latency_p95_ms": percentile(sorted_latencies, 95),
+            "latency_p99_ms": percentile(sorted_latencies, 99),
+            "latency_max_ms": round(max(latencies), 3) if latencies else 0,
+        },
+        "errors": sorted(set(failures))[:10],
+        "stages": metrics["stages"],
+        "tokens": _tokens(metrics["stages"], questions),
+        "memory": memory,
+    }
+
+
+async def warm_up(database, questions: int, seed: int):
+    # Schema embeddings, prompt templates, tokenizer encodings: loaded once per process
+    for i, question in enumerate(database.workload(1, questions, seed)[0]):
+        await nl_to_sql(question, f"warmup-{i}", "bench-user", database.name)
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Regressions of the report against the baseline, beyond the relative tolerance.
+    """
+    regressions = []
+    previous_runs = {run["sessions"]: run for run in baseline.get("runs", [])}
+    for run in report["runs"]:
+        previous = previous_runs.get(run["sessions"])
+        if previous is None:
+            continue
+        for section, key, higher_is_better in _COMPARED:
+            current = run.get(section, {}).get(key)
+            reference = previous.get(section, {}).get(key)
+            if current is None or reference is None or reference <= 0:
+                continue
+            change = (current - reference) / reference
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append({
+                    "sessions": run["sessions"], "metric": f"{section}.{key}",
+                    "baseline": reference, "current": current, "change": round(change, 3),
+                })
+    return regressions
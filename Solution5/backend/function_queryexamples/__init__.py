@@ -1,5 +1,11 @@
+import asyncio
+import codecs
+import csv
+import io
+import json
 import azure.functions as func 
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from app.utils.nb_logger import NBLogger
 from app.context import get_current_user
@@ -7,6 +13,7 @@ from app.utils.cors_helper import CORSHelper
 from app.services.db_service import DBHelper
 from app.services.search_service import SearchService
 from app.utils.connection_string_parser import ConnectionStringParser
+from app.settings import EXAMPLES_UPLOAD_BATCH_SIZE, EXAMPLES_PAGE_SIZE
 
 
 logger = NBLogger().Log()
@@ -46,16 +53,36 @@ async def add_example(req: Request,body: ExampleRequest):
         return Response(content="Failed to add example", status_code=500)
 
 @fast_app.get("/queryexamples/examples")
-async def list_examples(req: Request,database: str = "default"):
+async def list_examples(req: Request,database: str = "default", page_size: int = EXAMPLES_PAGE_SIZE, continuation_token: str = None):
     user = await get_current_user(req)
     try:
         logger.info(f"Listing examples for database: {database}")
-        examples = SearchService.get_examples(database)
-        return {"examples": examples}
+        page = SearchService.get_examples(database, page_size, continuation_token)
+        return {"examples": page["examples"], "continuation_token": page["continuation_token"]}
     except Exception as e:
         logger.error(f"Error listing examples: {str(e)}")
         return Response(content="Failed to list examples", status_code=500)
 
+def _iter_example_lines(database: str, page_size: int):
+    """
+    All the examples of a database as JSON lines, fetching one page at a time.
+    """
+    try:
+        for example in SearchService.iter_examples(database, page_size):
+            yield json.dumps(example) + "\n"
+    except Exception as e:
+        # The response is already started: the truncated listing is only reported in the logs
+        logger.error(f"Error streaming examples of database {database}: {str(e)}")
+
+@fast_app.get("/queryexamples/examples/stream")
+async def stream_examples(req: Request, database: str = "default", page_size: int = 1000):
+    """
+    Stream all the examples of a database as NDJSON, one example per line, fetching one page at a time.
+    """
+    user = await get_current_user(req)
+    logger.info(f"Streaming examples for database: {database}")
+    return StreamingResponse(_iter_example_lines(database, page_size), media_type="application/x-ndjson")
+
 
 @fast_app.delete("/queryexamples/delete_example")
 async def delete_example(req: Request,doc_id: str, database: str = "default"):
@@ -92,6 +119,140 @@ async def update_example(req: Request, body: ExampleRequest):
         logger.error(f"Error updating example: {str(e)}")
         return Response(content="Failed to update example", status_code=500)
 
+async def _iter_upload_lines(req: Request):
+    """
+    Yield the lines of the uploaded body as they are received, without buffering the whole file.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in req.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+async def _iter_upload_records(req: Request, format: str):
+    """
+    Parse the uploaded JSONL or CSV body into (line number, record) tuples.
+    CSV records can span several lines when a quoted field (typically the SQL) contains new lines.
+    A JSONL line that is not valid JSON is yielded with its json.JSONDecodeError as record.
+    """
+    header = None
+    pending = ""
+    line_number = 0
+    async for line in _iter_upload_lines(req):
+        line_number += 1
+        if format == "jsonl":
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    record = e
+                yield line_number, record
+            continue
+
+        pending = pending + "\n" + line if pending else line
+        if pending.count('"') % 2 != 0:
+            # Quoted field still open: wait for the next line
+            continue
+        row = next(csv.reader(io.StringIO(pending)), [])
+        pending = ""
+        if not row:
+            continue
+        if header is None:
+            header = [column.strip().lower() for column in row]
+            continue
+        yield line_number, dict(zip(header, row))
+
+    if pending:
+        raise ValueError(f"Unterminated quoted field at line {line_number}")
+
+async def _read_examples_upload(req: Request, format: str, databaseName: str):
+    """
+    Read the streamed upload, returning the valid examples and the rejected lines.
+    The examples without doc_id get a deterministic one: uploading the same file again does not duplicate them.
+    """
+    examples = []
+    rejected = []
+    async for line_number, record in _iter_upload_records(req, format):
+        if isinstance(record, json.JSONDecodeError):
+            rejected.append({"line": line_number, "error": f"invalid JSON: {record.msg} (column {record.colno})"})
+            continue
+        question = str(record.get("question") or "").strip() if isinstance(record, dict) else ""
+        sql = str(record.get("sql") or "").strip() if isinstance(record, dict) else ""
+        if not question or not sql:
+            rejected.append({"line": line_number, "error": "question and sql are required"})
+            continue
+        doc_id = str(record.get("doc_id") or "").strip() or SearchService.example_doc_id(databaseName, question, sql)
+        examples.append({"doc_id": doc_id, "question": question, "sql": sql})
+    return examples, rejected
+
+@fast_app.post("/queryexamples/bulk_add")
+async def bulk_add_examples(req: Request, database: str = "default", format: str = "jsonl"):
+    """
+    Add examples in bulk from a JSONL or CSV upload (fields: question, sql and optionally doc_id).
+    The progress is streamed back as NDJSON events, the failed examples are reported by doc_id
+    (generated from the database, question and sql when missing: see SearchService.example_doc_id).
+    """
+    user = await get_current_user(req)
+    format = format.lower()
+    if format not in ("jsonl", "csv"):
+        return Response(content="Unsupported format, use jsonl or csv", status_code=400)
+
+    try:
+        databaseName = await asyncio.to_thread(DBHelper.getDBName, database)
+    except Exception as e:
+        logger.error(f"Error resolving database {database}: {str(e)}")
+        return Response(content="Failed to add examples", status_code=500)
+
+    try:
+        examples, rejected = await _read_examples_upload(req, format, databaseName)
+    except Exception as e:
+        logger.error(f"Error reading examples upload: {str(e)}")
+        return Response(content=f"Invalid {format} upload: {str(e)}", status_code=400)
+
+    logger.info(f"Bulk adding {len(examples)} examples to database: {database}")
+
+    async def progress():
+        total = len(examples)
+        uploaded = 0
+        failed_doc_ids = []
+        yield json.dumps({"event": "received", "total": total, "rejected": rejected}) + "\n"
+
+        for start in range(0, total, EXAMPLES_UPLOAD_BATCH_SIZE):
+            batch = examples[start:start + EXAMPLES_UPLOAD_BATCH_SIZE]
+            try:
+                result = await asyncio.to_thread(SearchService.add_examples_bulk, database, batch)
+                uploaded += result["uploaded"]
+                failed_doc_ids.extend(result["failed_doc_ids"])
+            except Exception as e:
+                logger.error(f"Error adding examples batch: {str(e)}")
+                batch_doc_ids = [example["doc_id"] for example in batch]
+                failed_doc_ids.extend(batch_doc_ids)
+                yield json.dumps({"event": "error", "error": "Failed to add examples batch", "batch_size": len(batch), "failed_doc_ids": batch_doc_ids}) + "\n"
+
+            yield json.dumps({"event": "progress", "processed": min(start + len(batch), total), "total": total, "uploaded": uploaded}) + "\n"
+
+        yield json.dumps({"event": "done", "total": total, "uploaded": uploaded, "failed": total - uploaded, "failed_doc_ids": failed_doc_ids}) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+@fast_app.get("/queryexamples/export")
+async def export_examples(req: Request, database: str = "default", page_size: int = 1000):
+    """
+    Stream all the examples of a database as JSONL, in the format accepted by /queryexamples/bulk_add.
+    """
+    user = await get_current_user(req)
+    logger.info(f"Exporting examples for database: {database}")
+    return StreamingResponse(
+        _iter_example_lines(database, page_size),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{database}-examples.jsonl"'}
+    )
+
 async def main(req: func.HttpRequest, context: func.Context) -> func.HttpResponse:
     return await func.AsgiMiddleware(fast_app).handle_async(req, context)
 
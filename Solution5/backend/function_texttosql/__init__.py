@@ -1,12 +1,20 @@
+import json
+from typing import Dict
 import azure.functions as func 
 from fastapi import FastAPI, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from function_texttosql.ai_bot import nl_to_sql,  get_graph_png
+from function_texttosql.ai_bot import nl_to_sql, nl_to_sql_stream, get_graph_png
 from app.utils.nb_logger import NBLogger
 from app.context import get_current_user
 from app.utils.cors_helper import CORSHelper
 from app.services.db_service import DBHelper
 from app.services.search_service import SearchService
+from app.services.llm.openai_service import OpenAIService
+from app.services.tracing import tracer
+from function_texttosql.agents.information_retriever.speculative_prefetch import speculative_prefetch
+from function_texttosql.agents.information_retriever.follow_up import follow_up_detector
 from app.utils.connection_string_parser import ConnectionStringParser
 
 
@@ -29,6 +37,7 @@ class QueryRequest(BaseModel):
     query: str
     session_id: str
     database: str = "default"
+    model_routes: Dict[str, str] = {}  # Optional overrides of the model routing: tool or prompt name -> deployment
 
 class QueryResponse(BaseModel):
     chart_type: str
@@ -36,6 +45,21 @@ class QueryResponse(BaseModel):
 
 
 
+def _to_response(result: dict) -> dict:
+    if result["chart_type"] is None:
+        result["chart_type"] = "None"
+
+    return {
+        "results": result["response"],
+        "chart_type": result["chart_type"],
+        "answer": result["answer"],
+        "sql_query": result["sql_query"],
+        "execution_history": result["execution_history"],
+        "mermaid": result["mermaid"],
+        "reasoning": result["reasoning"],
+        "trace_id": result.get("trace_id")
+    }
+
 @fast_app.post("/texttosql/query")
 async def query(req: Request, body: QueryRequest):
     user = await get_current_user(req)
@@ -47,19 +71,66 @@ async def query(req: Request, body: QueryRequest):
     logger.info(f"Connection string: {connection_string}")
 
     logger.info(f"query called with the following parameters: query={query}; session_id={session_id}")
-    result = await nl_to_sql(query, session_id, user["oid"], database)
-    if result["chart_type"] is None:
-        result["chart_type"] = "None"
+    result = await nl_to_sql(query, session_id, user["oid"], database, body.model_routes)
+    return _to_response(result)
 
-    return {
-        "results": result["response"],
-        "chart_type": result["chart_type"],
-        "answer": result["answer"],
-        "sql_query": result["sql_query"],
-        "execution_history": result["execution_history"],
-        "mermaid": result["mermaid"],
-        "reasoning": result["reasoning"]
-    }
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@fast_app.post("/texttosql/query/stream")
+async def query_stream(req: Request, body: QueryRequest):
+    """
+    Same as /texttosql/query, streamed as server-sent events while the agents make progress:
+    context, question, tables, sql, rows, answer_token (one per piece of the answer) and finally result.
+    """
+    user = await get_current_user(req)
+    logger.info(f"query/stream called with the following parameters: query={body.query}; session_id={body.session_id}")
+
+    async def events():
+        try:
+            async for event, data in nl_to_sql_stream(body.query, body.session_id, user["oid"], body.database, body.model_routes):
+                if event == "result":
+                    data = _to_response(data)
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
+            yield _sse("error", {"error": "Failed to process the query"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@fast_app.get("/texttosql/llm_cache/metrics")
+async def get_llm_cache_metrics(req: Request):
+    user = await get_current_user(req)
+    return {"llm_cache": OpenAIService.cache_metrics()}
+
+@fast_app.get("/texttosql/rate_limit/metrics")
+async def get_rate_limit_metrics(req: Request):
+    user = await get_current_user(req)
+    return {"rate_limit": OpenAIService.rate_limit_metrics()}
+
+@fast_app.get("/texttosql/model_routes/metrics")
+async def get_model_routes_metrics(req: Request):
+    user = await get_current_user(req)
+    return {"model_routes": OpenAIService.route_metrics()}
+
+@fast_app.get("/texttosql/metrics")
+async def get_metrics(req: Request):
+    """
+    Per stage (agent, tool, LLM call, database query): latency histogram, p50/p95/p99 and tokens per call.
+    prefetch: speculative retrieval results reused or discarded, per stage.
+    follow_up: questions that reused the tables and examples of the previous turn, and new questions.
+    """
+    user = await get_current_user(req)
+    return {**tracer.metrics(), "prefetch": speculative_prefetch.metrics(), "follow_up": follow_up_detector.metrics()}
+
+@fast_app.get("/texttosql/openai/endpoints")
+async def get_openai_endpoints(req: Request):
+    user = await get_current_user(req)
+    return {"endpoints": OpenAIService.endpoint_status()}
 
 @fast_app.get("/texttosql/graph.png")
 async def get_graph_image():
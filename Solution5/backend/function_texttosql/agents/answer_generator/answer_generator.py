@@ -1,7 +1,10 @@
 from function_texttosql.agents.conversation_state import ConversationState
-import tiktoken
 import json
 from function_texttosql.agents.core.agent import AgentBase
+from function_texttosql.agents.core.event_stream import EventStream
+from app.services.llm.token_budget import TokenBudget
+from app.utils.tokenizer import count_tokens
+from app.settings import ANSWER_MAX_RESULT_TOKENS
 
 
 class AnswerGeneratorAgent(AgentBase[ConversationState]):
@@ -18,8 +21,8 @@ class AnswerGeneratorAgent(AgentBase[ConversationState]):
         token_count = self.count_tokens(query_result)
 
         self.logger.info(f"Token count for query result: {token_count}")
-        if token_count > 1100:
-            answer = str("The result is too large to display. Please refine your question.")
+        if token_count > ANSWER_MAX_RESULT_TOKENS:
+            state["answer"] = str("The result is too large to display. Please refine your question.")
         else:
             
             result_str = str(query_result)
@@ -34,22 +37,30 @@ class AnswerGeneratorAgent(AgentBase[ConversationState]):
             
             system_prompt = self.promptManager.create_prompt("answer_prompt").format( user_question = user_question ,result_data=result_str)
 
-            answer = self.call_llm(system_prompt, "")
+            token_budget = TokenBudget()
+            if token_budget.measure("answer_prompt", system_prompt) > token_budget.budget:
+                state["answer"] = str("The result is too large to display. Please refine your question.")
+                return state
+
+            if EventStream.is_streaming(state.get("request_id", "")):
+                answer = self.call_llm_stream(system_prompt, "", lambda token: self.emit_event(state, "answer_token", {"token": token}))
+            else:
+                answer = self.call_llm(system_prompt, "")
             
             
             state["answer"] = answer
         
         return state
 
-    def count_tokens(data, model_name='gpt-3.5-turbo'):
+    def count_tokens(self, data, model_name='gpt-3.5-turbo'):
         
         try:
             # text = json.dumps(data, default=str)
             text = str(data)
-            encoding = tiktoken.encoding_for_model(model_name)
-            return len(encoding.encode(text))
+            # Large results are estimated, they would be refused anyway
+            return count_tokens(text, model_name)
         except Exception as e:
-            
+            self.logger.warning(f"Token count failed: {e}")
             return 0
     
 
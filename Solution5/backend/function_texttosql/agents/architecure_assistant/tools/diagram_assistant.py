@@ -1,5 +1,5 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
 
 import tempfile
 import subprocess
@@ -10,16 +10,15 @@ import os
 
 class DiagramAssitant(BaseTool[ConversationState]):
 
-    result = ""
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
         """
         Run the diagram assistant.
         """
         
         prompt = self.promptManager.create_prompt("diagram_assistant").format()
-        self.result = self.call_llm(prompt, state["question"])
-        diagram = self.extract_result(self.result, "diagram")
-        answer = self.extract_result(self.result, "answer")
+        context.result = self.call_llm(prompt, state["question"])
+        diagram = self.extract_result(context.result, "diagram")
+        answer = self.extract_result(context.result, "answer")
 
         self.logger.warning(f"Diagram: {diagram}")
 
@@ -31,5 +30,5 @@ class DiagramAssitant(BaseTool[ConversationState]):
 
         return state
 
-    def get_run_updates(self, state: ConversationState) -> dict:
-        return {"result":self.result}      
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        return {"result":context.result}      
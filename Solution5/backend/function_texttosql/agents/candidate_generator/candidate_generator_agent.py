@@ -5,6 +5,7 @@ from function_texttosql.agents.candidate_generator.tools.devide_and_conquer impo
 from function_texttosql.agents.candidate_generator.tools.executor_planner import ExecutorPlanner
 from function_texttosql.agents.candidate_generator.tools.generate_sql_node_simple import GenerateSQLSimple
 from function_texttosql.agents.candidate_generator.tools.candidate_generator_tool import CandidateGeneratorTool
+from function_texttosql.agents.semantic_cache.tools.semantic_cache_store_tool import SemanticCacheStoreTool
 
 
 
@@ -19,6 +20,7 @@ class CandidateGeneratorAgent(AgentBase[ConversationState]):
         #self.register_tool("Executor Planner", ExecutorPlanner())
         #self.register_tool("Generate SQL Node Simple", GenerateSQLSimple())
         self.register_tool("Candidate Generator Tool", CandidateGeneratorTool())
+        self.register_tool("Semantic Cache Store", SemanticCacheStoreTool())
 
 
     def get_run_updates(self, state: ConversationState) -> dict:
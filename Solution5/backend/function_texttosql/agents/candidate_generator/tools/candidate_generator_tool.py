@@ -1,8 +1,11 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
-from app.settings import ROWS_LIMIT
-from function_texttosql.agents.candidate_generator.tools.utils import Utils
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
+from app.settings import ROWS_LIMIT, SQL_STATIC_VALIDATION_ENABLED, SQL_DRY_RUN_ENABLED, PLAN_OPTIMIZATION_ENABLED
 from app.services.db_service import DBHelper
+from app.services.sql_validator import SQLValidator
+from app.services.sql_rewriter import SQLRewriter, SQLRewriteError
+from app.services.llm.token_budget import TokenBudget
+from function_texttosql.agents.candidate_generator.tools.executor_planner import ExecutorPlanner
 
 
 _REFINE_SYSTEM_PROMPT = (
@@ -22,22 +25,24 @@ class CandidateGeneratorTool(BaseTool[ConversationState]):
     Easy way to generate SQL query to answer the question.
     """
 
-    # TODO: the values before need to be per user , otherwise will be shared between them and produce wrong/mixed results
-    sql_query = ""
-    chart_type = ""
-    reasoning = ""
-    with_refined = False
+    def __init__(self, name = "", description = ""):
+        super().__init__(name, description)
+        # Cheaper equivalent rewrite of the checked candidate, before it is executed
+        self.executor_planner = ExecutorPlanner() if PLAN_OPTIMIZATION_ENABLED else None
 
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
 
         database = state["database"] 
         user_question = state["question"]
         relevant_schema = state["relevant_schema"] 
         examples = state["examples"]
-        self.candidates_tried = 0
-        self.sql_query = ""
-        self.reasoning = ""
-        self.with_refined = False
+        context.candidates_tried = 0
+        context.sql_query = ""
+        context.reasoning = ""
+        context.with_refined = False
+        context.static_errors = 0
+        context.dry_runs = 0
+        context.optimization = {}
 
         if(relevant_schema == None or relevant_schema == ""):
             state["command"] = "NO-SCHEMA"
@@ -45,49 +50,101 @@ class CandidateGeneratorTool(BaseTool[ConversationState]):
         else:
             state["command"] = "CONTINUE"
 
-            example_str = Utils.get_example_str(examples)
+            relevant_tables = state.get("relevant_tables") or {"schema": relevant_schema}
+            token_budget = TokenBudget()
 
-            self.reasoning = ""
             candidate_steps = ["1_generate_candidate", "2_generate_candidate", "3_generate_candidate"]
 
             for step in candidate_steps:
-                self.candidates_tried += 1
-                system_prompt = self.promptManager.create_prompt(step).format(rows_limit =  ROWS_LIMIT ,examples=example_str, database_schema=relevant_schema, user_question = user_question)
+                context.candidates_tried += 1
+                system_prompt = token_budget.fit(step, self.promptManager.create_prompt(step), examples, relevant_tables, rows_limit = ROWS_LIMIT, user_question = user_question)
                 self.logger.warning(f"System Prompt {step}: {system_prompt}")
                 result = self.call_llm( system_prompt, user_question)
                 self.logger.warning(f"Result {step}: {result}")
-                self.sql_query = self.extract_result(result,"FINAL_ANSWER")
+                context.sql_query = self.extract_result(result,"FINAL_ANSWER")
                 current_reasoning = self.extract_result(result,"REASONING")
                 #self.reasoning += "----------\n\n" + current_reasoning + "\n\n"
                 #self.reasoning += "- SQL Query:\n" + self.sql_query+ "\n\n\n\n"
-                #state["reasoning"] = self.reasoning
-                if(self.sql_query and self.sql_query.strip() != ""):
-                    try:
-                        results = DBHelper().executeSQLQuery(database= database, sql_query=self.sql_query)
-                    except Exception as e:
-                        self.logger.error(f"Error executing SQL: {str(e)}")
-                        self.sql_query = self.refine_candidate(state, self.sql_query, str(e))
-                        self.with_refined = True
-                        try:
-                            results = DBHelper().executeSQLQuery(database= database, sql_query=self.sql_query)
-                        except Exception as e:
-                            state["output"] = "error"
-                            state["error"] = f"Error executing SQL: {str(e)}"
-                            self.logger.error(f"Error executing SQL: {str(e)}")
-                            results = None
-                    
+                #state["reasoning"] = context.reasoning
+                if(context.sql_query and context.sql_query.strip() != ""):
+                    results = self.execute_candidate(state, context)
+
                     if results is not None :
                         self.logger.warning(f"Results: {results}")
                         state["query_result"] = results
-                        state["sql_query"] = self.sql_query
+                        state["sql_query"] = context.sql_query
                         state["chart_type"] = "bar"
-                        self.reasoning = current_reasoning
+                        context.reasoning = current_reasoning
                         state["reasoning"] = current_reasoning
+                        self.emit_event(state, "sql", {"sql_query": context.sql_query})
+                        self.emit_event(state, "rows", {"rows": results})
                         break
         return state
     
 
 
+    def execute_candidate(self, state: ConversationState, context: ToolContext):
+        """
+        Execute the candidate SQL query, refined once when it is invalid. The candidate is first checked without
+        executing it (M-Schema, then compiled on the server): only the selected candidate actually runs and the
+        errors found go straight to the refine. None when it still fails.
+        """
+        database = state["database"]
+        refined = False
+        while True:
+            error_message = self.check_candidate(database, context)
+            if not error_message:
+                try:
+                    return self.run_candidate(state, context)
+                except Exception as e:
+                    self.logger.error(f"Error executing SQL: {str(e)}")
+                    error_message = f"Error executing SQL: {str(e)}"
+            if refined:
+                state["output"] = "error"
+                state["error"] = error_message
+                return None
+            context.sql_query = self.refine_candidate(state, context.sql_query, error_message)
+            context.with_refined = refined = True
+
+    def run_candidate(self, state: ConversationState, context: ToolContext):
+        """Execute the checked candidate, or its cheaper equivalent rewrite with the plan optimization."""
+        database = state["database"]
+        if self.executor_planner is not None:
+            planner_context = ToolContext(self.executor_planner.tool_name, state.get("user_session", ""))
+            sql_query, results = self.executor_planner.optimize(state, planner_context, context.sql_query)
+            context.optimization = self.executor_planner.report(planner_context)
+            context.sql_query = sql_query
+            if results is not None:
+                return results
+        return DBHelper().executeSQLQuery(database= database, sql_query=context.sql_query)
+
+    def check_candidate(self, database: str, context: ToolContext) -> str:
+        """Error of the candidate SQL query found without executing it, empty when none."""
+        try:
+            # Capped to the rows limit, one read-only query
+            context.sql_query = SQLRewriter.rewrite(context.sql_query)
+        except SQLRewriteError as e:
+            self.logger.warning(f"SQL refused, not executed: {str(e)}")
+            return f"SQL refused: {str(e)}"
+        if SQL_STATIC_VALIDATION_ENABLED:
+            errors = SQLValidator.validate(database, context.sql_query)
+            context.static_errors += len(errors)
+            if errors:
+                self.logger.warning(f"Invalid SQL, not executed: {errors}")
+                return "Invalid SQL: " + "\n".join(errors)
+        if SQL_DRY_RUN_ENABLED:
+            try:
+                validation = DBHelper.validateSQLQuery(database, context.sql_query)
+            except Exception as e:
+                # The execution reports the error, if any
+                self.logger.warning(f"SQL dry run skipped: {str(e)}")
+                return ""
+            context.dry_runs += 1
+            if not validation["valid"]:
+                self.logger.warning(f"SQL does not compile, not executed: {validation['error']}")
+                return f"Error compiling SQL: {validation['error']}"
+        return ""
+
     def refine_candidate(self,state: ConversationState, candidate: str, error_message: str = "") -> str:
         """Refine one candidate SQL query using error clues and context."""
         schema = state["relevant_schema"] 
@@ -109,6 +166,6 @@ class CandidateGeneratorTool(BaseTool[ConversationState]):
         self.logger.warning(f"Refined SQL query: {sql_query}")
         return sql_query
     
-    def get_run_updates(self, state: ConversationState) -> dict:
-        withRefined = "Yes" if self.with_refined else "No"
-        return {"Number of candidates tempted": self.candidates_tried , "With refine": withRefined }    
\ No newline at end of file
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        withRefined = "Yes" if context.with_refined else "No"
+        return {"Number of candidates tempted": context.candidates_tried , "With refine": withRefined, "Static validation errors": context.static_errors, "Dry runs": context.dry_runs, "Plan optimization": context.optimization }    
\ No newline at end of file
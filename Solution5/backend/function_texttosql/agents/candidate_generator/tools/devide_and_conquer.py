@@ -1,7 +1,16 @@
+import contextvars
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
-from app.settings import ROWS_LIMIT
-from function_texttosql.agents.candidate_generator.tools.utils import Utils
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
+from app.settings import ROWS_LIMIT, SUB_QUESTION_MAX_CONCURRENCY
+from app.services.llm.token_budget import TokenBudget
+from app.services.tracing import tracer
+
+# "2. What is ... ? [depends on: 1]": number, sub-question and the earlier sub-questions it needs
+_SUB_QUESTION_PATTERN = re.compile(r"^\s*(?:(\d+)\s*[.):-]\s*)?(.*?)\s*(?:\[\s*depends on\s*:?\s*([^\]]*)\])?\s*$", re.IGNORECASE)
 
 
 
@@ -9,20 +18,21 @@ class DevideAndConquer(BaseTool[ConversationState]):
     """
     Use Devide and Conquer to generate the sql query to answer the question.
     """
-    history = {}
-    def run(self, state: ConversationState) -> ConversationState:
+    cache_llm_responses = True
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
 
-        db_schema = state['relevant_schema']
+        db_schema = state.get("relevant_tables") or {"schema": state['relevant_schema']}
         examples = state['examples']
         user_question = state["question"]
+        context.history = {}
 
         #  DEVIDE AND CONQUER STRATEGY
         # ----------------------------------------
         # Step 1: Decompose the question
-        sub_questions = self.decompose_question(examples, db_schema, user_question)
+        sub_questions = self.decompose_question(context, examples, db_schema, user_question)
 
         #Step 2: Generate partial SQL queries
-        partial_sqls = self.generate_partial_sql(examples, db_schema, user_question, sub_questions)
+        partial_sqls = self.generate_partial_sql(context, examples, db_schema, user_question, sub_questions)
 
         # Step 3: Assemble the final SQL query
         final_sql = self.assemble_final_query(examples, db_schema, user_question, sub_questions, partial_sqls)
@@ -46,46 +56,104 @@ class DevideAndConquer(BaseTool[ConversationState]):
         return state
 
     
-    def get_run_updates(self, state: ConversationState) -> dict:
-        self.history["Final query"] = state["sql_query"]
-        return self.history
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        context.history["Final query"] = state["sql_query"]
+        return context.history
     
-    def decompose_question(self,examples, db_schema, user_question):
-        self.history["question decomposed"] = user_question
-        examples_str = Utils.get_example_str(examples)
-        prompt = self.promptManager.create_prompt("decompose_question").format(db_schema=db_schema, examples=examples_str, user_question=user_question)
+    def decompose_question(self, context: ToolContext, examples, db_schema, user_question):
+        """
+        Sub-questions of the question, with the indexes of the earlier sub-questions each one depends on.
+        """
+        context.history["question decomposed"] = user_question
+        prompt = TokenBudget().fit("decompose_question", self.promptManager.create_prompt("decompose_question"), examples, db_schema,
+                                   schema_variable="db_schema", user_question=user_question)
         response = self.call_llm(prompt,"" ) 
-        sub_questions = response.split('\n')
+        sub_questions = self.parse_sub_questions(response)
         self.logger.warning(f"Sub-questions: {sub_questions}")
-        return [sq.strip() for sq in sub_questions if sq.strip()]
+        return sub_questions
+
+    def parse_sub_questions(self, response: str) -> list:
+        # [{"question", "depends_on"}]: depends_on holds 0-based indexes of earlier sub-questions only, so the graph has no cycle.
+        # Without the dependency annotation a sub-question depends on all the previous ones, as it used to
+        sub_questions = []
+        numbers = {}
+        for line in response.split('\n'):
+            match = _SUB_QUESTION_PATTERN.match(line)
+            if not match or not match.group(2).strip():
+                continue
+            number, question, dependencies = match.groups()
+            index = len(sub_questions)
+            if number:
+                numbers[number] = index
+            if dependencies is None:
+                depends_on = list(range(index))
+            else:
+                depends_on = sorted({numbers[d] for d in re.findall(r"\d+", dependencies) if d in numbers and numbers[d] < index})
+            sub_questions.append({"question": question.strip(), "depends_on": depends_on})
+        return sub_questions
+
+    def generate_partial_sql(self, context: ToolContext, examples, db_schema, user_question, sub_questions):
+        """
+        Partial SQL of every sub-question. A sub-question starts as soon as the ones it depends on are done,
+        independent ones are generated in parallel (at most SUB_QUESTION_MAX_CONCURRENCY at once).
+        """
+        partial_sqls = [None] * len(sub_questions)
+        context.timings = {}
+        if not sub_questions:
+            return []
+        token_budget = TokenBudget()
+        start_time = time.time()
+
+        def generate(i: int) -> str:
+            sub_question = sub_questions[i]
+            with tracer.span(f"{self.tool_name} sub_question", attributes={
+                "sub_question.index": i + 1, "sub_question.depends_on": [d + 1 for d in sub_question["depends_on"]]
+            }):
+                sub_start_time = time.time()
+                # Only the partial SQL of the sub-questions it depends on
+                sql_context = " ".join(f"Q{d+1}: {sub_questions[d]['question']} SQL{d+1}: {partial_sqls[d]}" for d in sub_question["depends_on"])
+
+                prompt = token_budget.fit("generate_partial_sql", self.promptManager.create_prompt("generate_partial_sql"), examples, db_schema,
+                                          examples_variable="examples_str", schema_variable="db_schema",
+                                          user_question=user_question, index = str(i+1), sub_question= sub_question["question"], context = sql_context)
+
+                partial_sql = self.call_llm(prompt,"").strip()
+                context.timings[i] = {
+                    "start": round(sub_start_time - start_time, 2),
+                    "duration": round(time.time() - sub_start_time, 2),
+                }
+                return partial_sql
+
+        pending = set(range(len(sub_questions)))
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, SUB_QUESTION_MAX_CONCURRENCY), thread_name_prefix="sub-question") as executor:
+            while pending or running:
+                for i in sorted(pending):
+                    if all(partial_sqls[d] is not None for d in sub_questions[i]["depends_on"]):
+                        pending.discard(i)
+                        # In the context of the request: spans and model routes
+                        running[executor.submit(contextvars.copy_context().run, generate, i)] = i
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    partial_sqls[running.pop(future)] = future.result()
 
-  
-    def generate_partial_sql(self,examples, db_schema, user_question, sub_questions):
-        
-        partial_sqls = []
-        examples_str = Utils.get_example_str(examples)
         for i, sub_question in enumerate(sub_questions):
-            self.history[f"{i+1} Question "] = sub_question
-            context = " ".join(f"Q{i+1}: {sq} SQL{i+1}: {sql}" for i, (sq, sql) in enumerate(zip(sub_questions[:i], partial_sqls)))
-
-            prompt = self.promptManager.create_prompt("generate_partial_sql").format(db_schema=db_schema, user_question=user_question,index = str(i+1), sub_question= sub_question, context = context, example_str = examples_str)
-
-            response = self.call_llm(prompt,"")
-            partial_sql = response.strip()
-
-            self.history[f"Partial SQL {i+1}"] = partial_sql
-            partial_sqls.append(partial_sql)
+            context.history[f"{i+1} Question "] = sub_question["question"]
+            context.history[f"{i+1} Depends on"] = [d + 1 for d in sub_question["depends_on"]]
+            context.history[f"Partial SQL {i+1}"] = partial_sqls[i]
+            context.history[f"{i+1} Timing"] = context.timings.get(i)
+        context.history["Partial SQL generation time"] = round(time.time() - start_time, 2)
         return partial_sqls
 
     def assemble_final_query( self,examples, db_schema, user_question, sub_questions, partial_sqls):
-        examples_str = Utils.get_example_str(examples)
-
         sub_queries = ""
         for i, (sub_question, partial_sql) in enumerate(zip(sub_questions, partial_sqls)):
-            sub_queries += f"Sub-question {i+1}: {sub_question}\n"
+            sub_queries += f"Sub-question {i+1}: {sub_question['question']}\n"
             sub_queries += f"SQL {i+1}: {partial_sql}\n"
 
-        prompt = self.promptManager.create_prompt("assemble_final_query").format(db_schema=db_schema, examples=examples_str, user_question=user_question, sub_queries=sub_queries, rows_limit = ROWS_LIMIT)
+        prompt = TokenBudget().fit("assemble_final_query", self.promptManager.create_prompt("assemble_final_query"), examples, db_schema,
+                                   examples_variable="examples_str", schema_variable="db_schema",
+                                   user_question=user_question, subquestions_and_sqlquery=sub_queries, rows_limit = ROWS_LIMIT)
         response = self.call_llm(prompt,"")
         final_sql = response.strip()
         return final_sql
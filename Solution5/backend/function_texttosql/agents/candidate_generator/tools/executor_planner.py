@@ -1,23 +1,147 @@
+import hashlib
+import json
+import re
+
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
+from app.settings import (
+    ROWS_LIMIT,
+    PLAN_OPTIMIZATION_MIN_COST,
+    PLAN_OPTIMIZATION_MIN_GAIN,
+    PLAN_OPTIMIZATION_REWRITES,
+    PLAN_OPTIMIZATION_SAMPLE_ROWS,
+)
 from app.services.db_service import DBHelper
+from app.services.llm.token_budget import TokenBudget
+from app.services.sql_rewriter import SQLRewriter, SQLRewriteError
+from app.services.tracing import tracer
+
+_SQL_QUERY_PATTERN = re.compile(r"<sql_query>(.*?)</sql_query>", re.DOTALL)
 
 
+def _result_hash(rows: list, ordered: bool) -> str:
+    # Column names and values of the rows, in order only when the query sorts them
+    lines = [json.dumps([[str(column).lower(), str(value)] for column, value in row.items()]) for row in rows]
+    if not ordered:
+        lines.sort()
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
 
 class ExecutorPlanner(BaseTool[ConversationState]):
     """
-    Use Executor Planner to generate the sql query to answer the question.
+    Plan-cost-guided optimization of the SQL query, before it is executed: the LLM proposes rewrites from the
+    execution plan, a rewrite replaces the query only when its estimated cost is lower and it returns the same
+    first rows. The kept query is the only one executed in full, the original one runs on a sample at most.
     """
-   
-    def run(self, state: ConversationState) -> ConversationState:
-        database_name = state['database']
-        sql_query = state['sql_query']
-        db_schema = state['relevant_schema']
-        test = DBHelper.test(database_name, sql_query,db_schema)
-        
-        r1 = self.call_llm(test,"" )
-        self.logger.warning(f"Alternative Query: {r1}")
+    cache_llm_responses = True
+
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
+        if not state['sql_query'] or state.get("output") == "error":
+            self._reset(context)
+            context.selected = "skipped: no query"
+            return state
+        sql_query, rows = self.optimize(state, context, state['sql_query'])
+        if rows is None:
+            rows = DBHelper.executeSQLQuery(state['database'], sql_query)
+        state["sql_query"] = sql_query
+        state["query_result"] = rows
         return state
-    
-    def get_run_updates(self, state: ConversationState) -> dict:
-        return {"sql_query": state["sql_query"]}    
\ No newline at end of file
+
+    def optimize(self, state: ConversationState, context: ToolContext, sql_query: str):
+        """
+        The query to execute (the original one or its cheapest equivalent rewrite) and its rows, None when
+        they were not fetched while verifying the rewrites. Errors of the original query are raised.
+        """
+        database_name = state['database']
+        self._reset(context)
+        try:
+            plan_xml = DBHelper.get_execution_plan_xml(database_name, sql_query)
+            context.original_cost = DBHelper.parse_plan_cost(plan_xml) if plan_xml else None
+        except Exception as e:
+            # The execution reports the error, if any
+            context.selected = f"skipped: {str(e)}"
+            return sql_query, None
+        if context.original_cost is None or context.original_cost < PLAN_OPTIMIZATION_MIN_COST:
+            context.selected = f"skipped: estimated cost under {PLAN_OPTIMIZATION_MIN_COST}"
+            return sql_query, None
+
+        prompt = TokenBudget().fit("optimize_query", self.promptManager.create_prompt("optimize_query"), [],
+                                   state.get("relevant_tables") or {"schema": state['relevant_schema']},
+                                   schema_variable="db_schema", sql_query=sql_query, estimated_cost=context.original_cost,
+                                   execution_plan="\n".join(DBHelper.parse_showplan_xml(plan_xml)), rewrites=PLAN_OPTIMIZATION_REWRITES)
+        try:
+            answer = self.call_llm(prompt, "", temperature=0, max_tokens=1500)
+        except Exception as e:
+            context.selected = f"skipped: {str(e)}"
+            return sql_query, None
+        self.logger.warning(f"Alternative queries: {answer}")
+
+        cheaper = []
+        max_cost = context.original_cost * (1 - PLAN_OPTIMIZATION_MIN_GAIN)
+        for rewrite in [query.replace("```sql", "").replace("```", "").strip() for query in _SQL_QUERY_PATTERN.findall(answer)][:PLAN_OPTIMIZATION_REWRITES]:
+            entry = {"sql_query": rewrite, "estimated_cost": None}
+            context.rewrites.append(entry)
+            try:
+                entry["sql_query"] = SQLRewriter.rewrite(rewrite)
+                entry["estimated_cost"] = DBHelper.get_estimated_cost(database_name, entry["sql_query"])
+            except SQLRewriteError as e:
+                entry["status"] = f"refused: {str(e)}"
+                continue
+            except Exception as e:
+                entry["status"] = f"error: {str(e)}"
+                continue
+            if entry["estimated_cost"] is None or entry["estimated_cost"] > max_cost:
+                entry["status"] = "not cheaper"
+            else:
+                cheaper.append(entry)
+
+        # Cheapest first: the first one returning the same first rows as the original is kept
+        sample_rows = min(PLAN_OPTIMIZATION_SAMPLE_ROWS, int(ROWS_LIMIT))
+        ordered = SQLRewriter.is_ordered(sql_query)
+        original_hash = None
+        original_rows = None
+        for entry in sorted(cheaper, key=lambda entry: entry["estimated_cost"]):
+            if context.selected != "original":
+                entry["status"] = "not verified"
+                continue
+            try:
+                rows = DBHelper.executeSQLQuery(database_name, entry["sql_query"])
+            except Exception as e:
+                entry["status"] = f"error: {str(e)}"
+                continue
+            if original_hash is None:
+                original_rows = DBHelper.executeSQLQuery(database_name, SQLRewriter.rewrite(sql_query, rows_limit=sample_rows))
+                original_hash = _result_hash(original_rows, ordered)
+            if _result_hash(rows[:sample_rows], ordered) != original_hash:
+                entry["status"] = "different results"
+                continue
+            entry["status"] = "selected"
+            context.selected = entry["sql_query"]
+            context.rows = rows
+
+        tracer.set_attributes({
+            "plan.original_cost": context.original_cost,
+            "plan.rewrites": len(context.rewrites),
+            "plan.optimized": context.selected != "original",
+        })
+        if context.selected != "original":
+            return context.selected, context.rows
+        # A sample covering the rows limit is the whole result of the original query
+        return sql_query, original_rows if sample_rows == int(ROWS_LIMIT) else None
+
+    def _reset(self, context: ToolContext):
+        context.original_cost = None
+        context.rewrites = []
+        context.selected = "original"
+        context.rows = None
+
+    def report(self, context: ToolContext) -> dict:
+        """Costs, rewrites and selected query, for the execution history."""
+        return {
+            "Original estimated cost": context.original_cost,
+            "Rewrites": context.rewrites,
+            "Selected": context.selected,
+        }
+
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        return {"sql_query": state["sql_query"], **self.report(context)}
@@ -1,5 +1,5 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
 from app.services.db_service import DBHelper
 from function_texttosql.agents.candidate_generator.tools.utils import Utils
 from app.settings import ROWS_LIMIT
@@ -10,14 +10,13 @@ class GenerateSQLSimple(BaseTool[ConversationState]):
     """
     Easy way to generate SQL query to answer the question.
     """
-    sql_query = ""
-    chart_type = ""
-
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
 
         user_question = state["question"]
         relevant_schema = state["relevant_schema"] 
         examples = state["examples"]
+        context.sql_query = ""
+        context.chart_type = ""
 
         if(relevant_schema == None or relevant_schema == ""):
             state["command"] = "NO-SCHEMA"
@@ -30,11 +29,11 @@ class GenerateSQLSimple(BaseTool[ConversationState]):
 
             result = self.call_llm( system_prompt, user_question)
             
-            self.sql_query = self.extract_result(result,"sql_query")
-            self.chart_type = self.extract_result(result,"chart_type")
+            context.sql_query = self.extract_result(result,"sql_query")
+            context.chart_type = self.extract_result(result,"chart_type")
 
         return state
 
     
-    def get_run_updates(self, state: ConversationState) -> dict:
-        return {"Geneated Query": self.sql_query, "chart_type": self.chart_type}        
\ No newline at end of file
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        return {"Geneated Query": context.sql_query, "chart_type": context.chart_type}        
\ No newline at end of file
@@ -1,3 +1,4 @@
+from app.services.llm.token_budget import example_lines
 
 
 class Utils:
@@ -5,5 +6,5 @@ class Utils:
     
     @staticmethod
     def get_example_str(examples):
-        retval =  "\n".join(f"{example['question']}: {example['sql']}" for example in examples if isinstance(example, dict) and 'question' in example and 'sql' in example)
+        retval =  "\n".join(example_lines(examples))
         return retval
\ No newline at end of file
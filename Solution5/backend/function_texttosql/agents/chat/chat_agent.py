@@ -3,6 +3,8 @@ from function_texttosql.agents.conversation_state import ConversationState
 from function_texttosql.agents.core.agent import AgentBase
 from function_texttosql.agents.chat.tools.rewrite_question_tool import RewriteQuestion
 from function_texttosql.agents.chat.tools.context_selector import ContextSelector
+from function_texttosql.agents.information_retriever.tools.keywords_extraction_tool import KeywordsExtractionTool
+from function_texttosql.agents.information_retriever.speculative_prefetch import speculative_prefetch
 
 
 class ChatAgent(AgentBase[ConversationState]):
@@ -10,8 +12,26 @@ class ChatAgent(AgentBase[ConversationState]):
         name = "Chat Agent"  # Fixed name
         description = "Orchestrate the question from the user"  # Fixed description
         super().__init__(name, description)
-        self.register_tool("Rewrite Question", RewriteQuestion())
-        self.register_tool("Context Selector", ContextSelector())
+        # Independent: the context is selected on the question as asked, while it is being rewritten
+        self.register_tool("Rewrite Question", RewriteQuestion(), depends_on=[])
+        self.register_tool("Context Selector", ContextSelector(), depends_on=[])
+        self.keywords_tool = KeywordsExtractionTool()
+
+    def run_before(self, state: ConversationState) -> ConversationState:
+        # Start the retrieval on the question as asked, the Information Retriever reuses it if the question is kept
+        speculative_prefetch.start(state, keywords=self.keywords_tool.extract_keywords)
+        return state
+
+    def run_after(self, state: ConversationState) -> ConversationState:
+        if state["command"] == "CLARIFY":
+            # The question needs to be clarified, whatever its context: the graph stops here
+            state["context"] = "CLARIFY"
+        if state["context"] not in ("BUSINESS", "IT-ENGINEER"):
+            # No retrieval on this route
+            speculative_prefetch.discard(state["request_id"])
+        self.emit_event(state, "context", {"context": state["context"]})
+        self.emit_event(state, "question", {"question": state["question"]})
+        return state
 
     def get_run_updates(self, state: ConversationState) -> dict:
         
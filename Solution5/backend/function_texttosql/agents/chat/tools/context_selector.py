@@ -1,5 +1,5 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
 
 
 
@@ -7,8 +7,9 @@ class ContextSelector(BaseTool[ConversationState]):
     """
     Identifies the context for the question: BUSINESS / IT-ENGINEER / OTHER
     """
+    cache_llm_responses = True
    
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
 
         try:
             system_prompt = self.promptManager.create_prompt("system_context_selector").format()
@@ -25,6 +26,21 @@ class ContextSelector(BaseTool[ConversationState]):
         
         return state
 
+    async def arun(self, state: ConversationState, context: ToolContext) -> ConversationState:
+
+        try:
+            system_prompt = self.promptManager.create_prompt("system_context_selector").format()
+            response = await self.acall_llm(system_prompt, state["question"])
+            state["context"] = self.extract_result(response, "context")
+
+        except Exception as e:
+            self.logger.error(f"Error in ContextSelector: {e}")
+            state["context"] = "ERROR"
+            state["answer"] = ""
+            raise e
+
+        return state
+
     
-    def get_run_updates(self, state: ConversationState) -> dict:
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
         return {"context": state["context"]}
@@ -1,5 +1,6 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
+from function_texttosql.agents.information_retriever.speculative_prefetch import speculative_prefetch
 
 
 class RewriteQuestion(BaseTool[ConversationState]):
@@ -7,40 +8,22 @@ class RewriteQuestion(BaseTool[ConversationState]):
     Rewrites the question to be more specific and understandable for the system.
     It can also ask for clarification if the question is too vague or unsupported.
     """
-    chat_response = ""
+    cache_llm_responses = True
 
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
 
+        context.chat_response = ""
         try:
 
             user_question = state["question"]
             prompt_message = self.promptManager.create_prompt("chat_agent").format()
-            self.chat_response = self.call_llm(  prompt_message, user_question)
-            final_question = self.extract_result(self.chat_response,"question")
-            clarification = ""
-           
-            if not final_question:
-                clarification = self.extract_result(self.chat_response,"clarify")
-
+            context.chat_response = self.call_llm(  prompt_message, user_question)
+            final_question = self._apply_answer(state, context)
             if( final_question ):
-                state["question"] = final_question
-                state["answer"] = str("Question not supported.")
-                state["proceed"] = True
                 # TODO: can be moved on the tool that check for schema
-                state["question_embedding"] = self.get_embedding(final_question)
-            
-            elif (clarification):
-                # The system is asking more info to clarify the question
-                state["answer"] = str(clarification)
-                state["proceed"] = False
-                state["command"] = str("CLARIFY")
-            
-            else:
-                # The system is asking more info to clarify the question
-                state["answer"] = str(self.chat_response)
-                state["proceed"] = False
-                state["command"] = str("CLARIFY")
-
+                # Already computed by the prefetch when the question was not rewritten
+                embedding = speculative_prefetch.take(state, "question_embedding")
+                state["question_embedding"] = embedding if embedding is not None else self.get_embedding(final_question)
 
         except Exception as e:
             self.logger.error(f"Error in RewriteQuestion: {e}")
@@ -50,6 +33,51 @@ class RewriteQuestion(BaseTool[ConversationState]):
         
         return state
 
+    async def arun(self, state: ConversationState, context: ToolContext) -> ConversationState:
+
+        context.chat_response = ""
+        try:
+            prompt_message = self.promptManager.create_prompt("chat_agent").format()
+            context.chat_response = await self.acall_llm(prompt_message, state["question"])
+            final_question = self._apply_answer(state, context)
+            if final_question:
+                embedding = await speculative_prefetch.atake(state, "question_embedding")
+                state["question_embedding"] = embedding if embedding is not None else await self.aget_embedding(final_question)
+
+        except Exception as e:
+            self.logger.error(f"Error in RewriteQuestion: {e}")
+            state["command"] = "ERROR"
+            state["answer"] = str(e)
+            raise e
+
+        return state
+
+    def _apply_answer(self, state: ConversationState, context: ToolContext) -> str:
+        # Update the state from the chat answer, returns the rewritten question ("" when clarification is needed)
+        final_question = self.extract_result(context.chat_response,"question")
+        clarification = ""
+       
+        if not final_question:
+            clarification = self.extract_result(context.chat_response,"clarify")
+
+        if( final_question ):
+            state["question"] = final_question
+            state["answer"] = str("Question not supported.")
+            state["proceed"] = True
+        
+        elif (clarification):
+            # The system is asking more info to clarify the question
+            state["answer"] = str(clarification)
+            state["proceed"] = False
+            state["command"] = str("CLARIFY")
+        
+        else:
+            # The system is asking more info to clarify the question
+            state["answer"] = str(context.chat_response)
+            state["proceed"] = False
+            state["command"] = str("CLARIFY")
+        return final_question
+
     
-    def get_run_updates(self, state: ConversationState) -> dict:
-        return {"Chat answer": self.chat_response, "question": state["question"]}
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        return {"Chat answer": context.chat_response, "question": state["question"]}
@@ -10,6 +10,7 @@ class  ConversationState(SystemState):
     
     database: str = "" # The database name
     user_session: str = "" # The user session ID
+    request_id: str = "" # Unique ID of the current request (not stored with the session)
     chart_type: str = "" # The type of chart to be generated (e.g., bar, line, pie)
     history: List[HumanMessage] = [] # Main the conversation history
     sql_query: str = "" # The SQL query generated by the system
@@ -17,6 +18,7 @@ class  ConversationState(SystemState):
     question_embedding: list = []
     table_embedding: dict = {} # Dict[str,Dict[str, Dict[str, str]]]  # database, trable , fields
     relevant_schema: str = "" # The relevant schema for the question
+    relevant_tables: dict = {} # table -> schema of the relevant tables, by decreasing similarity
     query_result: List = [] # The result of the SQL query
     examples: List = [] # List of examples for few-shot learning
     answer:str = "" # The final answer generated by the system
@@ -26,6 +28,9 @@ class  ConversationState(SystemState):
     keywords: list[str] = [] # Keywords extracted from the question
     context: str = ""
     reasoning: str = "" # Reasoning behind the SQL query generation
+    model_routes: dict = {} # Per request overrides of the model routing: tool or prompt name -> deployment
+    follow_up: bool = False # The question follows up on the previous turn (see FollowUpDetector)
+    last_turn: dict = {} # Question, tables and examples of the previous turn, reused by the follow-up questions
     
 
     @staticmethod
@@ -45,6 +50,7 @@ class  ConversationState(SystemState):
         state["execution_history"] = []
         state["context"] = ""
         state["reasoning"] = ""
+        state["follow_up"] = False
     
 
         return state
@@ -62,8 +68,10 @@ class  ConversationState(SystemState):
             "chart_type": "",
             "database": "",
             "user_session": "",
+            "request_id": "",
             "table_embedding": {},
             "relevant_schema": "",
+            "relevant_tables": {},
             "question": "",
             "question_embedding": [],
             "examples": [],
@@ -81,7 +89,10 @@ class  ConversationState(SystemState):
             "mermaid":"",
             "keywords":[],
             "context": "",
-            "reasoning": ""
+            "reasoning": "",
+            "model_routes": {},
+            "follow_up": False,
+            "last_turn": {}
 
         }
         
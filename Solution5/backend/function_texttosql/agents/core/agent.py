@@ -1,20 +1,27 @@
 from abc import ABC, abstractmethod
 from app.services.llm.openai_service import OpenAIService
 from app.services.llm.prompt_menager import PromptManager
+from app.services.llm.model_router import model_router
+from app.services.llm.endpoint_pool import endpoint_pool
+from app.services.tracing import tracer
 from typing import Generic
+from collections import deque
+import asyncio
+import contextvars
 import time
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, tool_executor, run_in_executor
 from function_texttosql.agents.core.system_state import T
+from function_texttosql.agents.core.event_stream import EventStream
 from app.utils.nb_logger import NBLogger
 
 
-
 class AgentBase(ABC, Generic[T]):
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
         self.tools = {}  # list of tools this agent can use
-        self.history = []  # store (role, message) tuples for this agent if needed
+        self.tool_dependencies = {}  # tool name -> names of the tools that must complete before it
+        self.history = deque(maxlen=100)  # last (role, message) tuples of this agent, for debugging (shared by the requests)
         self.logger = NBLogger().Log()
         self.promptManager = PromptManager()
 
@@ -23,21 +30,58 @@ class AgentBase(ABC, Generic[T]):
         # Track conversation or reasoning history (not always needed for single-shot prompts, but useful for debugging)
         self.history.append((role, message))
 
-    def register_tool(self, tool_name, tool: BaseTool):
-        # Register a tool that this agent can use
+    def register_tool(self, tool_name, tool: BaseTool, depends_on: list = None):
+        # Register a tool that this agent can use.
+        # depends_on: tools that must complete before this one. None means all the tools registered so far
+        # (sequential execution), an empty list means the tool is independent and can run in parallel.
         self.logger.info(f"Registering tool: {tool_name}")
+        if depends_on is None:
+            depends_on = list(self.tools.keys())
+        for dependency in depends_on:
+            if dependency not in self.tools:
+                raise ValueError(f"Tool '{tool_name}' depends on '{dependency}', which has to be registered before.")
         self.tools[tool_name] = tool
+        self.tool_dependencies[tool_name] = list(depends_on)
         self.logger.info(f"Registering tool: {tool_name} -- DONE")
 
+    def get_tool_waves(self) -> list:
+        # Group the tools in waves: every tool of a wave only depends on tools of the previous waves.
+        levels = {}
+        waves = []
+        for tool_name in self.tools:
+            level = max((levels[dependency] + 1 for dependency in self.tool_dependencies[tool_name]), default=0)
+            levels[tool_name] = level
+            if level == len(waves):
+                waves.append([])
+            waves[level].append(tool_name)
+        return waves
+
     # Common
-    def call_llm(self, system_prompt: str, user_prompt: str, temperature=0.7, max_tokens=512) -> str:
+    def call_llm(self, system_prompt: str, user_prompt: str, temperature=0.7, max_tokens=512, route: str = None) -> str:
         answer = OpenAIService.chat(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
+            model=model_router.resolve(route, self.name),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            cache_tag=route or self.name
+        )
+        return answer
+
+    # Common
+    async def acall_llm(self, system_prompt: str, user_prompt: str, temperature=0.7, max_tokens=512, route: str = None) -> str:
+        # Same as call_llm, without blocking the event loop while waiting for the LLM
+        answer = await OpenAIService.achat(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            model=model_router.resolve(route, self.name),
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            cache_tag=route or self.name
         )
         return answer
 
@@ -47,11 +91,14 @@ class AgentBase(ABC, Generic[T]):
         embedding = OpenAIService.get_embedding(text)
         return embedding
 
-    
-    def call_tool(self, tool_name: str, state: T) -> T:
-
-        self.logger.info(f"Calling tool: {tool_name}")
+    # Common
+    async def aget_embedding(self, text:str) -> list:
+        # Same as get_embedding, without blocking the event loop
+        embedding = await OpenAIService.aembed(text)
+        return embedding
 
+    
+    def _get_tool(self, tool_name: str) -> BaseTool:
         if tool_name not in self.tools:
             self.logger.error(f"Tool '{tool_name}' not found.")
             raise ValueError(f"Tool '{tool_name}' not found.")
@@ -61,20 +108,116 @@ class AgentBase(ABC, Generic[T]):
         if not isinstance(tool, BaseTool):
             self.logger.error(f"Tool '{tool_name}' is not of type BaseTool.")
             raise TypeError(f"Tool '{tool_name}' is not of type BaseTool.")
-        else:
-            try:
-                state = tool.run_tool(state)
-            except Exception as e:
-                error_msg = f"{type(e).__name__}: {e}"
-                
-                state["errors"][tool_name] = error_msg
-                status = {"status": "error", "error": error_msg}
-                self.logger.error(f"Error in tool {tool_name}: {e}", exc_info=True)
-                raise Exception(f"Error in tool {tool_name}: {e}")
-            
+        return tool
+
+    def _tool_failed(self, tool_name: str, state: T, e: Exception) -> Exception:
+        error_msg = f"{type(e).__name__}: {e}"
+        state["errors"][tool_name] = error_msg
+        self.logger.error(f"Error in tool {tool_name}: {e}", exc_info=True)
+        return Exception(f"Error in tool {tool_name}: {e}")
+
+    def call_tool(self, tool_name: str, state: T) -> T:
+
+        self.logger.info(f"Calling tool: {tool_name}")
+        tool = self._get_tool(tool_name)
+        try:
+            state = tool.run_tool(state)
+        except Exception as e:
+            raise self._tool_failed(tool_name, state, e)
         
         return state
+
+    async def acall_tool(self, tool_name: str, state: T) -> T:
+        # Same as call_tool, the synchronous tools run on the tool executor
+        self.logger.info(f"Calling tool: {tool_name}")
+        tool = self._get_tool(tool_name)
+        try:
+            state = await tool.arun_tool(state)
+        except Exception as e:
+            raise self._tool_failed(tool_name, state, e)
+
+        return state
     
+    # Common
+    def call_llm_stream(self, system_prompt: str, user_prompt: str, on_token, temperature=0.7, max_tokens=512, route: str = None) -> str:
+        # Same as call_llm, but on_token is called with every piece of the answer as soon as the LLM produces it
+        tokens = []
+        for token in OpenAIService.chat_stream(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            model=model_router.resolve(route, self.name),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            route=route or self.name
+        ):
+            tokens.append(token)
+            on_token(token)
+        return "".join(tokens).strip()
+
+    # Common
+    def emit_event(self, state: T, event: str, data: dict):
+        # Notify the client streaming this run (if any) about the progress
+        EventStream.emit(state.get("request_id", ""), event, data)
+
+    def _tool_state(self, state: T) -> T:
+        # Copy of the state given to a tool running in parallel with others
+        tool_state = dict(state)
+        tool_state["execution_history"] = []
+        tool_state["errors"] = {}
+        return tool_state
+
+    def call_tools_parallel(self, tool_names: list, state: T) -> T:
+        # Run independent tools concurrently, each one on its own copy of the state,
+        # then merge back the keys they changed (in registration order).
+        def run(tool_name: str) -> T:
+            return self.call_tool(tool_name, self._tool_state(state))
+
+        # Each tool runs in the context of the request (model routes)
+        futures = [tool_executor.submit(contextvars.copy_context().run, run, tool_name) for tool_name in tool_names]
+        results = []
+        error = None
+        for tool_name, future in zip(tool_names, futures):
+            try:
+                results.append((tool_name, future.result()))
+            except Exception as e:
+                error = error or e
+        return self._merge_tool_states(state, results, error)
+
+    async def acall_tools_parallel(self, tool_names: list, state: T) -> T:
+        # Same as call_tools_parallel, the tools are awaited together on the event loop
+        outcomes = await asyncio.gather(
+            *(self.acall_tool(tool_name, self._tool_state(state)) for tool_name in tool_names),
+            return_exceptions=True
+        )
+        results = []
+        error = None
+        for tool_name, outcome in zip(tool_names, outcomes):
+            if isinstance(outcome, BaseException):
+                error = error or outcome
+            else:
+                results.append((tool_name, outcome))
+        return self._merge_tool_states(state, results, error)
+
+    def _merge_tool_states(self, state: T, results: list, error: Exception = None) -> T:
+        changed_by = {}
+        for tool_name, tool_state in results:
+            for key, value in tool_state.items():
+                if key in ("execution_history", "errors"):
+                    continue
+                if key not in state or value is not state[key]:
+                    if key in changed_by:
+                        self.logger.warning(f"Tools {changed_by[key]} and {tool_name} both updated '{key}', keeping {tool_name}.")
+                    changed_by[key] = tool_name
+                    state[key] = value
+            state["execution_history"].extend(tool_state["execution_history"])
+            state["errors"].update(tool_state["errors"])
+
+        if error is not None:
+            raise error
+        return state
+
     # Common
     def extract_result(self, answer : str, tag : str) -> str:
         return answer.split("<{tag}}>")[1].split("</{tag}}>")[0].strip()
@@ -106,42 +249,122 @@ class AgentBase(ABC, Generic[T]):
         # Primary method to execute the agent's logic. To be implemented by subclasses
         return state
 
+    async def arun_before(self, state: T) -> T:
+        # Awaitable run_before: override in agents with async steps, by default run_before runs on the tool executor
+        if type(self).run_before is AgentBase.run_before:
+            return state
+        return await run_in_executor(self.run_before, state)
+
+    async def arun_after(self, state: T) -> T:
+        # Awaitable run_after: override in agents with async steps, by default run_after runs on the tool executor
+        if type(self).run_after is AgentBase.run_after:
+            return state
+        return await run_in_executor(self.run_after, state)
+
     def __call__(self, state: T) -> T:
-        return self.run(state)
+        with model_router.request_routes(state.get("model_routes")), tracer.span(f"agent {self.name}") as span:
+            state = self.run(state)
+            self._end_span(span, state)
+            return state
+
+    async def acall(self, state: T) -> T:
+        # Graph node of the async graph execution (compiled_graph.ainvoke)
+        with model_router.request_routes(state.get("model_routes")), tracer.span(f"agent {self.name}") as span:
+            if type(self).run is not AgentBase.run:
+                # Agents with their own synchronous run
+                state = await run_in_executor(self.run, state)
+            else:
+                state = await self.arun(state)
+            self._end_span(span, state)
+            return state
+
+    def _end_span(self, span, state: T):
+        # run catches the errors of the workflow and records them in the state
+        span.set_attributes({"agent.command": state.get("command"), "agent.context": state.get("context")})
+        if state.get("errors", {}).get(self.name):
+            span.set_status("ERROR", state["errors"][self.name])
 
     def run(self, state:T) -> T:
         #self.logger.info(f"---START: {self.name}---")
         state["execution_history"].append({"agent_name": f"{self.name}-----------------"})
         start_time = time.time()
-        try:
-            status = {"executed_at": time.strftime("%Y.%m.%d: %H.%M.%S")}
-            state = self.run_before(state)
-            #self.logger.info(f"run-before called")
-
-            for tool_name, tool in self.tools.items():
-                self.logger.info(f"Running tool: {tool_name}")
-                self.add_history("agent", f"Calling tool: {tool_name}")
-
-                state = self.call_tool(tool_name, state)
-                if(state["proceed"] == False):
-                    self.logger.info(f"Tool {tool_name} indicated not to proceed.")
-                    break
+        # Endpoints serving the LLM calls of the agent itself (its tools report their own)
+        with endpoint_pool.track() as served_by:
+            try:
+                status = {"executed_at": time.strftime("%Y.%m.%d: %H.%M.%S")}
+                state = self.run_before(state)
+                #self.logger.info(f"run-before called")
+
+                for wave in self.get_tool_waves():
+                    self.logger.info(f"Running tools: {wave}")
+                    for tool_name in wave:
+                        self.add_history("agent", f"Calling tool: {tool_name}")
+
+                    if len(wave) == 1:
+                        state = self.call_tool(wave[0], state)
+                    else:
+                        state = self.call_tools_parallel(wave, state)
+                    if(state["proceed"] == False):
+                        self.logger.info(f"Tools {wave} indicated not to proceed.")
+                        break
                     
-            state = self.run_after(state)
-            status["status"] = "success"
+                state = self.run_after(state)
+                status["status"] = "success"
             
             
-        except Exception as e:
-            error_msg = f"Error in agent workflow: {type(e).__name__}: {e}"
+            except Exception as e:
+                error_msg = f"Error in agent workflow: {type(e).__name__}: {e}"
              
-            state["errors"][self.name] = error_msg
-            status = {"status": "error", "error": error_msg}
+                state["errors"][self.name] = error_msg
+                status = {"status": "error", "error": error_msg}
             
-            self.logger.info(f"Error: {error_msg}")
-            self.add_history("error", error_msg)
+                self.logger.info(f"Error: {error_msg}")
+                self.add_history("error", error_msg)
 
+        if served_by:
+            status["served_by"] = sorted(set(served_by))
         status["execution_time"] = round(time.time() - start_time, 1)    
         self.log_update(state, status)
         
         return state
 
+    async def arun(self, state: T) -> T:
+        # Same as run without blocking the event loop: waits on the LLM and the database of many conversations overlap
+        state["execution_history"].append({"agent_name": f"{self.name}-----------------"})
+        start_time = time.time()
+        with endpoint_pool.track() as served_by:
+            try:
+                status = {"executed_at": time.strftime("%Y.%m.%d: %H.%M.%S")}
+                state = await self.arun_before(state)
+
+                for wave in self.get_tool_waves():
+                    self.logger.info(f"Running tools: {wave}")
+                    for tool_name in wave:
+                        self.add_history("agent", f"Calling tool: {tool_name}")
+
+                    if len(wave) == 1:
+                        state = await self.acall_tool(wave[0], state)
+                    else:
+                        state = await self.acall_tools_parallel(wave, state)
+                    if(state["proceed"] == False):
+                        self.logger.info(f"Tools {wave} indicated not to proceed.")
+                        break
+
+                state = await self.arun_after(state)
+                status["status"] = "success"
+
+            except Exception as e:
+                error_msg = f"Error in agent workflow: {type(e).__name__}: {e}"
+
+                state["errors"][self.name] = error_msg
+                status = {"status": "error", "error": error_msg}
+
+                self.logger.info(f"Error: {error_msg}")
+                self.add_history("error", error_msg)
+
+        if served_by:
+            status["served_by"] = sorted(set(served_by))
+        status["execution_time"] = round(time.time() - start_time, 1)
+        self.log_update(state, status)
+
+        return state
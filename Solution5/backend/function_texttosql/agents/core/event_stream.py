@@ -0,0 +1,42 @@
+import threading
+from typing import Callable
+
+from app.utils.nb_logger import NBLogger
+
+logger = NBLogger().Log()
+
+
+class EventStream:
+    """
+    Listeners of the progress of a graph run, per request (request_id of the conversation state):
+    concurrent requests of the same user session each get their own events.
+    Agents and tools emit events (context, question, tables, sql, rows, answer tokens ...)
+    that are forwarded to the client while the graph is still running.
+    """
+    _listeners = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def subscribe(cls, request_id: str, listener: Callable[[str, dict], None]):
+        with cls._lock:
+            cls._listeners[request_id] = listener
+
+    @classmethod
+    def unsubscribe(cls, request_id: str):
+        with cls._lock:
+            cls._listeners.pop(request_id, None)
+
+    @classmethod
+    def is_streaming(cls, request_id: str) -> bool:
+        return request_id in cls._listeners
+
+    @classmethod
+    def emit(cls, request_id: str, event: str, data: dict):
+        listener = cls._listeners.get(request_id)
+        if listener is None:
+            return
+        try:
+            listener(event, data)
+        except Exception as e:
+            # A broken listener must never break the graph run
+            logger.warning(f"Error emitting event {event}: {e}")
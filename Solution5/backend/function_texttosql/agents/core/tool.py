@@ -1,17 +1,53 @@
 from abc import ABC, abstractmethod
+import asyncio
+import contextvars
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Generic
 
 from app.services.llm.openai_service import OpenAIService
 from app.services.llm.prompt_menager import PromptManager
+from app.services.llm.model_router import model_router
+from app.services.llm.endpoint_pool import endpoint_pool
+from app.services.tracing import tracer
 from function_texttosql.agents.core.system_state import T
+from function_texttosql.agents.core.event_stream import EventStream
 from app.utils.nb_logger import NBLogger
+from app.settings import AGENT_TOOL_MAX_WORKERS
 
 
+# Bounded pool shared by all the requests: runs the synchronous tools (and agent steps) off the event loop,
+# and the independent tools of the synchronous agents concurrently
+tool_executor = ThreadPoolExecutor(max_workers=AGENT_TOOL_MAX_WORKERS, thread_name_prefix="agent-tool")
+
+
+async def run_in_executor(func, *args):
+    # Run a blocking function on the tool executor, in the context of the request (model routes, endpoints tracking)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(tool_executor, contextvars.copy_context().run, func, *args)
+
+
+class ToolContext:
+    """
+    Request scoped execution context of a tool: a new one is created for every run of the tool.
+    Tools keep their intermediate results here, never on the instance or the class, which are shared
+    by all the requests running the compiled graph.
+    """
+
+    def __init__(self, tool_name: str, user_session: str = ""):
+        self.tool_name = tool_name
+        self.user_session = user_session
+
+    def get(self, name: str, default=None):
+        return getattr(self, name, default)
 
 
 class BaseTool(ABC, Generic[T]):
+    # Set to True in tools whose prompts only depend on their inputs, so their LLM answers can be
+    # served from the response cache (None: only temperature 0 calls are cached)
+    cache_llm_responses = None
+
     def __init__(self, name = "", description = ""):
         # Set a consistent tool name by converting the class name to snake_case.
         self.logger = NBLogger().Log()
@@ -24,39 +60,119 @@ class BaseTool(ABC, Generic[T]):
     def __call__(self, state: T) -> T:
         return self.run_tool(state)
 
-    def run_tool(self, state: T) -> T:
+    def run_tool(self, state: T, context: ToolContext = None) -> T:
         
+        if context is None:
+            context = ToolContext(self.tool_name, state.get("user_session", ""))
         #self.logger.info(f"---START: {self.tool_name}---")
         start_time = time.time()
         #state.executing_tool = self.tool_name
         
-        try:
-            # Execute the tool's main functionality.
-            status = {"executed_at": time.strftime("%Y.%m.%d: %H.%M.%S")}
-            state = self.run(state)
-            status["status"] = "success"
-        except Exception as err:
-            error_msg = f"{type(err).__name__}: {err}"
-            self.logger.error(f"Tool '{self.tool_name}' encountered an error:\n{error_msg}")
-            state["errors"][self.tool_name] = error_msg
-            status = {"status": "error", "error": error_msg}
+        with tracer.span(f"tool {self.tool_name}"), endpoint_pool.track() as served_by:
+            try:
+                # Execute the tool's main functionality.
+                status = {"executed_at": time.strftime("%Y.%m.%d: %H.%M.%S")}
+                state = self.run(state, context)
+                status["status"] = "success"
+            except Exception as err:
+                status = self._error_status(state, err)
+
+        return self._finish(state, status, context, served_by, start_time)
+
+    async def arun_tool(self, state: T, context: ToolContext = None) -> T:
+        # Same as run_tool without blocking the event loop: tools implementing arun are awaited,
+        # the synchronous ones run on the bounded tool executor.
+        if not self.is_async():
+            return await run_in_executor(self.run_tool, state, context)
+
+        if context is None:
+            context = ToolContext(self.tool_name, state.get("user_session", ""))
+        start_time = time.time()
+
+        with tracer.span(f"tool {self.tool_name}"), endpoint_pool.track() as served_by:
+            try:
+                status = {"executed_at": time.strftime("%Y.%m.%d: %H.%M.%S")}
+                state = await self.arun(state, context)
+                status["status"] = "success"
+            except Exception as err:
+                status = self._error_status(state, err)
+
+        return self._finish(state, status, context, served_by, start_time)
+
+    def is_async(self) -> bool:
+        # True when the tool has its own awaitable implementation
+        return type(self).arun is not BaseTool.arun
+
+    def _error_status(self, state: T, err: Exception) -> dict:
+        error_msg = f"{type(err).__name__}: {err}"
+        tracer.record_error(err)
+        self.logger.error(f"Tool '{self.tool_name}' encountered an error:\n{error_msg}")
+        state["errors"][self.tool_name] = error_msg
+        return {"status": "error", "error": error_msg}
+
+    def _finish(self, state: T, status: dict, context: ToolContext, served_by: list, start_time: float) -> T:
+        if served_by:
+            # Azure OpenAI endpoints that served the LLM calls of the tool
+            status["served_by"] = sorted(set(served_by))
         
         status["execution_time"] = round(time.time() - start_time, 1)
-        self.log_update(state, status)
+        self.log_update(state, status, context)
         self.logger.info(f"---END: {self.tool_name} in {status['execution_time']} seconds---")
         return state
 
-    def call_llm(self, system_prompt: str, user_prompt: str, temperature=0.7, max_tokens=512) -> str:
+    def call_llm(self, system_prompt: str, user_prompt: str, temperature=0.7, max_tokens=512, route: str = None) -> str:
         answer = OpenAIService.chat(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
+            model=model_router.resolve(route, self.tool_name),
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            cache=self.cache_llm_responses,
+            cache_tag=route or self.tool_name
         )
         return answer
     
+    # Common
+    async def acall_llm(self, system_prompt: str, user_prompt: str, temperature=0.7, max_tokens=512, route: str = None) -> str:
+        # Same as call_llm, without blocking the event loop while waiting for the LLM
+        answer = await OpenAIService.achat(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            model=model_router.resolve(route, self.tool_name),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            cache=self.cache_llm_responses,
+            cache_tag=route or self.tool_name
+        )
+        return answer
+
+    # Common
+    def call_llm_stream(self, system_prompt: str, user_prompt: str, on_token, temperature=0.7, max_tokens=512, route: str = None) -> str:
+        # Same as call_llm, but on_token is called with every piece of the answer as soon as the LLM produces it
+        tokens = []
+        for token in OpenAIService.chat_stream(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            model=model_router.resolve(route, self.tool_name),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            route=route or self.tool_name
+        ):
+            tokens.append(token)
+            on_token(token)
+        return "".join(tokens).strip()
+
+    # Common
+    def emit_event(self, state: T, event: str, data: dict):
+        # Notify the client streaming this run (if any) about the progress
+        EventStream.emit(state.get("request_id", ""), event, data)
+
     # Common
     def extract_result(self,answer : str, tag : str) -> str:
 
@@ -78,11 +194,17 @@ class BaseTool(ABC, Generic[T]):
         embedding = OpenAIService.get_embedding(text)
         return embedding
 
-    def log_update(self, state: T, status: dict):
+    # Common
+    async def aget_embedding(self, text:str) -> list:
+        # Same as get_embedding, without blocking the event loop
+        embedding = await OpenAIService.aembed(text)
+        return embedding
+
+    def log_update(self, state: T, status: dict, context: ToolContext):
         # Prepare a log entry containing tool name and execution status.
         run_log = {"tool_name": self.tool_name}
         if status["status"] == "success":
-            run_log.update(self.get_run_updates(state))
+            run_log.update(self.get_run_updates(state, context))
         run_log.update(status)
 
         if "execution_history" not in state:
@@ -93,14 +215,23 @@ class BaseTool(ABC, Generic[T]):
         #self.logger.info(f"Execution History : {ex_history}")
 
     @abstractmethod
-    def run(self, state: T) -> T:
+    def run(self, state: T, context: ToolContext) -> T:
         """
         The core functionality of the tool. Subclasses must implement this method.
-        It should process the given SystemState and update it accordingly.        """
+        It should process the given SystemState and update it accordingly.
+        Per request data must be kept in the context, the tool instance is shared by the concurrent requests.
+        """
         pass
     
+    async def arun(self, state: T, context: ToolContext) -> T:
+        """
+        Awaitable version of run, for the tools waiting on LLM or embedding calls (acall_llm, aget_embedding).
+        Optional: the tools not implementing it are run on the tool executor.
+        """
+        raise NotImplementedError
+
     @abstractmethod
-    def get_run_updates(self, state: T) -> T:
+    def get_run_updates(self, state: T, context: ToolContext) -> dict:
         pass
 
     def _camel_to_snake(self, name: str) -> str:
@@ -1,5 +1,5 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
 from app.services.db_service import DBHelper
 
 
@@ -9,7 +9,7 @@ class DatabaseDiagramRetiever(BaseTool[ConversationState]):
     Use Executor Planner to generate the sql query to answer the question.
     """
    
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
         
         db_schema = state['relevant_schema']
         user_question = state["question"]
@@ -29,5 +29,5 @@ class DatabaseDiagramRetiever(BaseTool[ConversationState]):
         
         return state
     
-    def get_run_updates(self, state: ConversationState) -> dict:
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
         return {"sql_query": state["sql_query"]}    
\ No newline at end of file
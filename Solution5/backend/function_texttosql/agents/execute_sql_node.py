@@ -1,5 +1,6 @@
 from function_texttosql.agents.conversation_state import ConversationState
 from app.services.db_service import DBHelper
+from app.services.sql_rewriter import SQLRewriter
 from app.utils.nb_logger import NBLogger
 
 logger = NBLogger().Log()
@@ -19,6 +20,8 @@ def execute_sql_node(state: ConversationState) -> ConversationState:
             state["error"] = "SQL query is empty."
             logger.error("SQL query is empty.")
             return state
+        sql_query = SQLRewriter.rewrite(sql_query)
+        state["sql_query"] = sql_query
         results = DBHelper().executeSQLQuery(database= database, sql_query=sql_query)
         
     except Exception as e:
@@ -0,0 +1,82 @@
+import threading
+
+from app.settings import FOLLOW_UP_ENABLED, FOLLOW_UP_MIN_SIMILARITY, FOLLOW_UP_TABLE_MIN_SIMILARITY
+from app.services.tracing import tracer
+import app.services.schema_service as schemaService
+from app.utils.nb_logger import NBLogger
+
+logger = NBLogger().Log()
+
+
+class FollowUpDetector:
+    """
+    Follow-up questions of a conversation (drill-downs on the previous answer): the question is close to the
+    previous one, or to one of the tables selected for it. The Information Retriever then reuses the few-shot
+    examples of the previous turn instead of searching them, and the Schema Selector starts from its tables.
+    The previous turn is kept in the session, state["last_turn"].
+    """
+
+    def __init__(self, min_similarity: float = FOLLOW_UP_MIN_SIMILARITY, table_min_similarity: float = FOLLOW_UP_TABLE_MIN_SIMILARITY):
+        self.min_similarity = min_similarity
+        self.table_min_similarity = table_min_similarity
+        self._metrics = {"follow_up": 0, "new_question": 0}
+        self._lock = threading.Lock()
+
+    def detect(self, state: dict) -> bool:
+        """
+        True when the question of the state follows up on the previous turn of the session.
+        """
+        last_turn = state.get("last_turn") or {}
+        if not FOLLOW_UP_ENABLED or not last_turn or not state.get("question_embedding"):
+            return False
+
+        database = state["database"]
+        # Tables selected on another database or on a schema that changed since are not reused
+        if last_turn.get("database") != database or last_turn.get("schema_version") != schemaService.get_schema_version(database):
+            return self._count(False, 0.0)
+
+        similarity = schemaService.cosine_similarity(last_turn["question_embedding"], state["question_embedding"])
+        follow_up = similarity >= self.min_similarity or self._close_to_tables(state, last_turn)
+        logger.info(f"Follow-up: {follow_up}, similarity with the previous question {similarity:.3f}")
+        return self._count(follow_up, similarity)
+
+    def _close_to_tables(self, state: dict, last_turn: dict) -> bool:
+        # Schema embeddings are cached by the process once loaded
+        table_embedding = schemaService.initialize_schema_embeddings(state["database"])
+        return any(
+            schemaService.cosine_similarity(state["question_embedding"], table_embedding[table]["embedding"]) >= self.table_min_similarity
+            for table in last_turn.get("relevant_tables", {}) if table in table_embedding
+        )
+
+    def remember(self, state: dict):
+        """
+        Keep the tables and examples selected for the question of the state, for the next turn.
+        """
+        if not FOLLOW_UP_ENABLED or not state.get("relevant_tables") or not state.get("question_embedding"):
+            return
+        database = state["database"]
+        state["last_turn"] = {
+            "database": database,
+            "schema_version": schemaService.get_schema_version(database),
+            "question": state["question"],
+            # Rounded: stored with the session, the similarity does not need more precision
+            "question_embedding": [round(value, 5) for value in state["question_embedding"]],
+            "relevant_tables": dict(state["relevant_tables"]),
+            "examples": [
+                {"question": example["question"], "sql": example["sql"]}
+                for example in state.get("examples", []) if isinstance(example, dict) and "question" in example and "sql" in example
+            ],
+        }
+
+    def _count(self, follow_up: bool, similarity: float) -> bool:
+        with self._lock:
+            self._metrics["follow_up" if follow_up else "new_question"] += 1
+        tracer.set_attributes({"follow_up": follow_up, "follow_up.similarity": round(similarity, 3)})
+        return follow_up
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self._metrics)
+
+
+follow_up_detector = FollowUpDetector()
@@ -2,6 +2,7 @@ from function_texttosql.agents.conversation_state import ConversationState
 from function_texttosql.agents.core.agent import AgentBase
 from function_texttosql.agents.information_retriever.tools.questions_sql_example_tool import QuestionAndSQLExamplesTool
 from function_texttosql.agents.information_retriever.tools.keywords_extraction_tool import KeywordsExtractionTool
+from function_texttosql.agents.information_retriever.follow_up import follow_up_detector
 
 
 
@@ -10,8 +11,14 @@ class InformationRetrieverAgent(AgentBase[ConversationState]):
         name = "Information Retriever Agent"  # Fixed name
         description = "Retrieve information for text to sql agent"  # Fixed description
         super().__init__(name, description)
-        self.register_tool("Information Retriever", QuestionAndSQLExamplesTool())
-        self.register_tool("Keywords Extraction", KeywordsExtractionTool())
+        # Independent: the examples search and the keywords extraction run in parallel
+        self.register_tool("Information Retriever", QuestionAndSQLExamplesTool(), depends_on=[])
+        self.register_tool("Keywords Extraction", KeywordsExtractionTool(), depends_on=[])
+
+    def run_before(self, state: ConversationState) -> ConversationState:
+        # Follow-ups reuse the examples and tables of the previous turn
+        state["follow_up"] = follow_up_detector.detect(state)
+        return state
 
     def get_run_updates(self, state: ConversationState) -> dict:
         
@@ -0,0 +1,166 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future
+
+from app.settings import SPECULATIVE_PREFETCH_ENABLED, SPECULATIVE_PREFETCH_MIN_SIMILARITY
+from app.services.llm.openai_service import OpenAIService
+from app.services.search_service import SearchService
+from app.services.tracing import tracer
+import app.services.schema_service as schemaService
+from function_texttosql.agents.core.tool import tool_executor
+from app.utils.nb_logger import NBLogger
+
+logger = NBLogger().Log()
+
+# Requests with prefetched results kept at most (the oldest are dropped, e.g. when a request failed before completing)
+_MAX_PENDING = 1000
+
+
+class SpeculativePrefetch:
+    """
+    Retrieval started on the question as asked, while the Chat Agent classifies and rewrites it:
+    question embedding, few-shot examples, schema embeddings and the stages given to start (e.g. keywords).
+    The tools take the results instead of computing them again, as long as the rewritten question is close enough
+    to the original one. They are dropped when the graph stops after the Chat Agent (OTHER / CLARIFY ...).
+    """
+
+    def __init__(self, min_similarity: float = SPECULATIVE_PREFETCH_MIN_SIMILARITY):
+        self.min_similarity = min_similarity
+        self._pending = {}  # request id -> {"question", "futures", "similar"}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _submit(self, func, *args) -> Future:
+        # Run in the context of the request: model routes, and the spans become children of the Chat Agent one
+        return tool_executor.submit(contextvars.copy_context().run, func, *args)
+
+    def _find_examples(self, database: str, embedding: Future) -> list:
+        # The embedding was submitted first, so it is already running (or done) when this waits for it
+        return SearchService.find_relevant_examples(database, embedding.result())
+
+    def start(self, state: dict, **stages):
+        """
+        Start the retrieval for the question of the state. stages: name -> function of the question.
+        """
+        request_id = state.get("request_id")
+        if not SPECULATIVE_PREFETCH_ENABLED or not request_id:
+            return
+
+        question = state["question"]
+        database = state["database"]
+        embedding = self._submit(OpenAIService.get_embedding, question)
+        futures = {
+            "question_embedding": embedding,
+            "examples": self._submit(self._find_examples, database, embedding),
+        }
+        if database not in (state.get("table_embedding") or {}):
+            futures["table_embedding"] = self._submit(schemaService.initialize_schema_embeddings, database)
+        for name, func in stages.items():
+            futures[name] = self._submit(func, question)
+
+        with self._lock:
+            previous = self._pending.pop(request_id, None)
+            self._pending[request_id] = {"question": question, "futures": futures, "similar": None}
+            while len(self._pending) > _MAX_PENDING:
+                self._cancel(self._pending.pop(next(iter(self._pending))))
+        if previous is not None:
+            self._cancel(previous)
+
+    def take(self, state: dict, name: str):
+        """
+        Prefetched result of the stage for the question of the state, None when it was not prefetched,
+        it failed, or the question was rewritten into a different one.
+        """
+        entry = self._entry(state, name)
+        if entry is None or not self._question_matches(state, entry, name):
+            return None
+        return self._result(entry, name)
+
+    async def atake(self, state: dict, name: str):
+        """
+        Same as take, for the tools running on the event loop: the prefetched results still running
+        (or queued on the tool executor) are awaited instead of blocking the loop.
+        """
+        entry = self._entry(state, name)
+        if entry is None:
+            return None
+        if self._needs_similarity(state, entry, name):
+            await self._wait(entry["futures"]["question_embedding"])
+        if not self._question_matches(state, entry, name):
+            return None
+        await self._wait(entry["futures"][name])
+        return self._result(entry, name)
+
+    async def _wait(self, future: Future):
+        # asyncio.wait does not raise the error (or cancellation) of the prefetch, _result reports it
+        await asyncio.wait([asyncio.wrap_future(future)])
+
+    def _entry(self, state: dict, name: str):
+        with self._lock:
+            entry = self._pending.get(state.get("request_id"))
+        return entry if entry is not None and name in entry["futures"] else None
+
+    def _question_matches(self, state: dict, entry: dict, name: str) -> bool:
+        # The schema embeddings do not depend on the question
+        if name == "table_embedding" or self._same_question(state, entry, name):
+            return True
+        self._count(name, "discarded")
+        tracer.set_attributes({f"prefetch.{name}": "discarded"})
+        return False
+
+    def _result(self, entry: dict, name: str):
+        try:
+            retval = entry["futures"][name].result()
+        except Exception as e:
+            logger.warning(f"Prefetch of {name} failed: {e}")
+            self._count(name, "failed")
+            return None
+        self._count(name, "reused")
+        tracer.set_attributes({f"prefetch.{name}": "reused"})
+        return retval
+
+    def _needs_similarity(self, state: dict, entry: dict, name: str) -> bool:
+        # True when the similarity of the rewritten question has to be computed from the prefetched embedding
+        return (name not in ("table_embedding", "question_embedding") and state["question"] != entry["question"]
+                and bool(state.get("question_embedding")) and entry["similar"] is None)
+
+    def _same_question(self, state: dict, entry: dict, name: str) -> bool:
+        if state["question"] == entry["question"]:
+            return True
+        # The embedding of the rewritten question is only set once the question is rewritten
+        if name == "question_embedding" or not state.get("question_embedding"):
+            return False
+        if entry["similar"] is None:
+            try:
+                similarity = schemaService.cosine_similarity(entry["futures"]["question_embedding"].result(), state["question_embedding"])
+            except Exception:
+                similarity = 0.0
+            entry["similar"] = similarity >= self.min_similarity
+            logger.info(f"Prefetch: similarity of the rewritten question {similarity:.3f}")
+        return entry["similar"]
+
+    def discard(self, request_id: str):
+        """
+        Drop the prefetched results of the request (the stages not started yet are cancelled).
+        """
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+        if entry is not None:
+            self._cancel(entry)
+
+    def _cancel(self, entry: dict):
+        for future in entry["futures"].values():
+            future.cancel()
+
+    def _count(self, name: str, outcome: str):
+        with self._lock:
+            metrics = self._metrics.setdefault(name, {"reused": 0, "discarded": 0, "failed": 0})
+            metrics[outcome] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {name: dict(metrics) for name, metrics in self._metrics.items()}
+
+
+speculative_prefetch = SpeculativePrefetch()
@@ -1,5 +1,5 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
 from app.services.db_service import DBHelper
 
 import re
@@ -11,7 +11,7 @@ class DBValueSearchTool(BaseTool[ConversationState]):
         super().__init__("DBValueSearcher", "Searches the DB for occurrences of given keywords as values")
        
        
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
         results = []
 
         keywords = state["keywords"]
@@ -1,28 +1,57 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
+from function_texttosql.agents.information_retriever.speculative_prefetch import speculative_prefetch
 import re
 
 
 
 class KeywordsExtractionTool(BaseTool[ConversationState]):
+    cache_llm_responses = True
+
     def __init__(self):
         super().__init__("KeywordExtractor", "Extracts primary keywords from the question")
 
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
+
+        # Extracted while the question was being rewritten
+        keywords = speculative_prefetch.take(state, "keywords")
+        context.prefetched = keywords is not None
+        if keywords is None:
+            keywords = self.extract_keywords(state["question"])
+        return self._set_keywords(state, context, keywords)
 
-        question = state["question"]
+    async def arun(self, state: ConversationState, context: ToolContext) -> ConversationState:
+        keywords = await speculative_prefetch.atake(state, "keywords")
+        context.prefetched = keywords is not None
+        if keywords is None:
+            keywords = await self.aextract_keywords(state["question"])
+        return self._set_keywords(state, context, keywords)
+
+    def extract_keywords(self, question: str) -> list:
         # Use a few-shot prompt to get keywords (simple approach: ask for nouns/entities)
-        prompt = f"Extract the main nouns or proper nouns and key phrases from the question:\n\"{question}\".\nList them comma-separated."
         # We can call the LLM directly here if we have access to call_llm, or use openai API directly.
         # For simplicity, let's use a direct OpenAI call:
-        keywords_text = self.call_llm(prompt,"",0.3,50) 
+        keywords_text = self.call_llm(self._prompt(question),"",0.3,50) 
+        return self._parse(keywords_text)
+
+    async def aextract_keywords(self, question: str) -> list:
+        keywords_text = await self.acall_llm(self._prompt(question), "", 0.3, 50)
+        return self._parse(keywords_text)
+
+    def _prompt(self, question: str) -> str:
+        return f"Extract the main nouns or proper nouns and key phrases from the question:\n\"{question}\".\nList them comma-separated."
+
+    def _parse(self, keywords_text: str) -> list:
         self.logger.warning(f"Keywords extracted: {keywords_text}")
         # Split by comma or newline to get keywords
-        self.keywords = re.split(r',|\n', keywords_text)
-        self.keywords = [kw.strip() for kw in self.keywords if kw.strip()]
-        state["keywords"] = self.keywords  # Store keywords in state for later use
+        keywords = re.split(r',|\n', keywords_text)
+        return [kw.strip() for kw in keywords if kw.strip()]
+
+    def _set_keywords(self, state: ConversationState, context: ToolContext, keywords: list) -> ConversationState:
+        context.keywords = keywords
+        state["keywords"] = context.keywords  # Store keywords in state for later use
         return state
 
-    def get_run_updates(self, state: ConversationState) -> dict:
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
         # Placeholder implementation
-        return {"keywords": self.keywords}  # Return the extracted keywords as updates  
\ No newline at end of file
+        return {"keywords": context.keywords, "prefetched": context.prefetched}  # Return the extracted keywords as updates  
\ No newline at end of file
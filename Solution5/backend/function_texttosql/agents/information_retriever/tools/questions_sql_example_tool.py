@@ -1,20 +1,31 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
 from app.services.search_service import SearchService
+from function_texttosql.agents.information_retriever.speculative_prefetch import speculative_prefetch
 
 
 class QuestionAndSQLExamplesTool(BaseTool[ConversationState]):
 
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
         """
         Run the tool to get SQL examples.
         """
         database = state["database"]
         question_embedding = state["question_embedding"]
-        retval = SearchService.find_relevant_examples(database,question_embedding)
+        context.prefetched = False
+        context.reused = state.get("follow_up", False)
+        if context.reused:
+            # Follow-up question: the examples selected for the previous turn still apply
+            state["examples"] = list(state["last_turn"]["examples"])
+            return state
+
+        # Searched while the question was being rewritten
+        retval = speculative_prefetch.take(state, "examples")
+        context.prefetched = retval is not None
+        if retval is None:
+            retval = SearchService.find_relevant_examples(database,question_embedding)
         state["examples"] = retval
         return state
 
-    def get_run_updates(self, state: ConversationState) -> dict:
-        # Placeholder implementation
-        return {}
\ No newline at end of file
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        return {"prefetched": context.prefetched, "reused from previous question": context.reused}
\ No newline at end of file
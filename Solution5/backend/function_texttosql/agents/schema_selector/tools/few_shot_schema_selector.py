@@ -1,11 +1,13 @@
 from function_texttosql.agents.conversation_state import ConversationState
-from function_texttosql.agents.core.tool import BaseTool
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
 import app.services.schema_service as schemaService 
+from function_texttosql.agents.information_retriever.speculative_prefetch import speculative_prefetch
+from function_texttosql.agents.information_retriever.follow_up import follow_up_detector
 
 
 class FewShotSchemaSelector(BaseTool[ConversationState]):
 
-    def run(self, state: ConversationState) -> ConversationState:
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
         """
         Run the tool to get SQL examples.
         """
@@ -15,7 +17,10 @@ class FewShotSchemaSelector(BaseTool[ConversationState]):
         if not table_embedding:
             state["table_embedding"] = {}
         if database not in table_embedding:
-            result = schemaService.initialize_schema_embeddings(database)
+            # Loaded while the question was being rewritten
+            result = speculative_prefetch.take(state, "table_embedding")
+            if result is None:
+                result = schemaService.initialize_schema_embeddings(database)
             if(result != {}):
                 # it can be empty also for a network connetion not able to retrive the schema of the database
                 state["table_embedding"][database] = result
@@ -24,6 +29,17 @@ class FewShotSchemaSelector(BaseTool[ConversationState]):
         # 1. Retrieve relevant schema based on question and related schema
         relevant_schema = schemaService.get_relevant_schema(database,state["question_embedding"], state["table_embedding"][database])
 
+        context.extended_tables = []
+        if state.get("follow_up"):
+            # Follow-up question: keep the tables of the previous turn, extended with the ones relevant to this question.
+            # Its examples were already filtered on them
+            previous_tables = state["last_turn"]["relevant_tables"]
+            context.extended_tables = [table for table in relevant_schema if table not in previous_tables]
+            for table, table_schema in previous_tables.items():
+                if table not in relevant_schema:
+                    relevant_schema[table] = [table_schema]
+            return self._set_schema(state, relevant_schema, state["examples"])
+
         # 2. Retrieve relevant schema based on sql examples and related schema
         examples = state["examples"]
         filtered_examples = []
@@ -51,17 +67,24 @@ class FewShotSchemaSelector(BaseTool[ConversationState]):
                                 relevant_schema[table] = lines.copy()
                 # 3. If no, then skip that example
                 
+        return self._set_schema(state, relevant_schema, filtered_examples)
+
+    def _set_schema(self, state: ConversationState, relevant_schema: dict, examples: list) -> ConversationState:
         # Store filtered examples back in state
-        state["examples"] = filtered_examples
-        relevant_schema_str = "\n".join([f"{', '.join(lines)}" for table, lines in relevant_schema.items()])
+        state["examples"] = examples
+        relevant_tables = {table: ', '.join(lines) for table, lines in relevant_schema.items()}
+        relevant_schema_str = "\n".join(relevant_tables.values())
 
         state["relevant_schema"] = relevant_schema_str
+        state["relevant_tables"] = relevant_tables
+        self.emit_event(state, "tables", {"tables": list(relevant_schema.keys())})
 
 
         
 
         if relevant_schema_str:
             state["command"] = "CONTINUE"
+            follow_up_detector.remember(state)
         else:
             state["answer"] = str("Not data available to answer the question.")
             state["command"] = "NO-SCHEMA"
@@ -69,6 +92,7 @@ class FewShotSchemaSelector(BaseTool[ConversationState]):
 
         return state
 
-    def get_run_updates(self, state: ConversationState) -> dict:
-        # Placeholder implementation
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        if state.get("follow_up"):
+            return {"follow-up": "Yes", "tables added": context.extended_tables}
         return {}
\ No newline at end of file
@@ -0,0 +1,15 @@
+from function_texttosql.agents.conversation_state import ConversationState
+from function_texttosql.agents.core.agent import AgentBase
+from function_texttosql.agents.semantic_cache.tools.semantic_cache_lookup_tool import SemanticCacheLookupTool
+
+
+class SemanticCacheAgent(AgentBase[ConversationState]):
+    def __init__(self):
+        name = "Semantic Cache Agent"  # Fixed name
+        description = "Reuse the SQL of an almost identical question already answered"  # Fixed description
+        super().__init__(name, description)
+        self.register_tool("Semantic Cache Lookup", SemanticCacheLookupTool())
+
+    def get_run_updates(self, state: ConversationState) -> dict:
+        
+        return {}
@@ -0,0 +1,56 @@
+from function_texttosql.agents.conversation_state import ConversationState
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
+from app.services.db_service import DBHelper
+from app.services.semantic_sql_cache import semantic_sql_cache
+from app.settings import SEMANTIC_CACHE_ENABLED
+import app.services.schema_service as schemaService
+
+
+class SemanticCacheLookupTool(BaseTool[ConversationState]):
+    """
+    Looks for a previously answered question close enough to the (rewritten) question.
+    On a hit the cached SQL is executed directly, skipping schema selection and candidate generation.
+    """
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
+
+        state["command"] = "CACHE-MISS"
+        context.cache_status = "miss"
+        context.cached_entry = None
+
+        database = state["database"]
+        question_embedding = state["question_embedding"]
+        if not SEMANTIC_CACHE_ENABLED or not question_embedding:
+            context.cache_status = "disabled"
+            return state
+
+        schema_version = schemaService.get_schema_version(database)
+        entry = semantic_sql_cache.lookup(database, schema_version, question_embedding)
+        if entry is None:
+            return state
+
+        try:
+            results = DBHelper.executeSQLQuery(database, entry["sql"])
+        except Exception as e:
+            # The cached SQL is not valid anymore: drop it and let the pipeline generate a new one
+            self.logger.warning(f"Cached SQL failed, removing it from the semantic cache: {e}")
+            semantic_sql_cache.remove(database, entry["sql"])
+            context.cache_status = "stale"
+            return state
+
+        context.cache_status = "hit"
+        context.cached_entry = entry
+        state["query_result"] = results
+        state["sql_query"] = entry["sql"]
+        state["chart_type"] = "bar"
+        state["reasoning"] = f"Reused the SQL of the similar question: {entry['question']}"
+        state["command"] = "CACHE-HIT"
+        self.emit_event(state, "sql", {"sql_query": entry["sql"]})
+        self.emit_event(state, "rows", {"rows": results})
+        return state
+
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        updates = {"semantic cache": context.cache_status}
+        if context.cached_entry:
+            updates["cached question"] = context.cached_entry["question"]
+            updates["similarity"] = context.cached_entry["similarity"]
+        return updates
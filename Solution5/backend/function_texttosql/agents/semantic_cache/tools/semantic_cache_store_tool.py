@@ -0,0 +1,23 @@
+from function_texttosql.agents.conversation_state import ConversationState
+from function_texttosql.agents.core.tool import BaseTool, ToolContext
+from app.services.semantic_sql_cache import semantic_sql_cache
+from app.settings import SEMANTIC_CACHE_ENABLED
+import app.services.schema_service as schemaService
+
+
+class SemanticCacheStoreTool(BaseTool[ConversationState]):
+    """
+    Stores the SQL that successfully answered the question, so similar questions can reuse it.
+    """
+    def run(self, state: ConversationState, context: ToolContext) -> ConversationState:
+
+        context.stored = False
+        database = state["database"]
+        if SEMANTIC_CACHE_ENABLED and state["sql_query"] and state["question_embedding"]:
+            schema_version = schemaService.get_schema_version(database)
+            semantic_sql_cache.add(database, schema_version, state["question"], state["question_embedding"], state["sql_query"])
+            context.stored = True
+        return state
+
+    def get_run_updates(self, state: ConversationState, context: ToolContext) -> dict:
+        return {"stored in semantic cache": "Yes" if context.stored else "No"}
@@ -1,12 +1,16 @@
 
+import asyncio
+import uuid
 from langchain.schema import HumanMessage
-from typing import Dict
+from typing import AsyncIterator, Dict, Tuple
 from langgraph.graph import StateGraph, END
+from langchain_core.runnables import RunnableLambda
 
 from app.utils.nb_logger import NBLogger
 
 
 from function_texttosql.agents.conversation_state import ConversationState #, initialize_conversation_state
+from function_texttosql.agents.core.event_stream import EventStream
 
 from function_texttosql.agents.fake.fake_agent import FakeAgent
 from function_texttosql.agents.execute_sql_node import execute_sql_node 
@@ -17,16 +21,18 @@ from function_texttosql.agents.chat.chat_agent import ChatAgent
 from function_texttosql.agents.architecure_assistant.architecure_assistant import ArchitectureAssistantAgent
 from function_texttosql.agents.information_retriever.information_retriever import InformationRetrieverAgent
 from function_texttosql.agents.database_assistant.database_assistant_agent import DatabaseAssitantAgent
+from function_texttosql.agents.semantic_cache.semantic_cache_agent import SemanticCacheAgent
 
 from app.settings import DATABASE_NAME
 
 
 from app.services.db_service import DBHelper
+from app.services.session_store import session_store
+from app.services.tracing import tracer
+from function_texttosql.agents.information_retriever.speculative_prefetch import speculative_prefetch
 
 
 logger = NBLogger().Log()
-# In-memory storage for conversation contexts (could use persistent storage for long-term memory)
-user_sessions: Dict[str, "ConversationState"] = {}  
 
 graph = StateGraph(ConversationState)
 
@@ -40,18 +46,24 @@ GENERATE_FINAL_ANSWER_NODE_STR = "Generate Final Answer"
 CANDIDATE_GENERATOR_AGENT_STR = "Candidate Generator Agent"
 ARCHITECTURE_ASSISTANT = "Architecture Assistant"
 DATABASE_ASSISTANT_AGENT = "Database Assistant"
+SEMANTIC_CACHE_AGENT = "Semantic Cache Agent"
 
 
-graph.add_node(CHAT_AGENT, ChatAgent() )
-graph.add_node(CANDIDATE_GENERATOR_AGENT_STR, CandidateGeneratorAgent())
-graph.add_node(ARCHITECTURE_ASSISTANT, ArchitectureAssistantAgent())
-graph.add_node(SCHEMA_SELECTOR_AGENT_STR, SchemaSelectorAgent())
-graph.add_node(INFORMATION_RETREIVER_AGENT, InformationRetrieverAgent() )
-#graph.add_node(EXECUTE_SQL_NODE_STR, execute_sql_node)
-graph.add_node(VALIDATE_RESULT_NODE_STR, FakeAgent())
-graph.add_node(GENERATE_FINAL_ANSWER_NODE_STR, AnswerGeneratorAgent())
-graph.add_node(DATABASE_ASSISTANT_AGENT, DatabaseAssitantAgent())
+def agent_node(agent) -> RunnableLambda:
+    # invoke runs the agent synchronously, ainvoke awaits its async run (see AgentBase.acall)
+    return RunnableLambda(agent, afunc=agent.acall, name=agent.name)
+
 
+graph.add_node(CHAT_AGENT, agent_node(ChatAgent()))
+graph.add_node(CANDIDATE_GENERATOR_AGENT_STR, agent_node(CandidateGeneratorAgent()))
+graph.add_node(ARCHITECTURE_ASSISTANT, agent_node(ArchitectureAssistantAgent()))
+graph.add_node(SCHEMA_SELECTOR_AGENT_STR, agent_node(SchemaSelectorAgent()))
+graph.add_node(INFORMATION_RETREIVER_AGENT, agent_node(InformationRetrieverAgent()))
+#graph.add_node(EXECUTE_SQL_NODE_STR, execute_sql_node)
+graph.add_node(VALIDATE_RESULT_NODE_STR, agent_node(FakeAgent()))
+graph.add_node(GENERATE_FINAL_ANSWER_NODE_STR, agent_node(AnswerGeneratorAgent()))
+graph.add_node(DATABASE_ASSISTANT_AGENT, agent_node(DatabaseAssitantAgent()))
+graph.add_node(SEMANTIC_CACHE_AGENT, agent_node(SemanticCacheAgent()))
 
 def route_by_state(state: ConversationState) -> str:
     return state["result"]
@@ -60,7 +72,7 @@ def route_by_state(state: ConversationState) -> str:
 # -------------------------------------------
 graph.add_conditional_edges(CHAT_AGENT, lambda state: state["context"],
     {
-        "BUSINESS": INFORMATION_RETREIVER_AGENT, 
+        "BUSINESS": SEMANTIC_CACHE_AGENT, 
         "DIAGRAM": ARCHITECTURE_ASSISTANT,
         "IT-ENGINEER": INFORMATION_RETREIVER_AGENT,
         "OTHER":END,
@@ -70,6 +82,14 @@ graph.add_conditional_edges(CHAT_AGENT, lambda state: state["context"],
 
 graph.add_edge(ARCHITECTURE_ASSISTANT, END)
 
+# On a cache hit the cached SQL was already executed: go straight to the answer
+graph.add_conditional_edges(SEMANTIC_CACHE_AGENT, lambda state: "CACHE-HIT" if state["command"] == "CACHE-HIT" else "CACHE-MISS",
+    {
+        "CACHE-HIT": GENERATE_FINAL_ANSWER_NODE_STR,
+        "CACHE-MISS": INFORMATION_RETREIVER_AGENT,
+    }
+)
+
 graph.add_edge(INFORMATION_RETREIVER_AGENT, SCHEMA_SELECTOR_AGENT_STR)
 
 graph.add_conditional_edges(SCHEMA_SELECTOR_AGENT_STR, lambda state: (state["context"].strip().upper() + "_" + state["command"].strip().upper()),
@@ -117,18 +137,16 @@ def get_graph_png() -> bytes:
 
 
 
-# Define the state for LangGraph
-async def nl_to_sql(user_input: str, session_id: str, user_id: str, database: str = "default") -> Dict[str, str]:
+def _prepare_state(user_input: str, session_id: str, user_id: str, database: str, model_routes: dict = None) -> ConversationState:
     """
-        Orchestrate the entire NL-to-SQL workflow
+        Retrieve the conversation state of the user session and set it up for the new question
     """
     user_session = user_id + "-" + session_id
 
-    if user_session not in user_sessions:
-        user_sessions[user_session] = ConversationState.initialize()
-
     # Retrieve the user conversation state
-    state = user_sessions[user_session]
+    state = session_store.get(user_session)
+    if state is None:
+        state = ConversationState.initialize()
     state = ConversationState.cleanOnNewQuestion(state)
 
     # Append new questions
@@ -147,16 +165,21 @@ async def nl_to_sql(user_input: str, session_id: str, user_id: str, database: st
 
 
     state["user_session"] = user_session
+    state["request_id"] = uuid.uuid4().hex
+    state["model_routes"] = model_routes or {}
+    return state
 
-    # Execute the flow
-    state = compiled_graph.invoke(state)
+
+def _complete(state: ConversationState) -> Dict[str, str]:
+    """
+        Store the state of the executed flow in the user session and build the response
+    """
+    # Prefetched retrieval not used by this request
+    speculative_prefetch.discard(state["request_id"])
 
     # Append the execution history to chat history: execution history is reset on each request , chat history is kept
     state["chat_history"].append(state["execution_history"])
 
-    # Set the the user session wit the new state value
-    user_sessions[user_session] = state
-
     retval = {
         "answer":state["answer"],
         "sql_query": state["sql_query"],
@@ -166,6 +189,66 @@ async def nl_to_sql(user_input: str, session_id: str, user_id: str, database: st
         "mermaid": state["mermaid"],
         "reasoning": state["reasoning"]
         }
-    
+
+    # Store the compacted state in the user session (the response keeps the full execution history)
+    session_store.save(state["user_session"], state)
     
     return retval
+
+
+# Define the state for LangGraph
+async def nl_to_sql(user_input: str, session_id: str, user_id: str, database: str = "default", model_routes: dict = None) -> Dict[str, str]:
+    """
+        Orchestrate the entire NL-to-SQL workflow
+    """
+    with tracer.span("nl_to_sql", "server") as span:
+        # Session store and database lookups are blocking: keep them off the event loop
+        state = await asyncio.to_thread(_prepare_state, user_input, session_id, user_id, database, model_routes)
+        span.set_attributes({"session.id": state["user_session"], "db.name": state["database"]})
+
+        # The agents await the LLM calls and run the blocking tools on the bounded tool executor:
+        # the event loop keeps serving the other conversations meanwhile
+        state = await compiled_graph.ainvoke(state)
+
+        retval = await asyncio.to_thread(_complete, state)
+        retval["trace_id"] = span.trace_id
+        return retval
+
+
+async def nl_to_sql_stream(user_input: str, session_id: str, user_id: str, database: str = "default", model_routes: dict = None) -> AsyncIterator[Tuple[str, dict]]:
+    """
+        Same workflow as nl_to_sql, yielding (event, data) tuples as the agents make progress.
+        The last event is "result", with the same content returned by nl_to_sql.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    state = await asyncio.to_thread(_prepare_state, user_input, session_id, user_id, database, model_routes)
+    user_session = state["user_session"]
+    request_id = state["request_id"]
+
+    def listener(event: str, data: dict):
+        # Called from the event loop or from the tool executor threads
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    async def run_graph() -> Dict[str, str]:
+        try:
+            with tracer.span("nl_to_sql_stream", "server", {"session.id": user_session, "db.name": state["database"]}) as span:
+                retval = await asyncio.to_thread(_complete, await compiled_graph.ainvoke(state))
+                retval["trace_id"] = span.trace_id
+                return retval
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    EventStream.subscribe(request_id, listener)
+    try:
+        task = asyncio.ensure_future(run_graph())
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+        yield "result", await task
+    finally:
+        EventStream.unsubscribe(request_id)
@@ -8,5 +8,10 @@
 Examples:
 {examples}
 
+Write one sub-question per line, numbered, followed by the numbers of the earlier sub-questions whose SQL it needs
+(none when it can be answered on its own), e.g.:
+1. Which customers placed an order in 2024? [depends on: none]
+2. What is the total amount per region? [depends on: none]
+3. What is the total amount per region of those customers? [depends on: 1, 2]
 
-Sub-questions:
\ No newline at end of file
+Sub-questions:
@@ -0,0 +1,16 @@
+Given the database schema:
+{db_schema}
+
+The following SQL query answers the user question:
+{sql_query}
+
+Its estimated cost is {estimated_cost}. The execution plan was as follows:
+{execution_plan}
+
+Write up to {rewrites} alternative SQL queries returning exactly the same rows and columns (same column names and order,
+same ORDER BY) with a cheaper execution plan: e.g. sargable predicates, EXISTS instead of IN or DISTINCT joins,
+aggregating before joining, removing redundant joins, sorts and subqueries.
+Only read the data: a single SELECT statement per query, no temporary tables, no query hints.
+Do not include any additional explanation or commentary.
+
+Provide each query inside its own <sql_query> tags.
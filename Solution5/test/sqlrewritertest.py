@@ -0,0 +1,38 @@
+from app.services.sql_rewriter import SQLRewriter, SQLRewriteError
+
+# Generated query -> query expected after the rewrite (rows limit 100, T-SQL)
+cases = {
+    "SELECT a FROM t": "SELECT TOP 100 a FROM t",
+    "SELECT TOP 10 a FROM t": "SELECT TOP 10 a FROM t",
+    "SELECT TOP 1000 a FROM t ORDER BY a": "SELECT TOP 100 a FROM t ORDER BY a",
+    # UNIONs are wrapped in a derived table: its columns must be named (Msg 8155) and unique (Msg 8156)
+    "SELECT COUNT(*) FROM t UNION ALL SELECT COUNT(*) FROM u":
+        "SELECT TOP 100 * FROM (SELECT COUNT(*) AS column1 FROM t UNION ALL SELECT COUNT(*) FROM u) AS _l_0",
+    "SELECT t.a, u.a FROM t JOIN u ON t.id = u.id UNION SELECT b, c FROM v":
+        "SELECT TOP 100 * FROM (SELECT t.a, u.a AS a_2 FROM t JOIN u ON t.id = u.id UNION SELECT b, c FROM v) AS _l_0",
+    "SELECT a, 1 AS column2, 2 FROM t UNION SELECT b, 1, 2 FROM u":
+        "SELECT TOP 100 * FROM (SELECT a, 1 AS column2, 2 AS column3 FROM t UNION SELECT b, 1, 2 FROM u) AS _l_0",
+    # Sorted UNIONs are paged in place
+    "SELECT a FROM t UNION SELECT b FROM u ORDER BY a":
+        "SELECT a FROM t UNION SELECT b FROM u ORDER BY a OFFSET 0 ROWS FETCH NEXT 100 ROWS ONLY",
+    "SELECT a FROM t UNION SELECT b FROM u ORDER BY a OFFSET 10 ROWS":
+        "SELECT a FROM t UNION SELECT b FROM u ORDER BY a OFFSET 10 ROWS FETCH NEXT 100 ROWS ONLY",
+}
+
+failures = 0
+for sql_query, expected in cases.items():
+    rewritten = SQLRewriter.rewrite(sql_query, rows_limit=100, dialect="tsql")
+    if rewritten != expected:
+        failures += 1
+        print(f"FAILED: {sql_query}\n  expected: {expected}\n  got:      {rewritten}")
+
+for sql_query in ("DELETE FROM t", "SELECT a FROM t; SELECT b FROM u", "SELECT a INTO t2 FROM t"):
+    try:
+        SQLRewriter.rewrite(sql_query, rows_limit=100, dialect="tsql")
+        failures += 1
+        print(f"FAILED: {sql_query} not refused")
+    except SQLRewriteError:
+        pass
+
+if failures == 0:
+    print("SQL rewriter checks passed.")